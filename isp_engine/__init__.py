@@ -0,0 +1,109 @@
+"""
+Headless ISP plan engine: catalog, pricing, demand estimation, scoring and narration.
+
+Importing the package has no side effects and loads nothing heavy. Public
+names resolve from their submodule on first access (PEP 562), so
+`from isp_engine import rank_plans` never pulls in streamlit, anthropic or numpy.
+"""
+import importlib
+from typing import Any, List
+
+_EXPORTS = {
+    # catalog
+    "Plan": "catalog",
+    "PLAN_CATALOG": "catalog",
+    "MESH_GUIDE": "catalog",
+    "INTERNET_STANDALONE_BRACKETS": "catalog",
+    "BUNDLE_MOBILE_PER_LINE": "catalog",
+    "BUNDLE_TV_BASE_PRICE": "catalog",
+    "BUNDLE_TV_ADDON_PRICES": "catalog",
+    "BUNDLE_DVR_PRICE": "catalog",
+    "TV_BASE_PRICE": "catalog",
+    "TV_ADDON_PRICES": "catalog",
+    "DVR_PRICE": "catalog",
+    "catalog_hash": "catalog",
+    "TV_PACKS": "catalog",
+    "TV_PACK_BIT": "catalog",
+    "CatalogSnapshot": "catalog",
+    "CatalogError": "catalog",
+    "load_catalog": "catalog",
+    "current_catalog": "catalog",
+    "pin_catalog": "catalog",
+    # pricing
+    "internet_standalone_price": "pricing",
+    "mobile_alacarte_total": "pricing",
+    "map_tv_prefs_to_codes": "pricing",
+    "tv_prefs_mask": "pricing",
+    "tv_alacarte_total": "pricing",
+    "bundle_vs_alacarte": "pricing",
+    # wizard answer space
+    "PEOPLE_OPTIONS": "wizard",
+    "HOUSEHOLD_TYPE_OPTIONS": "wizard",
+    "PEAK_OPTIONS": "wizard",
+    "RELIABILITY_OPTIONS": "wizard",
+    "DEVICES_OPTIONS": "wizard",
+    "HOME_SIZE_OPTIONS": "wizard",
+    "TV_INTEREST_OPTIONS": "wizard",
+    "TV_WANTED": "wizard",
+    "TV_PREF_OPTIONS": "wizard",
+    "STREAMING_OPTIONS": "wizard",
+    "MOBILE_LINES_OPTIONS": "wizard",
+    "skips_peak_step": "wizard",
+    "sample_responses": "wizard",
+    "with_defaults": "wizard",
+    "clone_with_overrides": "whatif",
+    "parse_overrides": "whatif",
+    "WhatIfEvaluator": "whatif",
+    "sweep_grid": "whatif",
+    "render_sweep": "whatif",
+    # scoring
+    "estimate_demand": "scoring",
+    "score_plan": "scoring",
+    "rank_plans": "scoring",
+    "role_label": "scoring",
+    "headroom_phrase": "scoring",
+    "economy_phrase": "scoring",
+    "tv_match_count": "scoring",
+    # results page
+    "build_cards": "results",
+    "card_jobs": "results",
+    # engine calls, in process or via isp_engine.service
+    "LocalEngine": "engine",
+    "RemoteEngine": "engine",
+    "get_engine": "engine",
+    # per-session state
+    "Session": "sessions",
+    "SessionStore": "sessions",
+    "encode_responses": "sessions",
+    "decode_responses": "sessions",
+    # narration (anthropic itself loads on the first LLM call)
+    "NarrativeCache": "narrative_cache",
+    "fingerprint": "narrative_cache",
+    "generate_narrative": "narration",
+    "generate_narrative_ranked": "narration",
+    "narrative_fallback": "narration",
+    "ranked_fallback": "narration",
+    "SimulatedClient": "llm_sim",
+    "Cassette": "llm_sim",
+}
+
+__all__ = sorted(_EXPORTS)
+
+# Catalog tables hot-reload (isp_engine.catalog): always read them through, never cache
+_LIVE = {"PLAN_CATALOG", "MESH_GUIDE", "INTERNET_STANDALONE_BRACKETS", "BUNDLE_MOBILE_PER_LINE",
+         "BUNDLE_TV_BASE_PRICE", "BUNDLE_TV_ADDON_PRICES", "BUNDLE_DVR_PRICE", "TV_BASE_PRICE",
+         "TV_ADDON_PRICES", "DVR_PRICE"}
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    if name not in _LIVE:
+        globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,221 @@
+"""
+Offline re-scoring of logged wizard responses.
+
+Streams a JSONL file (one `responses` dict per line, or `{"id": ..., "responses": {...}}`)
+through a process pool in fixed-size chunks and writes, per input line, the
+demand estimate and the top-k plans with their scores and bundle vs à la carte
+breakdown. At most a few chunks are in flight at once, so memory stays flat
+whatever the input size. Every record (and CSV row) carries the catalog version
+it was scored against. Output is appended in input order and a checkpoint is
+written after every chunk; rerunning the same command resumes where it stopped,
+unless the catalog or the input file changed since (then --no-resume starts over).
+
+    python -m isp_engine.batch logged.jsonl -o scored.jsonl [--format csv] [--top-k 3]
+                                [--chunk-size 2000] [--processes N] [--no-resume]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .catalog import catalog_hash, current_catalog, pin_catalog
+from .narrative_cache import json_default
+from .pricing import bundle_vs_alacarte
+from .scoring import rank_plans
+
+CSV_FIELDS = [
+    "line", "id", "catalog", "rank", "plan_id", "plan_name", "score", "headroom",
+    "required_down", "required_up", "mobile_lines_need", "tv_interest",
+    "bundle_total", "alacarte_total", "savings",
+    "internet_price", "mobile_price", "tv_price", "bundle_extra_mobile", "bundle_tv_addons",
+    "error",
+]
+
+
+def score_record(line_no: int, raw: str, top_k: int) -> Dict[str, Any]:
+    """One output record for one input line (errors are reported, never raised)."""
+    out: Dict[str, Any] = {"line": line_no, "catalog": current_catalog().version}
+    try:
+        obj = json.loads(raw)
+        if "responses" in obj:
+            out["id"] = obj.get("id")
+            obj = obj["responses"]
+        ranked, demand = rank_plans(obj, top_k=top_k)
+    except Exception as e:  # bad JSON / unexpected shapes shouldn't stop a million-line job
+        out["error"] = f"{type(e).__name__}: {e}"
+        return out
+    out["demand"] = demand
+    out["top"] = [
+        {
+            "rank": i + 1,
+            "plan_id": plan.id,
+            "plan_name": plan.name,
+            "score": round(score, 4),
+            "headroom": round(meta["headroom"], 4),
+            "cost": bundle_vs_alacarte(plan, demand),
+        }
+        for i, (plan, score, meta) in enumerate(ranked)
+    ]
+    return out
+
+
+def _score_chunk(args: Tuple[List[Tuple[int, str]], int]) -> List[Dict[str, Any]]:
+    chunk, top_k = args
+    pin_catalog()  # one catalog version per chunk, even if the file is reloaded mid-chunk
+    return [score_record(n, raw, top_k) for n, raw in chunk]
+
+
+def _chunks(path: str, skip: int, size: int) -> Iterator[List[Tuple[int, str]]]:
+    """Lazily yield [(line_no, raw_line)] chunks, skipping blank lines and the first `skip` lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = ((n, raw) for n, raw in enumerate(f, start=1) if n > skip and raw.strip())
+        while True:
+            chunk = list(islice(lines, size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def _csv_rows(rec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    if "error" in rec or not rec["top"]:
+        yield {"line": rec["line"], "id": rec.get("id"), "catalog": rec["catalog"],
+               "error": rec.get("error", "no feasible plan")}
+        return
+    d = rec["demand"]
+    for t in rec["top"]:
+        c = t["cost"]
+        yield {
+            "line": rec["line"], "id": rec.get("id"), "catalog": rec["catalog"], "rank": t["rank"],
+            "plan_id": t["plan_id"], "plan_name": t["plan_name"], "score": t["score"], "headroom": t["headroom"],
+            "required_down": d["required_down"], "required_up": d["required_up"],
+            "mobile_lines_need": d["mobile_lines_need"], "tv_interest": d["tv_interest"],
+            "bundle_total": c["bundle_total"], "alacarte_total": c["alacarte_total"], "savings": c["savings"],
+            "internet_price": c["internet_price"], "mobile_price": c["mobile_price"], "tv_price": c["tv_price"],
+            "bundle_extra_mobile": c["bundle_extra_mobile"], "bundle_tv_addons": c["bundle_tv_addons"],
+        }
+
+
+def _input_stamp(input_path: str) -> Dict[str, Any]:
+    """What identifies the input file: path, size and mtime (a replaced or edited file differs)."""
+    st = os.stat(input_path)
+    return {"input": os.path.abspath(input_path), "input_size": st.st_size, "input_mtime_ns": st.st_mtime_ns}
+
+
+def _load_checkpoint(path: str, input_path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return ckpt if ckpt.get("input") == os.path.abspath(input_path) else {}
+
+
+def _save_checkpoint(path: str, ckpt: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ckpt, f)
+    os.replace(tmp, path)
+
+
+def run(input_path: str, output_path: str, fmt: str = "jsonl", top_k: int = 3,
+        chunk_size: int = 2000, processes: int = None, resume: bool = True) -> Dict[str, Any]:
+    ckpt_path = output_path + ".ckpt"
+    ckpt = _load_checkpoint(ckpt_path, input_path) if resume else {}
+    # The checkpoint only counts if the output it describes is still all there
+    if ckpt and (not os.path.exists(output_path) or os.path.getsize(output_path) < ckpt["output_bytes"]):
+        ckpt = {}
+    if ckpt and (ckpt.get("fmt"), ckpt.get("top_k")) != (fmt, top_k):
+        raise ValueError(f"{ckpt_path} was written with --format {ckpt.get('fmt')} --top-k {ckpt.get('top_k')}; "
+                         f"resume with the same flags or pass --no-resume")
+    stamp, catalog = _input_stamp(input_path), catalog_hash()
+    if ckpt and {k: ckpt.get(k) for k in stamp} != stamp:
+        raise ValueError(f"{input_path} changed since {ckpt_path} was written; pass --no-resume to start over")
+    if ckpt and ckpt.get("catalog") != catalog:
+        raise ValueError(f"the catalog changed since {ckpt_path} was written (version {ckpt.get('catalog')}, "
+                         f"now {catalog}); pass --no-resume to re-score from the start")
+    lines_done = ckpt.get("lines_done", 0)
+    records = ckpt.get("records", 0)
+
+    # Drop anything written after the last checkpoint (a chunk cut off mid-write)
+    mode = "r+" if ckpt else "w"
+    out = open(output_path, mode, encoding="utf-8", newline="")
+    if mode == "r+":
+        out.seek(ckpt["output_bytes"])
+        out.truncate()
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS) if fmt == "csv" else None
+    if writer is not None and mode == "w":
+        writer.writeheader()
+
+    t0 = time.perf_counter()
+    pool = Pool(processes)
+    max_inflight = 2 * (processes or os.cpu_count() or 1)
+    inflight: deque = deque()
+    chunks = _chunks(input_path, lines_done, chunk_size)
+    try:
+        while True:
+            while len(inflight) < max_inflight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                inflight.append((chunk[-1][0], pool.apply_async(_score_chunk, ((chunk, top_k),))))
+            if not inflight:
+                break
+            last_line, res = inflight.popleft()
+            for rec in res.get():
+                if writer is not None:
+                    writer.writerows(_csv_rows(rec))
+                else:
+                    out.write(json.dumps(rec, ensure_ascii=False, default=json_default) + "\n")
+                records += 1
+            out.flush()
+            lines_done = last_line
+            _save_checkpoint(ckpt_path, {
+                **stamp,
+                "catalog": catalog,
+                "fmt": fmt,
+                "top_k": top_k,
+                "lines_done": lines_done,
+                "records": records,
+                "output_bytes": out.tell(),
+            })
+    finally:
+        pool.terminate()
+        out.close()
+
+    if os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    return {"records": records, "lines": lines_done, "resumed_from": ckpt.get("lines_done", 0),
+            "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def main(argv: List[str] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("input", help="JSONL of wizard responses")
+    ap.add_argument("-o", "--output", required=True)
+    ap.add_argument("--format", choices=["jsonl", "csv"], default=None,
+                    help="default: from the output file extension")
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--chunk-size", type=int, default=2000)
+    ap.add_argument("--processes", type=int, default=None)
+    ap.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint and start over")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    try:
+        summary = run(args.input, args.output, fmt=fmt, top_k=args.top_k, chunk_size=args.chunk_size,
+                      processes=args.processes, resume=not args.no_resume)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
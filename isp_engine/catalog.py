@@ -0,0 +1,395 @@
+"""
+Plan catalog and pricing tables.
+
+The data lives on disk (CATALOG_PATH, JSON; isp_engine/catalog.json by
+default) and is loaded into a validated, immutable `CatalogSnapshot` shared by
+every session. The store re-checks the file at most every
+CATALOG_RELOAD_CHECK_S seconds; a changed file is loaded and validated in full
+and only then swapped in (one reference assignment), so readers always see a
+complete catalog. A file that fails validation is rejected and the previous
+snapshot keeps serving.
+
+`snapshot.version` hashes the data; caches and precomputed artifacts key on it.
+`pin_catalog()` fixes one snapshot for the current context (a Streamlit rerun,
+a batch chunk), so a reload mid-rerun can't mix two versions in one answer.
+The old module constants (PLAN_CATALOG, MESH_GUIDE, ...) still resolve, to the
+current snapshot's values.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+CATALOG_RELOAD_CHECK_S = float(os.getenv("CATALOG_RELOAD_CHECK_S", "2"))   # stat the file at most this often; 0 = every read
+
+TECHS = ("fiber", "hybrid")
+PRICE_TABLE_LINES = 9   # compiled price tables cover 0..8 mobile lines; more falls back to the formula
+
+# TV packs as bits: a plan's packs and a household's preferences are both one int
+TV_PACKS = ("sports", "premium", "kids", "intl", "news", "entertainment")
+TV_PACK_BIT = {code: 1 << i for i, code in enumerate(TV_PACKS)}
+N_TV_MASKS = 1 << len(TV_PACKS)
+
+
+def tv_mask(codes) -> int:
+    m = 0
+    for c in codes:
+        m |= TV_PACK_BIT.get(c, 0)
+    return m
+
+
+def mask_codes(mask: int) -> Tuple[str, ...]:
+    return tuple(c for c in TV_PACKS if mask & TV_PACK_BIT[c])
+
+
+# =========================
+# Data Model (random but realistic)
+# =========================
+@dataclass(frozen=True, slots=True)
+class Plan:
+    id: str
+    name: str
+    tech: str             # 'fiber' or 'hybrid'
+    down_mbps: int
+    up_mbps: int
+    includes_tv: bool
+    tv_packs: Tuple[str, ...]   # e.g., ('sports', 'premium', 'kids', 'intl', 'news', 'entertainment')
+    mobile_lines_included: int
+    base_price: int       # $/mo (first 12 months, illustrative)
+    includes_router: bool
+    dvr_included: bool
+    notes: Tuple[str, ...]
+    pack_mask: int = field(init=False, repr=False, compare=False)   # tv_packs as TV_PACK_BIT bits
+
+    def __post_init__(self):
+        object.__setattr__(self, "tv_packs", tuple(self.tv_packs))
+        object.__setattr__(self, "notes", tuple(self.notes))
+        object.__setattr__(self, "pack_mask", tv_mask(self.tv_packs))
+
+
+@dataclass(frozen=True, slots=True)
+class PlanPriceTable:
+    """One plan's bundle add-on costs, precomputed over every input they depend on."""
+    extra_mobile: Tuple[int, ...]   # lines needed -> extra lines at the bundle rate
+    tv_addons: Tuple[int, ...]      # pref mask -> bundle TV add-ons when TV is wanted
+
+
+class CatalogError(ValueError):
+    """The catalog file is missing a field or holds an inconsistent value."""
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """One loaded catalog version. Never mutated; a reload builds a new one."""
+    version: str
+    plans: Tuple[Plan, ...]
+    mesh_guide: Mapping[str, Mapping[str, Any]]
+    # ----- À la carte -----
+    internet_brackets: Tuple[Tuple[int, int, int], ...]   # (lo, hi, price): lo <= Mbps < hi
+    internet_above_brackets: int
+    mobile_per_line: Tuple[int, ...]                      # per-line rate at 1, 2, 3, 4+ lines
+    tv_base_price: int
+    tv_addon_prices: Mapping[str, int]
+    dvr_price: int
+    # ----- Bundle add-ons (discounted vs à la carte) -----
+    bundle_mobile_per_line: int
+    bundle_tv_base_price: int
+    bundle_tv_addon_prices: Mapping[str, int]
+    bundle_dvr_price: int
+    bundle_internet_credit_with_mobile: int
+    bundle_internet_credit_with_tv: int
+    bundle_internet_credit_max: int
+    source: str = ""
+    # compiled lookups
+    _bracket_his: Tuple[int, ...] = field(default=(), repr=False)
+    plan_index: Mapping[str, int] = field(default_factory=dict, repr=False)
+    tv_addon_by_mask: Tuple[int, ...] = field(default=(), repr=False)          # pack mask -> summed add-on price
+    bundle_tv_addon_by_mask: Tuple[int, ...] = field(default=(), repr=False)
+    mobile_alacarte_by_lines: Tuple[int, ...] = field(default=(), repr=False)  # lines -> à la carte mobile total
+    tv_alacarte_by_mask: Tuple[int, ...] = field(default=(), repr=False)       # pref mask -> à la carte TV (with DVR)
+    plan_prices: Tuple[PlanPriceTable, ...] = field(default=(), repr=False)    # aligned with plans
+
+    def internet_price(self, down_mbps: int) -> int:
+        i = bisect_right(self._bracket_his, down_mbps)
+        if i < len(self.internet_brackets) and self.internet_brackets[i][0] <= down_mbps:
+            return self.internet_brackets[i][2]
+        return self.internet_above_brackets
+
+    def mobile_rate(self, n: int) -> int:
+        return self.mobile_per_line[min(max(n, 1), len(self.mobile_per_line)) - 1]
+
+
+# =========================
+# Load + validate
+# =========================
+def _int(doc: Dict[str, Any], key: str, where: str, minimum: int = 0) -> int:
+    v = doc.get(key)
+    if not isinstance(v, int) or isinstance(v, bool) or v < minimum:
+        raise CatalogError(f"{where}.{key}: expected an integer >= {minimum}, got {v!r}")
+    return v
+
+
+def _prices(doc: Dict[str, Any], key: str, where: str) -> Mapping[str, int]:
+    v = doc.get(key)
+    if not isinstance(v, dict) or not v:
+        raise CatalogError(f"{where}.{key}: expected a non-empty {{pack: price}} object")
+    unknown = set(v) - set(TV_PACKS)
+    if unknown:
+        raise CatalogError(f"{where}.{key}: unknown packs {sorted(unknown)} (known: {list(TV_PACKS)})")
+    return MappingProxyType({k: _int(v, k, f"{where}.{key}") for k in v})
+
+
+def _plan(doc: Any, i: int, packs: Mapping[str, int]) -> Plan:
+    where = f"plans[{i}]"
+    if not isinstance(doc, dict):
+        raise CatalogError(f"{where}: expected an object")
+    for key in ("id", "name"):
+        if not isinstance(doc.get(key), str) or not doc[key]:
+            raise CatalogError(f"{where}.{key}: expected a non-empty string")
+    if doc.get("tech") not in TECHS:
+        raise CatalogError(f"{where}.tech: expected one of {TECHS}, got {doc.get('tech')!r}")
+    for key in ("includes_tv", "includes_router", "dvr_included"):
+        if not isinstance(doc.get(key), bool):
+            raise CatalogError(f"{where}.{key}: expected true/false")
+    tv_packs = doc.get("tv_packs")
+    if not isinstance(tv_packs, list) or any(p not in packs for p in tv_packs):
+        raise CatalogError(f"{where}.tv_packs: expected a list of {sorted(packs)}")
+    if tv_packs and not doc["includes_tv"]:
+        raise CatalogError(f"{where}.tv_packs: set on a plan without TV")
+    notes = doc.get("notes", [])
+    if not isinstance(notes, list) or not all(isinstance(n, str) for n in notes):
+        raise CatalogError(f"{where}.notes: expected a list of strings")
+    return Plan(
+        doc["id"], doc["name"], doc["tech"],
+        _int(doc, "down_mbps", where, 1), _int(doc, "up_mbps", where, 1),
+        doc["includes_tv"], tuple(tv_packs), _int(doc, "mobile_lines_included", where),
+        _int(doc, "base_price", where), doc["includes_router"], doc["dvr_included"], tuple(notes),
+    )
+
+
+def compile_catalog(doc: Dict[str, Any], source: str = "") -> CatalogSnapshot:
+    """Validate a parsed catalog document and build its snapshot; raises CatalogError."""
+    if not isinstance(doc, dict):
+        raise CatalogError("catalog: expected a JSON object")
+    alc, bun = doc.get("alacarte"), doc.get("bundle")
+    if not isinstance(alc, dict) or not isinstance(bun, dict):
+        raise CatalogError("catalog: 'alacarte' and 'bundle' sections are required")
+
+    tv_addons = _prices(alc, "tv_addons", "alacarte")
+    bundle_addons = _prices(bun, "tv_addons", "bundle")
+    if set(tv_addons) != set(bundle_addons):
+        raise CatalogError("alacarte.tv_addons and bundle.tv_addons must price the same packs")
+
+    raw_plans = doc.get("plans")
+    if not isinstance(raw_plans, list) or not raw_plans:
+        raise CatalogError("plans: expected a non-empty list")
+    plans = tuple(_plan(p, i, tv_addons) for i, p in enumerate(raw_plans))
+    index = {p.id: i for i, p in enumerate(plans)}
+    if len(index) != len(plans):
+        raise CatalogError("plans: duplicate plan id")
+
+    brackets = []
+    for i, b in enumerate(alc.get("internet_brackets") or []):
+        if (not isinstance(b, list) or len(b) != 3
+                or not all(isinstance(x, int) and not isinstance(x, bool) and x >= 0 for x in b) or b[0] >= b[1]):
+            raise CatalogError(f"alacarte.internet_brackets[{i}]: expected [lo, hi, price] with lo < hi")
+        if brackets and b[0] < brackets[-1][1]:
+            raise CatalogError(f"alacarte.internet_brackets[{i}]: overlaps or is out of order")
+        brackets.append(tuple(b))
+    if not brackets:
+        raise CatalogError("alacarte.internet_brackets: expected a non-empty list")
+
+    rates = alc.get("mobile_per_line")
+    if not isinstance(rates, list) or not rates or not all(isinstance(r, int) and r >= 0 for r in rates):
+        raise CatalogError("alacarte.mobile_per_line: expected per-line rates for 1, 2, 3, ... lines")
+
+    mesh = doc.get("mesh_guide")
+    if not isinstance(mesh, dict) or not all(isinstance(v, dict) and "copy" in v for v in mesh.values()):
+        raise CatalogError("mesh_guide: expected {home size: {nodes, copy}}")
+
+    canonical = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    tv_by_mask, bundle_by_mask = _by_mask(tv_addons), _by_mask(bundle_addons)
+    tv_base, dvr = _int(alc, "tv_base", "alacarte"), _int(alc, "dvr", "alacarte")
+    b_line, b_tv_base, b_dvr = (_int(bun, "mobile_per_line", "bundle"), _int(bun, "tv_base", "bundle"),
+                                _int(bun, "dvr", "bundle"))
+    return CatalogSnapshot(
+        version=hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16],
+        plans=plans,
+        mesh_guide=MappingProxyType({k: MappingProxyType(dict(v)) for k, v in mesh.items()}),
+        internet_brackets=tuple(brackets),
+        internet_above_brackets=_int(alc, "internet_above_brackets", "alacarte"),
+        mobile_per_line=tuple(rates),
+        tv_base_price=tv_base,
+        tv_addon_prices=tv_addons,
+        dvr_price=dvr,
+        bundle_mobile_per_line=b_line,
+        bundle_tv_base_price=b_tv_base,
+        bundle_tv_addon_prices=bundle_addons,
+        bundle_dvr_price=b_dvr,
+        bundle_internet_credit_with_mobile=_int(bun, "internet_credit_with_mobile", "bundle"),
+        bundle_internet_credit_with_tv=_int(bun, "internet_credit_with_tv", "bundle"),
+        bundle_internet_credit_max=_int(bun, "internet_credit_max", "bundle"),
+        source=source,
+        _bracket_his=tuple(hi for _, hi, _ in brackets),
+        plan_index=MappingProxyType(index),
+        tv_addon_by_mask=tv_by_mask,
+        bundle_tv_addon_by_mask=bundle_by_mask,
+        mobile_alacarte_by_lines=tuple(n * rates[min(max(n, 1), len(rates)) - 1] for n in range(PRICE_TABLE_LINES)),
+        tv_alacarte_by_mask=tuple(tv_base + tv_by_mask[m] + dvr for m in range(N_TV_MASKS)),
+        plan_prices=tuple(_plan_prices(p, b_line, b_tv_base, b_dvr, bundle_by_mask) for p in plans),
+    )
+
+
+def _by_mask(prices: Mapping[str, int]) -> Tuple[int, ...]:
+    return tuple(sum(prices.get(c, 0) for c in mask_codes(m)) for m in range(N_TV_MASKS))
+
+
+def _plan_prices(plan: Plan, per_line: int, tv_base: int, dvr: int, addon_by_mask: Tuple[int, ...]) -> PlanPriceTable:
+    if plan.includes_tv:
+        # only the requested packs the plan lacks, plus DVR if it isn't included
+        tv = tuple(addon_by_mask[m & ~plan.pack_mask] + (0 if plan.dvr_included else dvr) for m in range(N_TV_MASKS))
+    else:
+        tv = tuple(tv_base + addon_by_mask[m] + dvr for m in range(N_TV_MASKS))
+    return PlanPriceTable(
+        extra_mobile=tuple(max(0, n - plan.mobile_lines_included) * per_line for n in range(PRICE_TABLE_LINES)),
+        tv_addons=tv,
+    )
+
+
+def load_catalog(path: str = CATALOG_PATH) -> CatalogSnapshot:
+    """Read, validate and compile a catalog file; raises OSError or CatalogError."""
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            doc = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"{path}: not valid JSON ({e})") from None
+    return compile_catalog(doc, source=path)
+
+
+# =========================
+# Store: hot reload with atomic swap
+# =========================
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class CatalogStore:
+    """The current snapshot for one catalog file, swapped in whole when the file changes."""
+
+    def __init__(self, path: str = CATALOG_PATH, check_every_s: float = CATALOG_RELOAD_CHECK_S):
+        self.path = path
+        self.check_every_s = check_every_s
+        self._lock = threading.Lock()
+        self._stamp = _stamp(path)
+        self._snap = load_catalog(path)   # no catalog, no app: the first load must succeed
+        self._next_check = time.monotonic() + check_every_s
+        self.reloads = 0
+        self.last_error = ""
+
+    def current(self) -> CatalogSnapshot:
+        if time.monotonic() >= self._next_check:
+            self.check()
+        return self._snap
+
+    def check(self) -> bool:
+        """Reload if the file changed since the last look; True if a new snapshot was swapped in."""
+        if not self._lock.acquire(blocking=False):
+            return False  # another thread is already checking; keep serving the current snapshot
+        try:
+            self._next_check = time.monotonic() + self.check_every_s
+            stamp = _stamp(self.path)
+            if stamp is None or stamp == self._stamp:
+                return False
+            self._stamp = stamp   # a rejected file isn't retried until it changes again
+            try:
+                snap = load_catalog(self.path)
+            except (OSError, CatalogError) as e:
+                self.last_error = str(e)
+                _count_reload("rejected")
+                return False
+            if snap.version == self._snap.version:
+                return False  # touched, not changed
+            self._snap = snap     # atomic swap: readers get the old or the new snapshot, never a mix
+            self.reloads += 1
+            self.last_error = ""
+            _count_reload("ok")
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self._snap.version, "path": self.path, "reloads": self.reloads,
+                "last_error": self.last_error}
+
+
+def _count_reload(result: str) -> None:
+    from .telemetry import REGISTRY
+    REGISTRY.inc("isp_catalog_reloads_total", result=result)
+
+
+_store: Optional[CatalogStore] = None
+_store_lock = threading.Lock()
+_pinned: "contextvars.ContextVar[Optional[CatalogSnapshot]]" = contextvars.ContextVar("isp_catalog", default=None)
+
+
+def default_store() -> CatalogStore:
+    """Process-wide store for CATALOG_PATH, shared by every session."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CatalogStore()
+        return _store
+
+
+def current_catalog() -> CatalogSnapshot:
+    """The snapshot pinned for this context, else the store's latest."""
+    snap = _pinned.get()
+    return snap if snap is not None else default_store().current()
+
+
+def pin_catalog(snap: Optional[CatalogSnapshot] = None) -> CatalogSnapshot:
+    """Fix the snapshot for this context (call once at the top of a rerun); worker threads inherit it via contextvars."""
+    snap = snap or default_store().current()
+    _pinned.set(snap)
+    return snap
+
+
+def catalog_hash() -> str:
+    """Fingerprint of the catalog + pricing tables; precomputed artifacts key on it."""
+    return current_catalog().version
+
+
+# ---------- Legacy module constants (resolve to the current snapshot) ----------
+_LEGACY = {
+    "PLAN_CATALOG": "plans",
+    "MESH_GUIDE": "mesh_guide",
+    "INTERNET_STANDALONE_BRACKETS": "internet_brackets",
+    "TV_BASE_PRICE": "tv_base_price",
+    "TV_ADDON_PRICES": "tv_addon_prices",
+    "DVR_PRICE": "dvr_price",
+    "BUNDLE_MOBILE_PER_LINE": "bundle_mobile_per_line",
+    "BUNDLE_TV_BASE_PRICE": "bundle_tv_base_price",
+    "BUNDLE_TV_ADDON_PRICES": "bundle_tv_addon_prices",
+    "BUNDLE_DVR_PRICE": "bundle_dvr_price",
+    "BUNDLE_INTERNET_CREDIT_WITH_MOBILE": "bundle_internet_credit_with_mobile",
+    "BUNDLE_INTERNET_CREDIT_WITH_TV": "bundle_internet_credit_with_tv",
+    "BUNDLE_INTERNET_CREDIT_MAX": "bundle_internet_credit_max",
+}
+
+
+def __getattr__(name: str) -> Any:
+    attr = _LEGACY.get(name)
+    if attr is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(current_catalog(), attr)
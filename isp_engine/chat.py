@@ -0,0 +1,113 @@
+"""Results-page chatbot (hybrid: LLM + math tools): numeric answers, optionally polished by the LLM."""
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .telemetry import span
+from .whatif import parse_overrides, render_sweep, sweep_grid
+
+POST_PROMO_DELTA = 20  # $/mo placeholder increase after 12 months (tune or load from CMS)
+
+
+def format_delta(old_cost: Dict[str, Any], new_cost: Dict[str, Any]) -> str:
+    d = int(round(new_cost["bundle_total"] - old_cost["bundle_total"]))
+    if d == 0:
+        return "The monthly price stays about the same."
+    if d > 0:
+        return f"The monthly price would increase by **${d}/mo**."
+    return f"The monthly price would decrease by **${abs(d)}/mo**."
+
+
+def post_promo_note(plan_price: int) -> str:
+    # Simple, explicit placeholder (so we don't overpromise)
+    est_after = plan_price + POST_PROMO_DELTA
+    return (
+        f"Your selections show a **first-12-months** price of **${plan_price}/mo**. "
+        f"We don’t have standard rates in this demo, so using a placeholder **+${POST_PROMO_DELTA}/mo** after month 12, "
+        f"the bill would be about **${est_after}/mo**. Check the latest official pricing for exact post-promo rates."
+    )
+
+
+def policy_note() -> str:
+    return (
+        "This demo doesn’t include contract or trial policy data. Many ISPs offer promo pricing for the first 12 months; "
+        "some plans are month-to-month, others may require a term agreement; trial/return windows vary. "
+        "We can show pricing impacts, but for legal terms please check the official plan details or a sales rep."
+    )
+
+
+def draft_chat(engine: Any, responses: Dict[str, Any], cards: List[Dict[str, Any]],
+               user_text: str) -> Tuple[str, bool]:
+    """
+    (deterministic reply, whether the LLM should phrase it). Handles (A) 'what if'
+    price changes by re-running the model with overrides, (B) generic policy
+    questions with safe notes and (C) scenario comparisons. `engine` is an
+    isp_engine.engine LocalEngine / RemoteEngine; `cards` are the shown results.
+    """
+    t = user_text.lower()
+
+    # Current "best match" baseline (first card)
+    base_plan, base_cost = cards[0]["plan"], cards[0]["cost"]
+
+    # (B) Policy questions first
+    if "after 12 months" in t or "12 months" in t or "year" in t:
+        return post_promo_note(base_plan.base_price), True
+
+    if "lock" in t or "contract" in t or "trial" in t or "cancel" in t or "money back" in t:
+        return policy_note(), True
+
+    # (C) Side-by-side scenarios: every lines × TV (× reliability) combination in one sweep.
+    # The table goes out as-is: it's all numbers, nothing for the LLM to polish.
+    if any(k in t for k in ["compare", "scenarios", "side by side", "matrix"]):
+        grid = sweep_grid(user_text)
+        with span("sweep") as rec:
+            cells = engine.sweep(responses, grid)
+            rec["cells"] = len(cells)
+        return (
+            "Best match for each scenario (bundle total as configured, and savings vs buying separately):\n\n"
+            + render_sweep(grid, cells)
+        ), False
+
+    # (A) What-if tweaks → re-score only the terms the tweak touches
+    new_ranked, new_demand = engine.whatif(responses, parse_overrides(user_text), top_k=3)
+
+    if not new_ranked:
+        return "I couldn’t compute that scenario—try rephrasing or changing a single thing at a time.", False
+
+    new_plan, new_score, new_meta = new_ranked[0]
+    new_cost = engine.bundle(new_plan, new_demand)
+
+    # Build a crisp, numeric answer we can hand to the LLM to phrase nicely
+    delta_text = format_delta(base_cost, new_cost)
+    want_tv = new_demand.get("tv_interest") in ["Yes, definitely", "Maybe, show me options"]
+
+    raw = (
+        f"Scenario: {user_text}\n\n"
+        f"New best match: **{new_plan.name}** at **${new_plan.base_price}/mo** (first 12 months).\n"
+        f"- Estimated bundle total this scenario: **${new_cost['bundle_total']}/mo**\n"
+        f"- À la carte estimate: **${new_cost['alacarte_total']}/mo**\n"
+        f"- Estimated savings vs à la carte: **${int(round(new_cost['savings']))}/mo**\n"
+        f"- TV selected: **{'Yes' if want_tv else 'No'}**; Mobile lines: **{new_demand['mobile_lines_need']}**\n\n"
+        f"{delta_text}\n\n"
+        f"Ask me to *compare scenarios* to see every mobile-line and TV combination side by side."
+    )
+    return raw, True
+
+
+def answer_chat(engine: Any, responses: Dict[str, Any], cards: List[Dict[str, Any]], user_text: str) -> str:
+    """The finished reply in one piece (the draft, polished by the LLM where it helps)."""
+    draft, polish = draft_chat(engine, responses, cards, user_text)
+    return engine.polish(draft) if polish else draft
+
+
+def stream_chat(engine: Any, responses: Dict[str, Any], cards: List[Dict[str, Any]],
+                user_text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    (reply so far, done): the numeric draft comes first, straight away; the
+    polished text then streams in over it, its $ amounts checked against the
+    draft as it goes (see narration.stream_polish).
+    """
+    draft, polish = draft_chat(engine, responses, cards, user_text)
+    if not polish:
+        yield draft, True
+        return
+    yield draft, False
+    yield from engine.polish_stream(draft)
@@ -0,0 +1,350 @@
+"""
+The results page's engine calls, in process or over HTTP.
+
+`LocalEngine` runs ranking, pricing, what-if scenarios and narration in the
+calling process (the development default). `RemoteEngine` sends the same calls
+to isp_engine.service, so scoring and LLM work run in separate worker
+processes and the Streamlit app stays a thin client. `get_engine()` picks one
+from ENGINE_URL. Both return the same Python objects: plans travel by value
+and are swapped back for the local catalog's own Plan objects when they match.
+If the service can't be reached, RemoteEngine answers from a LocalEngine
+(counted in isp_engine_fallbacks_total) rather than failing the page.
+"""
+import http.client
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .catalog import Plan, current_catalog
+from .narrative_cache import fingerprint
+from .telemetry import REGISTRY
+
+ENGINE_URL = os.getenv("ENGINE_URL", "")                          # http://host:port of isp_engine.service; empty = in-process
+ENGINE_TIMEOUT_S = float(os.getenv("ENGINE_TIMEOUT_S", "15"))     # per call; a stream must finish within it too
+WHATIF_LRU = int(os.getenv("WHATIF_LRU", "256"))                  # what-if evaluators kept (one per result set)
+
+Ranked = List[Tuple[Plan, float, Dict[str, Any]]]
+
+
+# =========================
+# Wire format: JSON, with plans and sets tagged
+# =========================
+def _plan_to_wire(plan: Plan) -> Dict[str, Any]:
+    row = asdict(plan)
+    row.pop("pack_mask")
+    return row
+
+
+def _plan_from_wire(row: Dict[str, Any]) -> Plan:
+    """The local catalog's Plan when it is the same plan (keeps the compiled price tables usable), else a new one."""
+    row = {**row, "tv_packs": tuple(row["tv_packs"]), "notes": tuple(row["notes"])}
+    cat = current_catalog()
+    i = cat.plan_index.get(row["id"])
+    if i is not None and _plan_to_wire(cat.plans[i]) == row:
+        return cat.plans[i]
+    return Plan(**row)
+
+
+def _default(o: Any) -> Any:
+    if isinstance(o, Plan):
+        return {"__plan__": _plan_to_wire(o)}
+    if isinstance(o, (set, frozenset)):
+        return {"__set__": sorted(o)}
+    raise TypeError(f"not JSON serializable: {type(o).__name__}")
+
+
+def _hook(d: Dict[str, Any]) -> Any:
+    if len(d) == 1:
+        if "__plan__" in d:
+            return _plan_from_wire(d["__plan__"])
+        if "__set__" in d:
+            return set(d["__set__"])
+    return d
+
+
+def wire_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def wire_loads(blob: bytes) -> Any:
+    return json.loads(blob, object_hook=_hook)
+
+
+def _ranked(rows: List[List[Any]]) -> Ranked:
+    return [tuple(r) for r in rows]
+
+
+# =========================
+# In-process engine
+# =========================
+class LocalEngine:
+    """Every call runs here. Also the service's implementation, so both modes share one code path."""
+
+    def __init__(self, whatif_lru: int = WHATIF_LRU):
+        self.whatif_lru = whatif_lru
+        self._evaluators: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rank(self, responses: Dict[str, Any], top_k: Optional[int] = 3) -> Tuple[Ranked, Dict[str, Any]]:
+        from .scoring import rank_plans
+        return rank_plans(responses, top_k=top_k)
+
+    def cards(self, responses: Dict[str, Any], top_k: int = 3) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        from .results import build_cards
+        return build_cards(responses, top_k=top_k)
+
+    def bundle(self, plan: Plan, demand: Dict[str, Any]) -> Dict[str, Any]:
+        from .pricing import bundle_vs_alacarte
+        return bundle_vs_alacarte(plan, demand)
+
+    def whatif(self, responses: Dict[str, Any], overrides: Dict[str, Any],
+               top_k: Optional[int] = 3) -> Tuple[Ranked, Dict[str, Any]]:
+        return self._evaluator(responses).rank(overrides, top_k=top_k)
+
+    def sweep(self, responses: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        return self._evaluator(responses).sweep(grid)
+
+    def narrate(self, jobs: List[Dict[str, Any]],
+                prefetched: Optional[Dict[int, Any]] = None) -> Iterator[Tuple[int, str, bool]]:
+        from .narration import stream_cards
+        return stream_cards(jobs, prefetched=prefetched)
+
+    def polish(self, prompt_text: str) -> str:
+        from .narration import polish_reply
+        return polish_reply(prompt_text)
+
+    def polish_stream(self, prompt_text: str) -> Iterator[Tuple[str, bool]]:
+        from .narration import stream_polish
+        return stream_polish(prompt_text)
+
+    def prefetcher(self, sid: str = "") -> Any:
+        from .prefetch import NarrativePrefetcher
+        return NarrativePrefetcher()
+
+    def _evaluator(self, responses: Dict[str, Any]) -> Any:
+        """One WhatIfEvaluator per (answers, catalog version), so chat turns on a result set share its memo."""
+        from .whatif import WhatIfEvaluator
+        key = fingerprint({"responses": responses, "catalog": current_catalog().version})
+        with self._lock:
+            ev = self._evaluators.get(key)
+            if ev is not None:
+                self._evaluators.move_to_end(key)
+                return ev
+        ev = WhatIfEvaluator(responses)
+        with self._lock:
+            self._evaluators[key] = ev
+            while len(self._evaluators) > self.whatif_lru:
+                self._evaluators.popitem(last=False)
+        return ev
+
+
+# =========================
+# HTTP client of isp_engine.service
+# =========================
+class EngineError(RuntimeError):
+    """The service answered with an error status."""
+
+
+# transport failures and unreadable replies only: a reply that parses but doesn't fit is a bug, and raises
+_REMOTE_ERRORS = (OSError, http.client.HTTPException, EngineError, json.JSONDecodeError)
+
+
+class _RemotePrefetcher:
+    """
+    The session's speculation runs in the service (one NarrativePrefetcher per
+    session id there). claim() settles it in the service, whose /narrate then
+    picks the claimed blurbs up as in-flight work, so nothing comes back here.
+    """
+
+    def __init__(self, engine: "RemoteEngine", sid: str):
+        self._engine = engine
+        self.sid = sid
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def speculate(self, partial: Dict[str, Any]) -> int:
+        try:
+            n = self._engine._call("/speculate", {"sid": self.sid, "responses": partial})["launched"]
+        except _REMOTE_ERRORS:
+            return 0
+        self.launched += n
+        return n
+
+    def claim(self, jobs: List[Dict[str, Any]]) -> Dict[int, Any]:
+        try:
+            out = self._engine._call("/claim", {"sid": self.sid, "jobs": jobs})
+        except _REMOTE_ERRORS:
+            return {}
+        self.hits += out["hits"]
+        self.misses += out["misses"]
+        self.discarded += out["discarded"]
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        claimed = self.hits + self.misses
+        return {"launched": self.launched, "hits": self.hits, "misses": self.misses, "discarded": self.discarded,
+                "hit_rate": round(self.hits / claimed, 3) if claimed else None}
+
+
+class RemoteEngine:
+    """Same calls as LocalEngine, answered by the service at `url` over keep-alive connections (one per thread)."""
+
+    def __init__(self, url: str = ENGINE_URL, timeout_s: float = ENGINE_TIMEOUT_S):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+        self._fallback = LocalEngine()
+
+    def rank(self, responses: Dict[str, Any], top_k: Optional[int] = 3) -> Tuple[Ranked, Dict[str, Any]]:
+        try:
+            out = self._call("/rank", {"responses": responses, "top_k": top_k})
+            return _ranked(out["ranked"]), out["demand"]
+        except _REMOTE_ERRORS:
+            return self._degraded("rank").rank(responses, top_k)
+
+    def cards(self, responses: Dict[str, Any], top_k: int = 3) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        try:
+            out = self._call("/cards", {"responses": responses, "top_k": top_k})
+            return out["demand"], out["cards"]
+        except _REMOTE_ERRORS:
+            return self._degraded("cards").cards(responses, top_k)
+
+    def bundle(self, plan: Plan, demand: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self._call("/bundle", {"plan": plan, "demand": demand})
+        except _REMOTE_ERRORS:
+            return self._degraded("bundle").bundle(plan, demand)
+
+    def whatif(self, responses: Dict[str, Any], overrides: Dict[str, Any],
+               top_k: Optional[int] = 3) -> Tuple[Ranked, Dict[str, Any]]:
+        try:
+            out = self._call("/whatif", {"responses": responses, "overrides": overrides, "top_k": top_k})
+            return _ranked(out["ranked"]), out["demand"]
+        except _REMOTE_ERRORS:
+            return self._degraded("whatif").whatif(responses, overrides, top_k)
+
+    def sweep(self, responses: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        try:
+            return self._call("/sweep", {"responses": responses, "grid": grid})["cells"]
+        except _REMOTE_ERRORS:
+            return self._degraded("sweep").sweep(responses, grid)
+
+    def narrate(self, jobs: List[Dict[str, Any]],
+                prefetched: Optional[Dict[int, Any]] = None) -> Iterator[Tuple[int, str, bool]]:
+        """Relays the service's NDJSON stream of (card idx, text so far, done); unfinished cards end on their fallback."""
+        from .narration import ranked_fallback
+        finished = set()
+        try:
+            for line in self._stream("/narrate", {"jobs": jobs}):
+                idx, text, done = wire_loads(line)
+                if done:
+                    finished.add(idx)
+                yield idx, text, done
+        except _REMOTE_ERRORS:
+            self._degraded("narrate")
+        for idx in range(len(jobs)):
+            if idx not in finished:
+                yield idx, ranked_fallback(**jobs[idx]), True
+
+    def polish(self, prompt_text: str) -> str:
+        try:
+            return self._call("/polish", {"prompt": prompt_text})["text"]
+        except _REMOTE_ERRORS:
+            self._degraded("polish")
+            return prompt_text
+
+    def polish_stream(self, prompt_text: str) -> Iterator[Tuple[str, bool]]:
+        """Relays the service's NDJSON stream of (text so far, done); ends on the draft if the stream breaks off."""
+        try:
+            for line in self._stream("/polish_stream", {"prompt": prompt_text}):
+                text, done = wire_loads(line)
+                yield text, done
+                if done:
+                    return
+        except _REMOTE_ERRORS:
+            self._degraded("polish_stream")
+        yield prompt_text, True
+
+    def prefetcher(self, sid: str = "") -> _RemotePrefetcher:
+        return _RemotePrefetcher(self, sid)
+
+    # ---------- transport ----------
+    def _post(self, path: str, payload: Any) -> http.client.HTTPResponse:
+        body = wire_dumps(payload)
+        for attempt in (0, 1):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+            try:
+                conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+                continue    # the service closed an idle keep-alive connection: reconnect once
+            if resp.status != 200:
+                detail = resp.read()[:200].decode("utf-8", "replace")
+                raise EngineError(f"{path}: HTTP {resp.status} {detail}")
+            return resp
+        raise EngineError(f"{path}: unreachable")
+
+    def _stream(self, path: str, payload: Any) -> Iterator[bytes]:
+        """
+        The NDJSON lines of a streamed reply. The socket timeout alone bounds
+        each read, not the stream: every read here only gets what is left of
+        timeout_s, and running out raises TimeoutError (the caller's fallback).
+        """
+        deadline = time.monotonic() + self.timeout_s
+        resp = self._post(path, payload)
+        sock = self._local.conn.sock   # None when the reply closes the connection: then checked between lines only
+        try:
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise TimeoutError(f"{path}: stream took over {self.timeout_s:g}s")
+                if sock is not None:
+                    sock.settimeout(left)
+                line = resp.readline()
+                if not line:
+                    return
+                if line.strip():
+                    yield line
+        finally:
+            if sock is not None and sock.fileno() != -1:
+                sock.settimeout(self.timeout_s)   # the connection is kept alive for the next call
+
+    def _call(self, path: str, payload: Any) -> Any:
+        return wire_loads(self._post(path, payload).read())
+
+    def _degraded(self, endpoint: str) -> LocalEngine:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        REGISTRY.inc("isp_engine_fallbacks_total", endpoint=endpoint)
+        return self._fallback
+
+
+_engine: Optional[Any] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Any:
+    """Process-wide engine: RemoteEngine(ENGINE_URL) when set, else LocalEngine."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RemoteEngine(ENGINE_URL) if ENGINE_URL else LocalEngine()
+        return _engine
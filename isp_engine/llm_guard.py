@@ -0,0 +1,178 @@
+"""
+Shared guard for every Claude call: per-call timeout plus a circuit breaker.
+
+The breaker watches a rolling window of recent calls and opens when the error
+rate or the p95 latency goes over budget. While open, calls fail fast with
+CircuitOpenError, which every call site already treats like any other LLM
+failure (deterministic copy). After a cooldown one probe call is let through
+(half-open); it closes the breaker on success and re-opens it on failure.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from .telemetry import REGISTRY
+
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "6"))            # per request, overrides the client's
+LLM_BREAKER_WINDOW_S = float(os.getenv("LLM_BREAKER_WINDOW_S", "60"))       # rolling window of recent calls
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))        # don't judge on fewer calls
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_P95_BUDGET_S = float(os.getenv("LLM_P95_BUDGET_S", "4"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "20"))   # open -> half-open
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, window_s: float = LLM_BREAKER_WINDOW_S, min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 error_rate: float = LLM_BREAKER_ERROR_RATE, p95_budget_s: float = LLM_P95_BUDGET_S,
+                 cooldown_s: float = LLM_BREAKER_COOLDOWN_S, clock=time.monotonic):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.p95_budget_s = p95_budget_s
+        self.cooldown_s = cooldown_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls: Deque[Tuple[float, bool, float]] = deque(maxlen=500)  # (when, ok, latency_s)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.last_trip_reason = ""
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go out now (in half-open, only one probe at a time)."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency_s: float) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if ok and latency_s <= self.p95_budget_s:
+                    self._calls.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._trip(now, "probe failed" if not ok else f"probe took {latency_s:.1f}s")
+                return
+            if self._state == OPEN:
+                return  # a call that started before the trip; the window restarts on close
+
+            self._calls.append((now, ok, latency_s))
+            while self._calls and self._calls[0][0] < now - self.window_s:
+                self._calls.popleft()
+            n = len(self._calls)
+            if n < self.min_calls:
+                return
+            errors = sum(1 for _, good, _ in self._calls if not good)
+            if errors / n >= self.error_rate:
+                self._trip(now, f"error rate {errors}/{n}")
+                return
+            latencies = sorted(lat for _, _, lat in self._calls)
+            p95 = latencies[min(n - 1, int(n * 0.95))]
+            if p95 > self.p95_budget_s:
+                self._trip(now, f"p95 {p95:.1f}s > {self.p95_budget_s:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            n = len(self._calls)
+            return {
+                "state": self._state,
+                "calls": n,
+                "errors": sum(1 for _, ok, _ in self._calls if not ok),
+                "last_trip_reason": self.last_trip_reason,
+            }
+
+    # ---------- internals (lock held) ----------
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown_s:
+            self._set_state(HALF_OPEN)
+            self._probing = False
+
+    def _trip(self, now: float, reason: str) -> None:
+        self._opened_at = now
+        self.last_trip_reason = reason
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            REGISTRY.inc("isp_llm_breaker_transitions_total", to=state)
+
+
+class LLMGuard:
+    """Wraps `client.messages.create` / `.stream` with the timeout and breaker."""
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, timeout_s: float = LLM_CALL_TIMEOUT_S):
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout_s = timeout_s
+
+    def _admit(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM circuit {self.breaker.state} ({self.breaker.last_trip_reason})")
+
+    def create(self, client, **kwargs: Any) -> Any:
+        self._admit()
+        kwargs.setdefault("timeout", self.timeout_s)
+        t0 = time.perf_counter()
+        try:
+            resp = client.messages.create(**kwargs)
+        except Exception:
+            self.breaker.record(False, time.perf_counter() - t0)
+            raise
+        self.breaker.record(True, time.perf_counter() - t0)
+        return resp
+
+    @contextmanager
+    def stream(self, client, **kwargs: Any) -> Iterator[Any]:
+        """Latency here is time to the response headers; a stream that dies midway counts as an error."""
+        self._admit()
+        kwargs.setdefault("timeout", self.timeout_s)
+        t0 = time.perf_counter()
+        latency = None
+        try:
+            with client.messages.stream(**kwargs) as stream:
+                latency = time.perf_counter() - t0
+                yield stream
+        except GeneratorExit:
+            # consumer walked away mid-stream; the API did answer
+            self.breaker.record(True, latency)
+            raise
+        except Exception:
+            self.breaker.record(False, time.perf_counter() - t0 if latency is None else latency)
+            raise
+        self.breaker.record(True, latency)
+
+
+_guard: Optional[LLMGuard] = None
+_lock = threading.Lock()
+
+
+def default_guard() -> LLMGuard:
+    """Process-wide guard: every session's calls feed (and obey) the same breaker."""
+    global _guard
+    with _lock:
+        if _guard is None:
+            _guard = LLMGuard()
+        return _guard
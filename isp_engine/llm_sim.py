@@ -0,0 +1,550 @@
+"""
+Local stand-in for the Anthropic Messages API: simulated replies, cassettes, HTTP.
+
+`SimulatedClient` has the SDK surface narration uses (`messages.create` and the
+`messages.stream` context manager with `text_stream` / `get_final_message`), so
+LLM_BACKEND=sim runs every call site offline and without ANTHROPIC_API_KEY.
+Replies come from a cassette (JSONL recorded with LLM_BACKEND=record, keyed by
+the prompt) when it has the request, else from a synthesizer that answers in
+the shape each prompt asks for. Timing is sampled per call: time to first token
+is log-normal (median and p95), then tokens arrive at a fixed rate; a share of
+calls fail before the first token (LLM_SIM_ERROR_RATE) or die mid-stream
+(LLM_SIM_DROP_RATE), so the guard, breaker and fallbacks see realistic traffic.
+
+The same simulator also serves the Messages API over HTTP (plain JSON and SSE
+streams), for processes that should go through the real SDK and its connection
+pool (ANTHROPIC_BASE_URL=http://host:port):
+
+    python -m isp_engine.llm_sim [--port 8765] [--ttft-ms 400] [--error-rate 0.02] [--cassette calls.jsonl]
+    python -m isp_engine.llm_sim --check
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .narrative_cache import fingerprint
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "")                                 # JSONL of recorded replies; empty = none
+LLM_SIM_TTFT_MS = float(os.getenv("LLM_SIM_TTFT_MS", "400"))                 # median time to first token
+LLM_SIM_TTFT_P95_MS = float(os.getenv("LLM_SIM_TTFT_P95_MS", "1200"))        # its p95 (log-normal tail)
+LLM_SIM_TOKENS_PER_S = float(os.getenv("LLM_SIM_TOKENS_PER_S", "80"))        # output rate after the first token
+LLM_SIM_ERROR_RATE = float(os.getenv("LLM_SIM_ERROR_RATE", "0"))             # calls failing before the first token
+LLM_SIM_DROP_RATE = float(os.getenv("LLM_SIM_DROP_RATE", "0"))               # streams cut off midway
+LLM_SIM_SEED = os.getenv("LLM_SIM_SEED", "")                                 # fixed seed for repeatable runs
+
+
+class SimulatedAPIError(RuntimeError):
+    """An injected API failure (overloaded / server error / connection dropped)."""
+
+    def __init__(self, message: str, status_code: int = 529):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SimulatedTimeout(TimeoutError):
+    """The sampled time to first token exceeded the call's timeout."""
+
+
+@dataclass(frozen=True)
+class SimProfile:
+    """Latency, throughput and failure settings of a simulated endpoint."""
+    ttft_ms: float = LLM_SIM_TTFT_MS
+    ttft_p95_ms: float = LLM_SIM_TTFT_P95_MS
+    tokens_per_s: float = LLM_SIM_TOKENS_PER_S
+    error_rate: float = LLM_SIM_ERROR_RATE
+    drop_rate: float = LLM_SIM_DROP_RATE
+    seed: Optional[int] = int(LLM_SIM_SEED) if LLM_SIM_SEED else None
+
+
+# =========================
+# Messages API shapes (attribute access like the SDK's models)
+# =========================
+@dataclass
+class TextBlock:
+    text: str
+    type: str = "text"
+
+
+@dataclass
+class Usage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+
+
+@dataclass
+class Message:
+    content: List[TextBlock]
+    usage: Usage
+    model: str = "simulated"
+    id: str = "msg_sim"
+    type: str = "message"
+    role: str = "assistant"
+    stop_reason: str = "end_turn"
+    stop_sequence: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type, "role": self.role, "model": self.model,
+                "content": [{"type": b.type, "text": b.text} for b in self.content],
+                "stop_reason": self.stop_reason, "stop_sequence": self.stop_sequence, "usage": vars(self.usage)}
+
+
+def _text_of(value: Any) -> str:
+    """Plain text of a system prompt / message content, whether a string or content blocks."""
+    if isinstance(value, str):
+        return value
+    return "".join(b.get("text", "") if isinstance(b, dict) else getattr(b, "text", "") for b in value or [])
+
+
+def _cacheable(system: Any) -> bool:
+    return isinstance(system, list) and any(isinstance(b, dict) and "cache_control" in b for b in system)
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Cassette key: the prompt text only, so prompt-cache markers, model and sampling settings don't matter."""
+    return fingerprint({
+        "system": _text_of(request.get("system", "")),
+        "messages": [[m["role"], _text_of(m["content"])] for m in request.get("messages", [])],
+    })
+
+
+# =========================
+# Cassettes
+# =========================
+class Cassette:
+    """Recorded replies by request_key, in a JSONL file. Appends are serialized; a missing file is an empty cassette."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._replies: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self._replies[row["key"]] = row
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._replies)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._replies.get(key)
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return row
+
+    def put(self, key: str, text: str, usage: Dict[str, int]) -> None:
+        row = {"key": key, "text": text, "usage": usage}
+        with self._lock:
+            self._replies[key] = row
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+# =========================
+# Simulator
+# =========================
+def synthesize(system: str, prompt: str) -> str:
+    """A reply in the format the prompt asks for: per-card JSON lines, the chat draft as given, or a blurb."""
+    if "one JSON object per line" in system:
+        try:
+            cards = json.loads(prompt.split("\n", 1)[1])["cards"]
+        except (IndexError, ValueError, KeyError, TypeError):
+            return ""
+        return "\n".join(json.dumps({"plan_id": c["plan_id"], "blurb": f"{c['plan']['name']} is the "
+                                     f"{c['role'].lower()} here at ${c['plan']['price']}/mo, with room to spare "
+                                     f"for how your household uses the internet."}) for c in cards)
+    if "dollar amounts" in system:
+        return prompt.strip()
+    return "A confident fit for your home: the speed covers your busiest evenings and the price stays predictable."
+
+
+def tokenize(text: str) -> List[str]:
+    """Word-sized chunks that join back to `text` (close enough to tokens for timing)."""
+    out, start = [], 0
+    for i, ch in enumerate(text):
+        if ch in " \n" and i > start:
+            out.append(text[start:i])
+            start = i
+    if start < len(text):
+        out.append(text[start:])
+    return out
+
+
+class Simulator:
+    """Answers Messages API requests with sampled latency and failures; thread-safe."""
+
+    def __init__(self, profile: Optional[SimProfile] = None, cassette: Optional[Cassette] = None):
+        self.profile = profile or SimProfile()
+        self.cassette = cassette
+        self.calls = 0
+        self.errors = 0
+        self.drops = 0
+        self._rng = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes: set = set()
+        p = self.profile
+        self._mu = math.log(max(p.ttft_ms, 1e-3) / 1000)
+        self._sigma = max(0.0, math.log(max(p.ttft_p95_ms, p.ttft_ms) / max(p.ttft_ms, 1e-3)) / 1.645)
+
+    def reply(self, request: Dict[str, Any]) -> Tuple[str, Usage]:
+        """Text and usage for a request (cassette first); prompt-cache reads after a cacheable prefix's first use."""
+        system, prompt = _text_of(request.get("system", "")), _text_of(request["messages"][-1]["content"])
+        row = self.cassette.get(request_key(request)) if self.cassette is not None else None
+        text = row["text"] if row is not None else synthesize(system, prompt)
+        usage = Usage(input_tokens=len(prompt) // 4, output_tokens=len(tokenize(text)))
+        if row is not None:
+            usage = Usage(**{**vars(usage), **row.get("usage", {})})
+        elif _cacheable(request.get("system")):
+            with self._lock:
+                seen = system in self._cached_prefixes
+                self._cached_prefixes.add(system)
+            if seen:
+                usage.cache_read_input_tokens = len(system) // 4
+            else:
+                usage.cache_creation_input_tokens = len(system) // 4
+        else:
+            usage.input_tokens += len(system) // 4
+        return text, usage
+
+    def plan_call(self) -> Tuple[float, bool, Optional[float]]:
+        """(time to first token s, fail before it, cut the stream after this fraction of tokens or None)."""
+        p = self.profile
+        with self._lock:
+            self.calls += 1
+            ttft = self._rng.lognormvariate(self._mu, self._sigma)
+            fail = self._rng.random() < p.error_rate
+            drop = self._rng.uniform(0.2, 0.8) if not fail and self._rng.random() < p.drop_rate else None
+            self.errors += fail
+            self.drops += drop is not None
+        return ttft, fail, drop
+
+    def token_s(self) -> float:
+        return 1.0 / self.profile.tokens_per_s if self.profile.tokens_per_s > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"calls": self.calls, "errors": self.errors, "drops": self.drops}
+        if self.cassette is not None:
+            out.update(cassette=len(self.cassette), cassette_hits=self.cassette.hits,
+                       cassette_misses=self.cassette.misses)
+        return out
+
+
+def _wait_first_token(ttft: float, fail: bool, timeout: Optional[float]) -> None:
+    if timeout is not None and ttft > timeout:
+        time.sleep(timeout)
+        raise SimulatedTimeout(f"simulated: no first token within {timeout:.1f}s")
+    time.sleep(ttft)
+    if fail:
+        raise SimulatedAPIError("simulated: overloaded", 529)
+
+
+# =========================
+# In-process client
+# =========================
+class SimStream:
+    """What `messages.stream(...)` yields: `text_stream` deltas, then `get_final_message()`."""
+
+    def __init__(self, text: str, usage: Usage, model: str, token_s: float, drop: Optional[float]):
+        self._chunks = tokenize(text)
+        self._cut = int(len(self._chunks) * drop) if drop is not None else None
+        self._usage, self._model, self._token_s = usage, model, token_s
+        self._sent: List[str] = []
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for i, chunk in enumerate(self._chunks[len(self._sent):], start=len(self._sent)):
+            if self._cut is not None and i >= self._cut:
+                raise SimulatedAPIError("simulated: stream dropped", 500)
+            if i:
+                time.sleep(self._token_s)
+            self._sent.append(chunk)
+            yield chunk
+
+    def until_done(self) -> None:
+        for _ in self.text_stream:
+            pass
+
+    def get_final_message(self) -> Message:
+        self.until_done()
+        return Message(content=[TextBlock("".join(self._sent))], usage=self._usage, model=self._model)
+
+
+class _SimMessages:
+    def __init__(self, sim: Simulator):
+        self._sim = sim
+
+    def create(self, **request: Any) -> Message:
+        text, usage = self._sim.reply(request)
+        ttft, fail, _ = self._sim.plan_call()
+        _wait_first_token(ttft, fail, request.get("timeout"))
+        time.sleep(self._sim.token_s() * max(0, usage.output_tokens - 1))
+        return Message(content=[TextBlock(text)], usage=usage, model=request.get("model", "simulated"))
+
+    @contextmanager
+    def stream(self, **request: Any) -> Iterator[SimStream]:
+        text, usage = self._sim.reply(request)
+        ttft, fail, drop = self._sim.plan_call()
+        _wait_first_token(ttft, fail, request.get("timeout"))
+        yield SimStream(text, usage, request.get("model", "simulated"), self._sim.token_s(), drop)
+
+
+class SimulatedClient:
+    """Drop-in for `anthropic.Anthropic` at narration's call sites, answered by a Simulator."""
+
+    def __init__(self, simulator: Optional[Simulator] = None):
+        self.simulator = simulator or Simulator(cassette=Cassette(LLM_CASSETTE) if LLM_CASSETTE else None)
+        self.messages = _SimMessages(self.simulator)
+
+
+# =========================
+# Recording (LLM_BACKEND=record)
+# =========================
+def _usage_dict(message: Any) -> Dict[str, int]:
+    usage = getattr(message, "usage", None)
+    keys = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+    return {k: getattr(usage, k, None) or 0 for k in keys}
+
+
+def _message_text(message: Any) -> str:
+    return "".join(getattr(b, "text", "") for b in getattr(message, "content", []) if getattr(b, "type", "") == "text")
+
+
+class _RecordingStream:
+    """Proxies the SDK's stream; the final message is written to the cassette once it is read."""
+
+    def __init__(self, stream: Any, key: str, cassette: Cassette):
+        self._stream, self._key, self._cassette = stream, key, cassette
+        self.recorded = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+    def get_final_message(self) -> Any:
+        message = self._stream.get_final_message()
+        if not self.recorded:
+            self._cassette.put(self._key, _message_text(message), _usage_dict(message))
+            self.recorded = True
+        return message
+
+
+class _RecordingMessages:
+    def __init__(self, messages: Any, cassette: Cassette):
+        self._messages, self._cassette = messages, cassette
+
+    def create(self, **request: Any) -> Any:
+        message = self._messages.create(**request)
+        self._cassette.put(request_key(request), _message_text(message), _usage_dict(message))
+        return message
+
+    @contextmanager
+    def stream(self, **request: Any) -> Iterator[_RecordingStream]:
+        with self._messages.stream(**request) as stream:
+            proxy = _RecordingStream(stream, request_key(request), self._cassette)
+            yield proxy
+            if not proxy.recorded:
+                proxy.get_final_message()   # a consumer that stopped reading early: finish to record the whole reply
+
+
+class RecordingClient:
+    """Wraps a real client and appends every reply to a cassette for later replay (LLM_BACKEND=sim)."""
+
+    def __init__(self, client: Any, cassette: Cassette):
+        self.client = client
+        self.cassette = cassette
+        self.messages = _RecordingMessages(client.messages, cassette)
+
+
+# =========================
+# HTTP endpoint
+# =========================
+class _Handler(BaseHTTPRequestHandler):
+    """POST /v1/messages with the SDK's wire format; errors as Anthropic error bodies, drops as cut connections."""
+    protocol_version = "HTTP/1.1"
+    simulator: Simulator = None  # set by serve()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        if self.path.split("?")[0] != "/v1/messages":
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        sim = self.simulator
+        text, usage = sim.reply(request)
+        ttft, fail, drop = sim.plan_call()
+        time.sleep(ttft)
+        if fail:
+            self._json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "simulated"}})
+            return
+        message = Message(content=[TextBlock(text)], usage=usage, model=request.get("model", "simulated"))
+        if not request.get("stream"):
+            time.sleep(sim.token_s() * max(0, usage.output_tokens - 1))
+            self._json(200, message.to_dict())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        start = {**message.to_dict(), "content": [], "stop_reason": None, "usage": {**vars(usage), "output_tokens": 0}}
+        self._event("message_start", {"type": "message_start", "message": start})
+        self._event("content_block_start", {"type": "content_block_start", "index": 0,
+                                            "content_block": {"type": "text", "text": ""}})
+        chunks = tokenize(text)
+        cut = int(len(chunks) * drop) if drop is not None else None
+        for i, chunk in enumerate(chunks):
+            if i == cut:
+                self.close_connection = True
+                return
+            if i:
+                time.sleep(sim.token_s())
+            self._event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                "delta": {"type": "text_delta", "text": chunk}})
+        self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self._event("message_delta", {"type": "message_delta",
+                                      "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": usage.output_tokens}})
+        self._event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _event(self, kind: str, data: Dict[str, Any]) -> None:
+        chunk = f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.flush()
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, simulator: Optional[Simulator] = None) -> ThreadingHTTPServer:
+    """A bound (not yet serving) Messages API endpoint; call serve_forever() on it, e.g. from a thread."""
+    handler = type("SimHandler", (_Handler,), {"simulator": simulator or SimulatedClient().simulator})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# =========================
+# Self-check: python -m isp_engine.llm_sim --check
+# =========================
+def _check() -> int:
+    import tempfile
+    failures = []
+    fast = SimProfile(ttft_ms=5, ttft_p95_ms=10, tokens_per_s=2000, seed=1)
+    batched = {
+        "system": [{"type": "text", "text": "Reply with exactly one JSON object per line.", "cache_control": {}}],
+        "messages": [{"role": "user", "content": "Write the blurb for each card:\n" + json.dumps({"cards": [
+            {"plan_id": "p1", "role": "Best match", "plan": {"name": "Fiber 1 Gig", "price": 80}}]})}],
+    }
+
+    client = SimulatedClient(Simulator(fast))
+    made = client.messages.create(model="m", max_tokens=50, **batched)
+    with client.messages.stream(model="m", max_tokens=50, **batched) as stream:
+        streamed = "".join(stream.text_stream)
+        final = stream.get_final_message()
+    if json.loads(streamed)["plan_id"] != "p1" or streamed != made.content[0].text or _message_text(final) != streamed:
+        failures.append(f"synthesized reply: {streamed!r}")
+    if final.usage.cache_read_input_tokens == 0 or made.usage.cache_creation_input_tokens == 0:
+        failures.append(f"prompt-cache usage: {made.usage} / {final.usage}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calls.jsonl")
+        recorder = RecordingClient(SimulatedClient(Simulator(fast)), Cassette(path))
+        polish = {"system": "Keep dollar amounts unchanged.", "messages": [{"role": "user", "content": "Costs $42/mo."}]}
+        recorder.messages.create(model="m", max_tokens=50, **polish)
+        with recorder.messages.stream(model="m", max_tokens=50, **batched) as stream:
+            next(iter(stream.text_stream))
+        replay = Simulator(fast, Cassette(path))
+        if len(replay.cassette) != 2 or replay.reply(polish)[0] != "Costs $42/mo." or replay.cassette.hits != 1:
+            failures.append(f"cassette replay: {replay.stats()}")
+
+    flaky = SimulatedClient(Simulator(SimProfile(ttft_ms=1, ttft_p95_ms=1, error_rate=1.0, seed=2)))
+    try:
+        flaky.messages.create(model="m", max_tokens=5, **batched)
+        failures.append("error_rate=1 did not fail")
+    except SimulatedAPIError:
+        pass
+    slow = SimulatedClient(Simulator(SimProfile(ttft_ms=200, ttft_p95_ms=200, seed=3)))
+    try:
+        slow.messages.create(model="m", max_tokens=5, timeout=0.01, **batched)
+        failures.append("timeout not applied")
+    except SimulatedTimeout:
+        pass
+
+    try:
+        from anthropic import Anthropic
+    except ImportError:
+        Anthropic = None
+    if Anthropic is not None:
+        server = serve(simulator=Simulator(fast))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sdk = Anthropic(api_key="sim", base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+        try:
+            with sdk.messages.stream(model="m", max_tokens=50, **batched) as stream:
+                over_http = "".join(stream.text_stream)
+            if over_http != streamed or _message_text(sdk.messages.create(model="m", max_tokens=50, **batched)) != streamed:
+                failures.append(f"HTTP reply: {over_http!r}")
+        finally:
+            server.shutdown()
+
+    for f in failures:
+        print(f"FAIL: {f}")
+    print("OK" if not failures else f"{len(failures)} failures")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Simulated Anthropic Messages API endpoint")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    ap.add_argument("--ttft-ms", type=float, default=LLM_SIM_TTFT_MS)
+    ap.add_argument("--ttft-p95-ms", type=float, default=LLM_SIM_TTFT_P95_MS)
+    ap.add_argument("--tokens-per-s", type=float, default=LLM_SIM_TOKENS_PER_S)
+    ap.add_argument("--error-rate", type=float, default=LLM_SIM_ERROR_RATE)
+    ap.add_argument("--drop-rate", type=float, default=LLM_SIM_DROP_RATE)
+    ap.add_argument("--seed", type=int, default=SimProfile().seed)
+    ap.add_argument("--cassette", default=LLM_CASSETTE, help="replay recorded replies from this JSONL file")
+    ap.add_argument("--check", action="store_true", help="run the self-check and exit")
+    args = ap.parse_args(argv)
+    if args.check:
+        return _check()
+
+    profile = SimProfile(args.ttft_ms, args.ttft_p95_ms, args.tokens_per_s, args.error_rate, args.drop_rate, args.seed)
+    server = serve(args.host, args.port, Simulator(profile, Cassette(args.cassette) if args.cassette else None))
+    host, port = server.server_address[:2]
+    print(f"isp_engine.llm_sim on http://{host}:{port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
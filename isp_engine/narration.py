@@ -0,0 +1,699 @@
+"""
+Claude narration for plan cards, with deterministic fallbacks.
+
+`anthropic` is imported and the client built on first use, so importing this
+module is cheap and works without ANTHROPIC_API_KEY (every call then falls
+back to the templated copy). LLM_BACKEND swaps the client: `sim` answers from
+isp_engine.llm_sim's local simulator (no key, no network), `record` keeps the
+real API and appends every reply to the LLM_CASSETTE file for later replay.
+"""
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Iterator, Optional
+
+from .catalog import Plan, current_catalog
+from .llm_guard import default_guard
+from .narrative_cache import default_cache, fingerprint
+from .scoring import role_label, headroom_phrase, economy_phrase, tv_match_count
+from .telemetry import count_fallback, record_usage, span
+
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-5-20250929")
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "8"))                # per HTTP call
+NARRATIVE_BUDGET_S = float(os.getenv("NARRATIVE_BUDGET_S", "4"))      # whole results page
+NARRATION_MODE = os.getenv("NARRATION_MODE", "batch")                 # batch | per_card
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "1") == "1"          # mark static prefixes cacheable
+NARRATION_THREADS = int(os.getenv("NARRATION_THREADS", "8"))          # concurrent LLM calls per process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))     # pooled keep-alive connections to the API
+LLM_BACKEND = os.getenv("LLM_BACKEND", "anthropic")                   # anthropic | sim | record (see module doc)
+
+_client = None
+_client_ready = False
+_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_inflight: Dict[str, Future] = {}     # narrative_key -> blurb being generated in this process
+_inflight_lock = threading.Lock()
+
+
+def get_client():
+    """Shared LLM client (Anthropic, or the simulator for LLM_BACKEND=sim); None when there is no key for the API."""
+    global _client, _client_ready
+    with _lock:
+        if not _client_ready:
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            if LLM_BACKEND == "sim":
+                from .llm_sim import SimulatedClient
+                _client = SimulatedClient()
+            elif api_key:
+                import httpx
+                from anthropic import Anthropic, DefaultHttpxClient
+                # one keep-alive pool per process: concurrent calls reuse warm TLS connections
+                pool = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+                _client = Anthropic(api_key=api_key, timeout=LLM_TIMEOUT_S, max_retries=1,
+                                    http_client=DefaultHttpxClient(limits=pool))
+                if LLM_BACKEND == "record":
+                    from .llm_sim import Cassette, LLM_CASSETTE, RecordingClient
+                    _client = RecordingClient(_client, Cassette(LLM_CASSETTE or "llm_cassette.jsonl"))
+            _client_ready = True
+        return _client
+
+
+def system_blocks(text: str) -> Any:
+    """
+    A static system prompt as a provider-cacheable prefix. (Prefixes shorter than
+    the model's cache minimum are just processed normally.)
+    """
+    if not LLM_PROMPT_CACHE:
+        return text
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def compact_json(obj: Any) -> str:
+    """Prompt payload encoding: no whitespace, sorted keys (same bytes for the same inputs)."""
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def get_narration_pool() -> ThreadPoolExecutor:
+    """Worker threads for concurrent card narration (shared by every session in the process)."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=NARRATION_THREADS, thread_name_prefix="narrate")
+        return _pool
+
+
+def narrative_key(plan: Plan, demand: Dict[str, Any], savings: int, headroom: float,
+                  rank_idx: int, alts: list) -> str:
+    """Cache key for a ranked blurb: only the inputs that actually reach the prompt."""
+    return fingerprint({
+        "model": ANTHROPIC_MODEL,
+        "catalog": current_catalog().version,   # a repriced / renamed plan keeps its id
+        "plan": plan.id,
+        "role": role_label(rank_idx),
+        "need": {
+            "required_down": demand["required_down"],
+            "required_up": demand["required_up"],
+            "tv_interest": demand["tv_interest"],
+            "mobile_lines_need": demand.get("mobile_lines_need", 1),
+            "tv_match_count": tv_match_count(plan, demand.get("tv_prefs", set())),
+        },
+        "savings": int(round(savings)),
+        "headroom": round(headroom, 1),   # bucket: 5.31x and 5.34x read the same
+        "alts": alts[:2],
+    })
+
+def narrative_fallback(plan: Plan, demand: Dict[str, Any], reasons: List[str]) -> str:
+    """Deterministic single-plan blurb (no LLM)."""
+    bits = []
+    if demand.get("high_reliability"):
+        bits.append("reliable connection for work-from-home")
+    if demand.get("needs_low_latency"):
+        bits.append("low-latency performance for gaming/calls")
+    bits.append(f"{plan.down_mbps} Mbps download")
+    if plan.includes_tv:
+        bits.append("TV service included")
+    if plan.mobile_lines_included:
+        bits.append(f"{plan.mobile_lines_included} mobile line(s) bundled")
+    base = ("; ".join(bits) + ". ").capitalize()
+    return base + " " + " ".join(reasons[:2])
+
+def generate_narrative(plan: Plan, demand: Dict[str, Any], reasons: List[str]) -> str:
+    """
+    Uses Claude for a short consumer-friendly blurb if ANTHROPIC_API_KEY is set.
+    Falls back to deterministic copy if not.
+    """
+    # Fallback path (no key / client)
+    def _fallback() -> str:
+        return narrative_fallback(plan, demand, reasons)
+
+    client = get_client()
+    if client is None:
+        return _fallback()
+
+    # Build a compact, structured prompt
+    user_payload = {
+        "plan": {
+            "name": plan.name,
+            "tech": plan.tech,
+            "down_mbps": plan.down_mbps,
+            "up_mbps": plan.up_mbps,
+            "includes_tv": plan.includes_tv,
+            "tv_packs": plan.tv_packs,
+            "mobile_lines_included": plan.mobile_lines_included,
+            "price": plan.base_price,
+        },
+        "demand": {
+            "required_down": demand["required_down"],
+            "required_up": demand["required_up"],
+            "high_reliability": demand["high_reliability"],
+            "needs_low_latency": demand["needs_low_latency"],
+            "house_size": demand["size"],
+            "devices": demand["n_devices"],
+            "people": demand["n_people"],
+        },
+        "reasons": reasons[:6],  # cap to keep prompt short
+    }
+
+    system_msg = (
+        "You are a concise telecom copywriter. Write clear, compliant, 2–3 sentence blurbs for consumers. "
+        "Avoid unverifiable claims, no speed guarantees, no legal or promo jargon. "
+        "Mention fit in plain English and reflect the user's needs."
+    )
+    user_msg = (
+        "Write a 2–3 sentence 'Why this fits' paragraph for the plan below, using neutral, factual language. "
+        "Do not repeat bullet points verbatim; summarize benefits. "
+        "Return plain text only (no markdown, no lists).\n\n"
+        f"{compact_json(user_payload)}"
+    )
+
+    with span("generate_narrative", kind="llm") as rec:
+        try:
+            resp = default_guard().create(
+                client,
+                model=ANTHROPIC_MODEL,                 # e.g. claude-sonnet-4-5-20250929
+                max_tokens=220,
+                temperature=0.5,
+                system=system_blocks(system_msg),
+                messages=[{"role": "user", "content": user_msg}],
+            )
+            record_usage(rec, resp)
+            # Claude returns a list of content blocks; we want the text part
+            if getattr(resp, "content", None):
+                for block in resp.content:
+                    if getattr(block, "type", "") == "text":
+                        txt = getattr(block, "text", "").strip()
+                        if txt:
+                            return txt
+        except Exception as e:
+            # Never break your flow if API fails
+            rec["error"] = type(e).__name__
+        rec["fallback"] = True
+        return _fallback()
+
+def ranked_fallback(plan: Plan, demand: Dict[str, Any], savings: int, headroom: float,
+                    rank_idx: int, alts: list) -> str:
+    """Deterministic 'Why this fits' copy (no LLM)."""
+    role = role_label(rank_idx)
+    tv_matches = tv_match_count(plan, demand.get("tv_prefs", set()))
+    need_lines = demand.get("mobile_lines_need", 1)
+    bits = []
+    bits.append(f"{role}: {plan.name} {headroom_phrase(headroom)}")
+    if plan.includes_tv and tv_matches:
+        bits.append(f"and includes TV packs that match your interests")
+    if plan.mobile_lines_included:
+        if plan.mobile_lines_included >= need_lines:
+            bits.append(f"with {plan.mobile_lines_included} mobile line(s) included")
+        else:
+            bits.append(f"with {plan.mobile_lines_included} mobile line(s) included")
+    bits.append(f"and {economy_phrase(int(round(savings)))} at ${plan.base_price}/mo.")
+    # one short placement cue vs alternatives
+    if alts:
+        alt = alts[0]
+        bits.append(f"It ranks above {alt['name']} because it balances features and total monthly cost better for your selections.")
+    return " ".join(bits)
+
+def _ranked_prompt(plan: Plan, demand: Dict[str, Any], savings: int, headroom: float,
+                   rank_idx: int, alts: list) -> Tuple[str, str]:
+    """(system, user) messages for a ranked card blurb."""
+    system_msg = (
+        "You write short plan blurbs for an ISP comparison page. "
+        "Your job is to DEFEND the ranking (Best match / Runner-up / Also consider). "
+        "Tone: positive, confident, helpful. 1–2 sentences. "
+        "NEVER suggest switching to a cheaper/faster plan or to look for another tier. "
+        "No markdown, no bullets, no hedging; explain why THIS plan is placed where it is, "
+        "referencing speed headroom, features (TV packs, mobile lines), and monthly economics."
+    )
+
+    payload = {
+        "role": role_label(rank_idx),
+        "plan": {
+            "name": plan.name,
+            "price": plan.base_price,
+            "tech": plan.tech,
+            "down_mbps": plan.down_mbps,
+            "up_mbps": plan.up_mbps,
+            "includes_tv": plan.includes_tv,
+            "tv_packs": plan.tv_packs,
+            "mobile_lines_included": plan.mobile_lines_included,
+        },
+        "user_need": {
+            "required_down": demand["required_down"],
+            "required_up": demand["required_up"],
+            "tv_interest": demand["tv_interest"],
+            "mobile_lines_need": demand.get("mobile_lines_need", 1),
+        },
+        "metrics": {
+            "headroom": round(headroom, 2),
+            "tv_match_count": tv_match_count(plan, demand.get("tv_prefs", set())),
+            "savings_vs_alacarte": int(round(savings)),
+        },
+        "alternatives": alts[:2],  # names, roles, prices, savings of others
+        "instructions": "Defend this ranking and focus on fit for the user's selections."
+    }
+    return system_msg, "Write the blurb for this card:\n" + compact_json(payload)
+
+def generate_narrative_ranked(
+    plan: Plan,
+    demand: Dict[str, Any],
+    savings: int,           # from bundle_vs_alacarte
+    headroom: float,        # from score_plan meta
+    rank_idx: int,
+    alts: list              # [{name, role, price, savings}] for the other two cards
+) -> str:
+    def _fallback() -> str:
+        return ranked_fallback(plan, demand, savings, headroom, rank_idx, alts)
+
+    # If no client/key, keep the friendly fallback
+    client = get_client()
+    if client is None:
+        return _fallback()
+
+    with span("generate_narrative_ranked", kind="llm") as rec:
+        cache = default_cache()
+        key = narrative_key(plan, demand, savings, headroom, rank_idx, alts)
+        cached = cache.get(key)
+        if cached:
+            rec["cache_hit"] = True
+            return cached
+
+        # ---------- Claude prompt ----------
+        system_msg, user_msg = _ranked_prompt(plan, demand, savings, headroom, rank_idx, alts)
+        try:
+            resp = default_guard().create(
+                client,
+                model=ANTHROPIC_MODEL,
+                max_tokens=160,
+                temperature=0.4,
+                system=system_blocks(system_msg),
+                messages=[{"role": "user", "content": user_msg}],
+            )
+            record_usage(rec, resp)
+            if getattr(resp, "content", None):
+                for block in resp.content:
+                    if getattr(block, "type", "") == "text":
+                        txt = getattr(block, "text", "").strip()
+                        if txt:
+                            cache.put(key, txt)  # only real LLM copy; fallbacks are free to rebuild
+                            return txt
+        except Exception as e:
+            rec["error"] = type(e).__name__
+        rec["fallback"] = True
+        return _fallback()
+
+def stream_narrative_ranked(plan: Plan, demand: Dict[str, Any], savings: int, headroom: float,
+                            rank_idx: int, alts: list) -> Iterator[str]:
+    """
+    Streaming twin of generate_narrative_ranked: yields text deltas.
+    A cached blurb comes back as a single chunk; errors propagate to the caller.
+    """
+    client = get_client()
+    if client is None:
+        return
+
+    with span("stream_narrative_ranked", kind="llm") as rec:
+        cache = default_cache()
+        key = narrative_key(plan, demand, savings, headroom, rank_idx, alts)
+        cached = cache.get(key)
+        if cached:
+            rec["cache_hit"] = True
+            yield cached
+            return
+
+        system_msg, user_msg = _ranked_prompt(plan, demand, savings, headroom, rank_idx, alts)
+        parts = []
+        t0 = time.perf_counter()
+        with default_guard().stream(
+            client,
+            model=ANTHROPIC_MODEL,
+            max_tokens=160,
+            temperature=0.4,
+            system=system_blocks(system_msg),
+            messages=[{"role": "user", "content": user_msg}],
+        ) as stream:
+            for delta in stream.text_stream:
+                if not parts:
+                    rec["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+                parts.append(delta)
+                yield delta
+            record_usage(rec, stream.get_final_message())
+        txt = "".join(parts).strip()
+        if txt:
+            cache.put(key, txt)
+        else:
+            rec["fallback"] = True
+
+def _batched_prompt(jobs: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """(system, user) messages narrating every card in one request; the need block is sent once."""
+    system_msg = (
+        "You write short plan blurbs for an ISP comparison page. "
+        "Your job is to DEFEND each card's ranking (Best match / Runner-up / Also consider) against the other cards. "
+        "Tone: positive, confident, helpful. 1–2 sentences per card. "
+        "NEVER suggest switching to a cheaper/faster plan or to look for another tier. "
+        "No markdown, no bullets, no hedging; explain why each plan is placed where it is, "
+        "referencing speed headroom, features (TV packs, mobile lines), and monthly economics. "
+        'Reply with exactly one JSON object per line, in card order: {"plan_id": "<id>", "blurb": "<text>"}. '
+        "No other text."
+    )
+    demand = jobs[0]["demand"]
+    payload = {
+        "user_need": {
+            "required_down": demand["required_down"],
+            "required_up": demand["required_up"],
+            "tv_interest": demand["tv_interest"],
+            "mobile_lines_need": demand.get("mobile_lines_need", 1),
+        },
+        "cards": [
+            {
+                "plan_id": job["plan"].id,
+                "role": role_label(job["rank_idx"]),
+                "plan": {
+                    "name": job["plan"].name,
+                    "price": job["plan"].base_price,
+                    "tech": job["plan"].tech,
+                    "down_mbps": job["plan"].down_mbps,
+                    "up_mbps": job["plan"].up_mbps,
+                    "includes_tv": job["plan"].includes_tv,
+                    "tv_packs": job["plan"].tv_packs,
+                    "mobile_lines_included": job["plan"].mobile_lines_included,
+                },
+                "metrics": {
+                    "headroom": round(job["headroom"], 2),
+                    "tv_match_count": tv_match_count(job["plan"], demand.get("tv_prefs", set())),
+                    "savings_vs_alacarte": int(round(job["savings"])),
+                },
+            }
+            for job in jobs
+        ],
+    }
+    return system_msg, "Write the blurb for each card:\n" + compact_json(payload)
+
+def _parse_batched(text: str, wanted: Dict[str, int]) -> Dict[int, str]:
+    """
+    {job idx: blurb} from a batched reply. Accepts the requested JSON lines and,
+    failing that, one JSON array / {plan_id: blurb} object. Unknown ids,
+    duplicates and empty blurbs are dropped (those cards fall back).
+    """
+    def _take(obj: Any, out: Dict[int, str]) -> None:
+        if isinstance(obj, dict) and "plan_id" in obj:
+            obj = {obj.get("plan_id"): obj.get("blurb")}
+        if isinstance(obj, list):
+            for item in obj:
+                _take(item, out)
+            return
+        if not isinstance(obj, dict):
+            return
+        for pid, blurb in obj.items():
+            idx = wanted.get(pid)
+            if idx is not None and idx not in out and isinstance(blurb, str) and blurb.strip():
+                out[idx] = blurb.strip()
+
+    out: Dict[int, str] = {}
+    for line in text.splitlines():
+        line = line.strip().rstrip(",")
+        if line.startswith("{"):
+            try:
+                _take(json.loads(line), out)
+            except ValueError:
+                pass
+    if len(out) < len(wanted):
+        blob = text.strip().strip("`")
+        blob = blob[4:] if blob.startswith("json") else blob
+        try:
+            _take(json.loads(blob), out)
+        except ValueError:
+            pass
+    return out
+
+def stream_narrative_batched(jobs: List[Dict[str, Any]]) -> Iterator[Tuple[int, str]]:
+    """
+    Narrate every card with ONE streamed request; yields (job idx, blurb) as each
+    card's JSON line completes. Cached cards come back first and are left out of
+    the request; cards the reply never (validly) covers are simply not yielded.
+    Errors propagate to the caller.
+    """
+    client = get_client()
+    if client is None or not jobs:
+        return
+
+    cache = default_cache()
+    keys = [narrative_key(**job) for job in jobs]
+    todo = []
+    for idx, key in enumerate(keys):
+        cached = cache.get(key)
+        if cached:
+            yield idx, cached
+        else:
+            todo.append(idx)
+    if not todo:
+        return
+
+    with span("stream_narrative_batched", kind="llm", cards=len(todo)) as rec:
+        wanted = {jobs[i]["plan"].id: i for i in todo}
+        system_msg, user_msg = _batched_prompt([jobs[i] for i in todo])
+        done: Dict[int, str] = {}
+        parts, buf = [], ""
+
+        def _emit(text: str) -> Iterator[Tuple[int, str]]:
+            for idx, blurb in _parse_batched(text, wanted).items():
+                if idx not in done:
+                    done[idx] = blurb
+                    cache.put(keys[idx], blurb)
+                    yield idx, blurb
+
+        with default_guard().stream(
+            client,
+            model=ANTHROPIC_MODEL,
+            max_tokens=160 * len(todo),
+            temperature=0.4,
+            system=system_blocks(system_msg),
+            messages=[{"role": "user", "content": user_msg}],
+        ) as stream:
+            for delta in stream.text_stream:
+                parts.append(delta)
+                buf += delta
+                if "\n" in buf:
+                    complete, buf = buf.rsplit("\n", 1)
+                    yield from _emit(complete)
+            record_usage(rec, stream.get_final_message())
+        yield from _emit(buf)
+        if len(done) < len(todo):
+            yield from _emit("".join(parts))  # not line-delimited after all: parse the whole reply
+        rec["parsed"] = len(done)
+        if len(done) < len(todo):
+            rec["fallback"] = True
+
+# ---------- in-flight blurbs ----------
+def join_inflight(key: str) -> Tuple[Future, bool]:
+    """
+    (Future, True) when a blurb for `key` is already being generated in this
+    process (a speculation or another page's card), else (a new Future, False):
+    the caller now owns that blurb and must settle() it. Futures hold
+    Optional[str] (None = nothing usable) and leave the map once settled.
+    """
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            return fut, True
+        fut = _inflight[key] = Future()
+    fut.add_done_callback(lambda f: _drop_inflight(key, f))
+    return fut, False
+
+
+def _drop_inflight(key: str, fut: Future) -> None:
+    with _inflight_lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+
+
+def settle(fut: Future, value: Optional[str]) -> None:
+    try:
+        fut.set_result(value)
+    except InvalidStateError:
+        pass  # already settled
+
+
+def stream_cards(jobs: List[Dict[str, Any]], budget_s: float = NARRATIVE_BUDGET_S,
+                 prefetched: Optional[Dict[int, Future]] = None) -> Iterator[Tuple[int, str, bool]]:
+    """
+    Stream every card's blurb concurrently; yields (card idx, text so far, done).
+    Cards that error, come back empty or miss the deadline end on their fallback.
+
+    NARRATION_MODE=batch (default) narrates all cards in one request and each
+    card arrives whole as its JSON line completes; per_card streams one
+    request per card token by token. Cards in `prefetched` (card idx -> Future
+    of a speculative blurb, see isp_engine.prefetch), and cards whose blurb is
+    already in flight in this process (join_inflight), are taken from that
+    Future instead of a new request; the rest are registered in flight while
+    their request runs.
+    """
+    q: "queue.Queue[Tuple[int, Optional[str], Optional[bool]]]" = queue.Queue()
+
+    def _pump(idx: int, job: Dict[str, Any], fut: Future) -> None:
+        parts = []
+        try:
+            for delta in stream_narrative_ranked(**job):
+                parts.append(delta)
+                q.put((idx, delta, None))
+            q.put((idx, None, True))
+        except Exception:
+            q.put((idx, None, False))
+            parts = []
+        txt = "".join(parts).strip()
+        settle(fut, txt if txt and txt != ranked_fallback(**job) else None)
+
+    def _pump_batched(live: List[int]) -> None:
+        reported = set()
+        try:
+            for k, blurb in stream_narrative_batched([jobs[i] for i in live]):
+                q.put((live[k], blurb, None))
+                q.put((live[k], None, True))
+                reported.add(live[k])
+                settle(owned[live[k]], blurb)
+        except Exception:
+            pass
+        for idx in live:
+            if idx not in reported:
+                q.put((idx, None, False))  # not in the reply / unparseable -> this card falls back
+                settle(owned[idx], None)
+
+    def _deliver(idx: int, fut: Future) -> None:
+        txt = None if fut.cancelled() or fut.exception() is not None else fut.result()
+        if txt:
+            q.put((idx, txt, None))
+        q.put((idx, None, bool(txt)))
+
+    prefetched = dict(prefetched or {})
+    owned: Dict[int, Future] = {}
+    for idx, job in enumerate(jobs):
+        if idx not in prefetched:
+            fut, running = join_inflight(narrative_key(**job))
+            (prefetched if running else owned)[idx] = fut
+    for idx, fut in prefetched.items():
+        fut.add_done_callback(lambda f, idx=idx: _deliver(idx, f))
+    live = sorted(owned)
+
+    pool = get_narration_pool()
+    if NARRATION_MODE == "batch":
+        if live:
+            pool.submit(contextvars.copy_context().run, _pump_batched, live)
+    else:
+        for idx in live:
+            pool.submit(contextvars.copy_context().run, _pump, idx, jobs[idx], owned[idx])
+
+    texts = [""] * len(jobs)
+    pending = set(range(len(jobs)))
+    deadline = time.monotonic() + budget_s
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            idx, delta, ok = q.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if ok is None:
+            texts[idx] += delta
+            yield idx, texts[idx], False
+            continue
+        pending.discard(idx)
+        final = texts[idx].strip()
+        yield idx, (final if ok and final else ranked_fallback(**jobs[idx])), True
+
+    for idx in sorted(pending):
+        count_fallback("stream_narrative_ranked")  # missed the page deadline
+        yield idx, ranked_fallback(**jobs[idx]), True
+
+
+DOLLAR_RE = re.compile(r"\$(\d[\d,]*(?:\.\d+)?)")
+
+
+def dollar_amounts(text: str) -> List[float]:
+    """Every $ amount in `text`, in order ("$1,200" -> 1200.0)."""
+    return [float(m.group(1).replace(",", "")) for m in DOLLAR_RE.finditer(text)]
+
+
+def amounts_kept(text: str, draft: str) -> bool:
+    """True when every $ amount in `text` is one the draft states (the LLM may drop amounts, never change them)."""
+    return set(dollar_amounts(text)) <= set(dollar_amounts(draft))
+
+
+def _polish_request(prompt_text: str) -> Dict[str, Any]:
+    return dict(
+        model=ANTHROPIC_MODEL,
+        max_tokens=250,
+        temperature=0.3,
+        system=system_blocks(
+            "You are a concise, factual ISP helper. Answer clearly in 1–3 short paragraphs. "
+            "When dollar amounts are given in the prompt, keep them unchanged. "
+            "Avoid making up legal terms or guarantees."
+        ),
+        messages=[{"role": "user", "content": prompt_text}],
+    )
+
+
+def polish_reply(prompt_text: str) -> str:
+    """Chat reply polished by Claude (dollar amounts kept as given); the draft itself on any failure."""
+    client = get_client()
+    if client is None:
+        return prompt_text
+    with span("wrap_with_llm", kind="llm") as rec:
+        try:
+            resp = default_guard().create(client, **_polish_request(prompt_text))
+            record_usage(rec, resp)
+            for blk in getattr(resp, "content", []):
+                if getattr(blk, "type", "") == "text" and blk.text.strip():
+                    if amounts_kept(blk.text, prompt_text):
+                        return blk.text.strip()
+                    rec["error"] = "amounts_changed"
+                    break
+        except Exception as e:
+            rec["error"] = type(e).__name__
+        rec["fallback"] = True
+        return prompt_text
+
+
+def stream_polish(prompt_text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Streaming twin of polish_reply: yields (text so far, done). Text goes out a
+    whole word at a time and only once its $ amounts are checked against the
+    draft, so a changed number is never shown; on a changed amount or any
+    failure the last item is the draft itself.
+    """
+    client = get_client()
+    if client is None:
+        yield prompt_text, True
+        return
+    with span("stream_polish", kind="llm") as rec:
+        parts, shown = [], 0
+        t0 = time.perf_counter()
+        try:
+            with default_guard().stream(client, **_polish_request(prompt_text)) as stream:
+                for delta in stream.text_stream:
+                    parts.append(delta)
+                    text = "".join(parts).lstrip()
+                    cut = max(text.rfind(" "), text.rfind("\n"))   # the last word may still be growing
+                    if cut <= shown:
+                        continue
+                    if not amounts_kept(text[:cut], prompt_text):
+                        rec["error"] = "amounts_changed"
+                        break
+                    if not shown:
+                        rec["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+                    shown = cut
+                    yield text[:cut], False
+                else:
+                    record_usage(rec, stream.get_final_message())
+                    text = "".join(parts).strip()
+                    if text and amounts_kept(text, prompt_text):
+                        yield text, True
+                        return
+                    rec["error"] = "amounts_changed" if text else "empty"
+        except Exception as e:
+            rec["error"] = type(e).__name__
+        rec["fallback"] = True
+        yield prompt_text, True
@@ -0,0 +1,161 @@
+"""
+Two-tier cache for LLM plan narratives.
+
+A small in-process LRU (with TTL) sits in front of a SQLite table, so blurbs
+survive restarts and are shared by every session and worker process on the box.
+Expired rows are deleted when the cache opens and every NARRATIVE_CACHE_PURGE_EVERY
+puts, so the file stays bounded by what was written within one TTL.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+NARRATIVE_CACHE_PATH = os.getenv("NARRATIVE_CACHE_PATH", ".narrative_cache.sqlite3")
+NARRATIVE_CACHE_TTL_S = float(os.getenv("NARRATIVE_CACHE_TTL_S", str(7 * 24 * 3600)))
+NARRATIVE_CACHE_MAX_ITEMS = int(os.getenv("NARRATIVE_CACHE_MAX_ITEMS", "512"))
+NARRATIVE_CACHE_PURGE_EVERY = int(os.getenv("NARRATIVE_CACHE_PURGE_EVERY", "256"))   # puts between expired-row purges
+
+
+def json_default(o: Any) -> Any:
+    """json.dumps `default=` for engine values: sets (tv prefs) have no stable order, so they go out sorted."""
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError(f"not JSON serializable: {type(o).__name__}")
+
+
+def fingerprint(parts: Dict[str, Any]) -> str:
+    """Canonical hash of the inputs that shape a narrative (key order / set order independent)."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=json_default)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class NarrativeCache:
+    """LRU + TTL in memory, SQLite underneath. Disk errors degrade to cache misses."""
+
+    def __init__(self, path: Optional[str] = NARRATIVE_CACHE_PATH,
+                 ttl_s: float = NARRATIVE_CACHE_TTL_S,
+                 max_items: int = NARRATIVE_CACHE_MAX_ITEMS,
+                 purge_every: int = NARRATIVE_CACHE_PURGE_EVERY):
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self.purge_every = purge_every
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0          # served from memory
+        self.disk_hits = 0     # served from SQLite (then promoted to memory)
+        self.misses = 0
+        self.evictions = 0     # LRU overflow + expired entries dropped
+        self.purged = 0        # expired SQLite rows deleted
+        self._puts = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS narratives "
+                    "(key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS narratives_created ON narratives (created)")
+                self._db.commit()
+            except sqlite3.Error:
+                self._db = None  # memory-only is still better than nothing
+            self.purge()
+
+    # ---------- memory tier ----------
+    def _mem_put(self, key: str, created: float, text: str) -> None:
+        self._mem[key] = (created, text)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    # ---------- public API ----------
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                created, text = hit
+                if now - created <= self.ttl_s:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return text
+                del self._mem[key]
+                self.evictions += 1
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT text, created FROM narratives WHERE key = ? AND created >= ?",
+                        (key, now - self.ttl_s),
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row:
+                    self._mem_put(key, row[1], row[0])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, now, text)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO narratives (key, text, created) VALUES (?, ?, ?)",
+                        (key, text, now),
+                    )
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+            self._puts += 1
+            due = self.purge_every > 0 and self._puts % self.purge_every == 0
+        if due:
+            self.purge()
+
+    def purge(self) -> int:
+        """Delete SQLite rows older than the TTL (get() already ignores them); returns rows deleted."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            try:
+                n = self._db.execute("DELETE FROM narratives WHERE created < ?", (time.time() - self.ttl_s,)).rowcount
+                self._db.commit()
+            except sqlite3.Error:
+                return 0
+            self.purged += n
+            return n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "purged": self.purged,
+                "mem_items": len(self._mem),
+            }
+
+
+_default: Optional[NarrativeCache] = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> NarrativeCache:
+    """Process-wide cache (safe to call from worker threads, unlike st.cache_resource)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = NarrativeCache()
+        return _default
@@ -0,0 +1,115 @@
+"""
+Speculative card narration while the wizard is still in progress.
+
+After each late wizard step the partial answers (completed with the UI's
+preselected defaults) are ranked and the likely top-3 blurbs are generated in
+the background. Each blurb is a Future keyed by its narrative_key, i.e. by the
+exact inputs of the final card, so step 10 reuses a speculation only when the
+real card matches it; everything else is discarded. The Futures are shared
+through narration.join_inflight, so a blurb already being generated in this
+process (another step's speculation, another session's page) is never
+requested twice.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+from .narration import (
+    NARRATION_MODE, generate_narrative_ranked, get_client, get_narration_pool, join_inflight,
+    narrative_key, ranked_fallback, settle, stream_narrative_batched,
+)
+from .narrative_cache import default_cache
+from .results import build_cards, card_jobs
+from .telemetry import REGISTRY
+from .wizard import with_defaults
+
+PREFETCH_FROM_STEP = int(os.getenv("PREFETCH_FROM_STEP", "8"))   # speculate when moving to this step or later; 10 = off
+
+
+class NarrativePrefetcher:
+    """One per session: narrative_key -> Future[Optional[str]] (None = the LLM gave nothing usable)."""
+
+    def __init__(self):
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def speculate(self, partial: Dict[str, Any]) -> int:
+        """Start background blurbs for the likely cards; returns how many new ones were launched."""
+        if get_client() is None:
+            return 0
+        demand, cards = build_cards(with_defaults(partial))
+        jobs = card_jobs(demand, cards)
+        cache = default_cache()
+        new: List[Dict[str, Any]] = []
+        futures: List[Future] = []
+        with self._lock:
+            for job in jobs:
+                key = narrative_key(**job)
+                if key in self._futures or cache.get(key):
+                    continue  # already speculated, or step 10 will hit the narrative cache anyway
+                fut, running = join_inflight(key)
+                self._futures[key] = fut
+                if not running:
+                    new.append(job)
+                    futures.append(fut)
+        if not new:
+            return 0
+        self.launched += len(new)
+        REGISTRY.inc("isp_speculation_total", len(new), result="launched")
+        get_narration_pool().submit(contextvars.copy_context().run, _run, new, futures)
+        return len(new)
+
+    def claim(self, jobs: List[Dict[str, Any]]) -> Dict[int, Future]:
+        """
+        {card idx: Future} for the final cards that were speculated; every other
+        speculation is dropped (not cancelled: its Future may be shared, and its
+        blurb still lands in the narrative cache).
+        """
+        with self._lock:
+            out = {}
+            for idx, job in enumerate(jobs):
+                fut = self._futures.pop(narrative_key(**job), None)
+                if fut is not None:
+                    out[idx] = fut
+            hits, misses, stale = len(out), len(jobs) - len(out), len(self._futures)
+            self._futures.clear()
+        self.hits += hits
+        self.misses += misses
+        self.discarded += stale
+        for result, n in (("hit", hits), ("miss", misses), ("discarded", stale)):
+            if n:
+                REGISTRY.inc("isp_speculation_total", n, result=result)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        claimed = self.hits + self.misses
+        return {
+            "launched": self.launched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "hit_rate": round(self.hits / claimed, 3) if claimed else None,
+        }
+
+
+def _run(jobs: List[Dict[str, Any]], futures: List[Future]) -> None:
+    """Fill the futures (same request shape as step 10, so results also land in the narrative cache)."""
+    try:
+        if NARRATION_MODE == "batch":
+            for idx, blurb in stream_narrative_batched(jobs):
+                settle(futures[idx], blurb)
+        else:
+            for job, fut in zip(jobs, futures):
+                txt = generate_narrative_ranked(**job)
+                settle(fut, None if txt == ranked_fallback(**job) else txt)
+    except Exception:
+        pass
+    for fut in futures:
+        settle(fut, None)
+
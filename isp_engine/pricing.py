@@ -0,0 +1,130 @@
+"""À la carte vs bundle pricing (prices come from the current catalog snapshot)."""
+from typing import Dict, Any
+
+from .catalog import N_TV_MASKS, PRICE_TABLE_LINES, TV_PACK_BIT, CatalogSnapshot, Plan, current_catalog, mask_codes
+
+
+def internet_standalone_price(down_mbps: int) -> int:
+    return current_catalog().internet_price(down_mbps)
+
+def mobile_alacarte_total(n: int) -> int:
+    # Tiered per-line pricing
+    return n * current_catalog().mobile_rate(n)
+
+# Wizard TV preference label -> pack bit
+TV_PREF_BIT = {
+    "Live Sports (ESPN, Fox Sports, etc.)": TV_PACK_BIT["sports"],
+    "Premium channels (HBO, Showtime, Starz)": TV_PACK_BIT["premium"],
+    "Kids & Family (Disney, Nickelodeon, Cartoon Network)": TV_PACK_BIT["kids"],
+    "International/Spanish language": TV_PACK_BIT["intl"],
+    "News (CNN, Fox News, MSNBC, etc.)": TV_PACK_BIT["news"],
+    "Movies & Entertainment (TNT, USA, TBS, etc.)": TV_PACK_BIT["entertainment"],
+}
+
+def tv_prefs_mask(prefs) -> int:
+    m = 0
+    for label in prefs:
+        m |= TV_PREF_BIT.get(label, 0)
+    return m
+
+def demand_pref_mask(demand: Dict[str, Any]) -> int:
+    """The demand's TV preference mask (estimate_demand stores it; older dicts only carry the labels)."""
+    m = demand.get('tv_pref_mask')
+    return tv_prefs_mask(demand.get('tv_prefs', ())) if m is None else m
+
+_CODES_BY_MASK = tuple(frozenset(mask_codes(m)) for m in range(N_TV_MASKS))
+
+def map_tv_prefs_to_codes(prefs: set) -> set:
+    return set(_CODES_BY_MASK[tv_prefs_mask(prefs)])
+
+def tv_alacarte_total(prefs: set, want_dvr: bool = True) -> int:
+    return tv_alacarte_by_mask(current_catalog(), tv_prefs_mask(prefs), want_dvr)
+
+def tv_alacarte_by_mask(cat: CatalogSnapshot, mask: int, want_dvr: bool = True) -> int:
+    return cat.tv_base_price + cat.tv_addon_by_mask[mask] + (cat.dvr_price if want_dvr else 0)
+
+def bundle_vs_alacarte(plan: Plan, demand: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare 'as configured' bundle total for this plan vs buying services à la carte."""
+    cat = current_catalog()
+    n_lines = demand.get('mobile_lines_need', 1)
+    i = cat.plan_index.get(plan.id)
+    if i is None or cat.plans[i] is not plan or not 0 <= n_lines < PRICE_TABLE_LINES:
+        return reference_bundle_vs_alacarte(plan, demand)   # a plan from another catalog, or an unusual line count
+    table = cat.plan_prices[i]
+    want_tv = demand.get('tv_interest') in ["Yes, definitely", "Maybe, show me options"]
+    mask = demand_pref_mask(demand) if want_tv else 0
+
+    # À LA CARTE: minimal internet tier for the estimated need + mobile + TV
+    internet_price = cat.internet_price(demand.get('required_down', plan.down_mbps))
+    mobile_price = cat.mobile_alacarte_by_lines[n_lines]
+    tv_price = cat.tv_alacarte_by_mask[mask] if want_tv else 0
+    alacarte_total = internet_price + mobile_price + tv_price
+
+    # BUNDLE: base price + extra lines + TV add-ons, straight from this plan's tables
+    bundle_extra_mobile = table.extra_mobile[n_lines]
+    bundle_tv_addons = table.tv_addons[mask] if want_tv else 0
+    bundle_total = plan.base_price + bundle_extra_mobile + bundle_tv_addons
+
+    return {
+        "internet_price": internet_price,
+        "mobile_price": mobile_price,
+        "tv_price": tv_price,
+        "alacarte_total": alacarte_total,
+        "bundle_total": bundle_total,
+        "bundle_extra_mobile": bundle_extra_mobile,
+        "bundle_tv_addons": bundle_tv_addons,
+        "bundle_internet_credit": 0,   # removed (avoid double counting)
+        "savings": alacarte_total - bundle_total
+    }
+
+def reference_bundle_vs_alacarte(plan: Plan, demand: Dict[str, Any]) -> Dict[str, Any]:
+    """The pricing formula itself; bundle_vs_alacarte serves the same numbers from compiled tables."""
+
+    cat = current_catalog()
+    n_lines = demand.get('mobile_lines_need', 1)
+    want_tv = demand.get('tv_interest') in ["Yes, definitely", "Maybe, show me options"]
+    mask = demand_pref_mask(demand)
+
+    # À LA CARTE (buy everything separately)
+    # Use the minimal internet tier that meets the user's estimated need.
+    need_speed = demand.get('required_down', plan.down_mbps)
+    internet_price = cat.internet_price(need_speed)
+    mobile_price = n_lines * cat.mobile_rate(n_lines)
+    tv_price = tv_alacarte_by_mask(cat, mask) if want_tv else 0
+    alacarte_total = internet_price + mobile_price + tv_price
+
+    # BUNDLE (what you'd pay with this specific plan)
+    # IMPORTANT: no separate "internet credit" — the discount is already reflected
+    # in the bundle mobile per-line rate and (if applicable) bundle TV pricing.
+    bundle_total = plan.base_price
+
+    # Extra mobile lines beyond the plan's included lines → use bundle rate
+    extra_lines = max(0, n_lines - plan.mobile_lines_included)
+    bundle_extra_mobile = extra_lines * cat.bundle_mobile_per_line
+    bundle_total += bundle_extra_mobile
+
+    # TV at bundle pricing
+    bundle_tv_addons = 0
+    if want_tv:
+        if plan.includes_tv:
+            bundle_tv_addons += cat.bundle_tv_addon_by_mask[mask & ~plan.pack_mask]   # requested packs it lacks
+            if not plan.dvr_included:
+                bundle_tv_addons += cat.bundle_dvr_price
+        else:
+            bundle_tv_addons += cat.bundle_tv_base_price
+            bundle_tv_addons += cat.bundle_tv_addon_by_mask[mask]
+            bundle_tv_addons += cat.bundle_dvr_price
+        bundle_total += bundle_tv_addons
+
+    savings = alacarte_total - bundle_total
+    return {
+        "internet_price": internet_price,
+        "mobile_price": mobile_price,
+        "tv_price": tv_price,
+        "alacarte_total": alacarte_total,
+        "bundle_total": bundle_total,
+        "bundle_extra_mobile": bundle_extra_mobile,
+        "bundle_tv_addons": bundle_tv_addons,
+        "bundle_internet_credit": 0,   # removed (avoid double counting)
+        "savings": savings
+    }
@@ -0,0 +1,304 @@
+"""
+Precomputed top-3 recommendations for every reachable wizard profile.
+
+Every wizard answer comes from a small fixed option list, so the answers that
+can reach the ranking form a finite space. Each profile is packed into a
+mixed-radix integer code:
+
+    people(4) x peak activities(2^6) x reliability(4) x devices(4)
+      x tv(1 + 2^6: off, or on with a prefs mask) x mobile lines(4)
+
+Household type only matters through the step-1 skip, and home size and
+streaming never reach the score, so those answers collapse onto the same
+code. The build enumerates the wizard's reachable branches, ranks every
+distinct code once and writes a flat, memory-mapped table of catalog
+indices (one row per code). Lookups are O(1) plus rebuilding
+`score_plan` meta for the three plans returned. The header carries the
+catalog and engine hashes, and a stale table is ignored (callers fall back
+to the live engine). The default table is re-opened when the file is rebuilt
+or the catalog reloaded.
+
+    python -m isp_engine.reco_table build [--out reco_table.bin] [--processes N]
+    python -m isp_engine.reco_table info
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import catalog, scoring, wizard
+
+RECO_TABLE_PATH = os.getenv("RECO_TABLE_PATH", "reco_table.bin")
+RECO_TABLE_CHECK_S = float(os.getenv("RECO_TABLE_CHECK_S", "2"))   # how often to stat the file for a rebuild
+TOP_K = 3
+_MAGIC = "isp-reco-table/1"
+_HEADER_SIZE = 4096
+
+_PEOPLE = wizard.PEOPLE_OPTIONS
+_PEAK = wizard.PEAK_OPTIONS
+_RELIABILITY = wizard.RELIABILITY_OPTIONS
+_DEVICES = wizard.DEVICES_OPTIONS
+_TV_PREFS = wizard.TV_PREF_OPTIONS
+_LINES = wizard.MOBILE_LINES_OPTIONS
+
+# (field, radix), least-significant first
+_RADIX = [
+    ("people", len(_PEOPLE)),
+    ("peak", 1 << len(_PEAK)),
+    ("reliability", len(_RELIABILITY)),
+    ("devices", len(_DEVICES)),
+    ("tv", 1 + (1 << len(_TV_PREFS))),
+    ("lines", len(_LINES)),
+]
+N_CODES = 1
+for _, _r in _RADIX:
+    N_CODES *= _r
+
+
+# every module the ranked order depends on: catalog compilation (pack masks, price
+# tables), pricing, scoring, the search/vector rankers (pruning, tie-breaks), wizard options
+_ENGINE_MODULES = ("catalog", "pricing", "scoring", "search", "vector", "wizard")
+
+
+def engine_hash() -> str:
+    """Ranking code changes invalidate the table just like catalog changes."""
+    h = hashlib.sha256()
+    for name in _ENGINE_MODULES:
+        # located, not imported: vector pulls in numpy
+        with open(importlib.util.find_spec(f"{__package__}.{name}").origin, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+# =========================
+# Profile <-> code
+# =========================
+def _mask(selected, options: List[str]) -> Optional[int]:
+    m = 0
+    for item in selected:
+        if item not in options:
+            return None
+        m |= 1 << options.index(item)
+    return m
+
+
+def encode_profile(resp: Dict[str, Any]) -> Optional[int]:
+    """Packed code for a responses dict (same defaults as estimate_demand); None if off the option lists."""
+    try:
+        people = _PEOPLE.index(resp.get("household", {}).get("people", "Just me"))
+        reliability = _RELIABILITY.index(resp.get("reliability", "Moderate"))
+        devices = _DEVICES.index(resp.get("devices", "1–5 devices"))
+        lines = _LINES.index(resp.get("mobile_lines", "1 line (~$55/month)"))
+    except ValueError:
+        return None
+    peak = _mask(resp.get("evening", []), _PEAK)
+    if peak is None:
+        return None
+    tv = 0
+    if resp.get("tv_interest", "No, streaming only") in wizard.TV_WANTED:
+        prefs = _mask(resp.get("tv_prefs", []), _TV_PREFS)
+        if prefs is None:
+            return None
+        tv = 1 + prefs
+
+    return _pack(people=people, peak=peak, reliability=reliability, devices=devices, tv=tv, lines=lines)
+
+
+def _pack(**vals: int) -> int:
+    code = 0
+    for field, radix in reversed(_RADIX):
+        code = code * radix + vals[field]
+    return code
+
+
+def decode_profile(code: int) -> Dict[str, Any]:
+    """A canonical responses dict for `code` (collapsed answers take their first option)."""
+    vals = {}
+    for field, radix in _RADIX:
+        code, vals[field] = divmod(code, radix)
+    resp: Dict[str, Any] = {
+        "household": {"people": _PEOPLE[vals["people"]], "type": "Family with kids"},
+        "evening": [o for i, o in enumerate(_PEAK) if vals["peak"] >> i & 1],
+        "reliability": _RELIABILITY[vals["reliability"]],
+        "devices": _DEVICES[vals["devices"]],
+        "home_size": wizard.HOME_SIZE_OPTIONS[0],
+        "tv_interest": "Yes, definitely" if vals["tv"] else "No, streaming only",
+        "streaming": wizard.STREAMING_OPTIONS[-1],
+        "mobile_lines": _LINES[vals["lines"]],
+    }
+    if vals["tv"]:
+        resp["tv_prefs"] = [o for i, o in enumerate(_TV_PREFS) if (vals["tv"] - 1) >> i & 1]
+    return resp
+
+
+def reachable_codes() -> List[int]:
+    """Walk the wizard's branches (step-1 skip, step-6 TV branch) and collect every distinct code."""
+    people_peak = set()
+    for p, people in enumerate(_PEOPLE):
+        for hh_type in wizard.HOUSEHOLD_TYPE_OPTIONS:
+            if wizard.skips_peak_step(people, hh_type):
+                people_peak.add((p, 0))  # step 2 never asked -> no peak activities
+            else:
+                people_peak.update((p, m) for m in range(1 << len(_PEAK)))
+
+    tv_values = set()
+    for tv_interest in wizard.TV_INTEREST_OPTIONS:
+        if tv_interest in wizard.TV_WANTED:
+            tv_values.update(1 + m for m in range(1 << len(_TV_PREFS)))  # step 7 asked
+        else:
+            tv_values.add(0)
+
+    return sorted(
+        _pack(people=p, peak=peak, reliability=r, devices=d, tv=tv, lines=n)
+        for p, peak in people_peak
+        for r in range(len(_RELIABILITY))
+        for d in range(len(_DEVICES))
+        for tv in tv_values
+        for n in range(len(_LINES))
+    )
+
+
+# =========================
+# Build
+# =========================
+def _rank_codes(codes: List[int]) -> List[List[int]]:
+    index = {id(p): i for i, p in enumerate(catalog.PLAN_CATALOG)}
+    out = []
+    for code in codes:
+        ranked, _ = scoring.rank_plans(decode_profile(code), top_k=TOP_K, use_table=False)
+        out.append([index[id(p)] for p, _, _ in ranked])
+    return out
+
+
+def build(path: str = RECO_TABLE_PATH, processes: Optional[int] = None) -> Dict[str, Any]:
+    n_plans = len(catalog.PLAN_CATALOG)
+    width = 1 if n_plans < 0xFF else 2
+    empty = (1 << (8 * width)) - 1
+    codes = reachable_codes()
+
+    from multiprocessing import Pool  # build-only; keeps lookups cheap to import
+
+    t0 = time.perf_counter()
+    chunks = [codes[i:i + 4096] for i in range(0, len(codes), 4096)]
+    body = bytearray(b"\xff" * (N_CODES * TOP_K * width))
+    with Pool(processes) as pool:
+        for chunk, rows in zip(chunks, pool.imap(_rank_codes, chunks)):
+            for code, row in zip(chunk, rows):
+                off = code * TOP_K * width
+                for j in range(TOP_K):
+                    idx = row[j] if j < len(row) else empty
+                    body[off + j * width: off + (j + 1) * width] = idx.to_bytes(width, "little")
+
+    header = {
+        "magic": _MAGIC,
+        "catalog_hash": catalog.catalog_hash(),
+        "engine_hash": engine_hash(),
+        "radix": _RADIX,
+        "top_k": TOP_K,
+        "width": width,
+        "n_plans": n_plans,
+        "n_codes": N_CODES,
+        "n_reachable": len(codes),
+        "built_at": int(time.time()),
+    }
+    raw = json.dumps(header).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw.ljust(_HEADER_SIZE, b" "))
+        f.write(body)
+    os.replace(tmp, path)  # readers never see a half-written table
+    header["build_s"] = round(time.perf_counter() - t0, 1)
+    return header
+
+
+# =========================
+# Lookup
+# =========================
+class RecoTable:
+    """Read-only, memory-mapped view of a built table."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = json.loads(self._mm[:_HEADER_SIZE].decode("utf-8"))
+        self._width = self.header["width"]
+        self._k = self.header["top_k"]
+        self._empty = (1 << (8 * self._width)) - 1
+
+    def is_fresh(self) -> bool:
+        h = self.header
+        return (h.get("magic") == _MAGIC and h.get("radix") == [list(r) for r in _RADIX]
+                and h.get("catalog_hash") == catalog.catalog_hash()
+                and h.get("engine_hash") == engine_hash())
+
+    def lookup(self, resp: Dict[str, Any]) -> Optional[List[int]]:
+        """Catalog indices of the top plans for `resp` (best first), or None if not in the table."""
+        code = encode_profile(resp)
+        if code is None:
+            return None
+        w = self._width
+        off = _HEADER_SIZE + code * self._k * w
+        row = self._mm[off: off + self._k * w]
+        return [i for i in (int.from_bytes(row[j * w:(j + 1) * w], "little") for j in range(self._k))
+                if i != self._empty]
+
+
+_default: Optional[RecoTable] = None
+_default_key: Optional[Tuple[Optional[int], str]] = None   # (file mtime, catalog hash) _default was opened for
+_default_mtime: Optional[int] = None
+_next_stat = 0.0
+_default_lock = threading.Lock()
+
+
+def default_table() -> Optional[RecoTable]:
+    """
+    The table at RECO_TABLE_PATH if it exists and matches the current
+    catalog/engine, else None. Re-opened when the file changes (a rebuild;
+    looked for every RECO_TABLE_CHECK_S) or the catalog is reloaded.
+    """
+    global _default, _default_key, _default_mtime, _next_stat
+    now = time.monotonic()
+    with _default_lock:
+        if now >= _next_stat:
+            _next_stat = now + RECO_TABLE_CHECK_S
+            try:
+                _default_mtime = os.stat(RECO_TABLE_PATH).st_mtime_ns
+            except OSError:
+                _default_mtime = None
+        key = (_default_mtime, catalog.catalog_hash())
+        if key != _default_key:
+            _default_key = key
+            try:
+                table = RecoTable(RECO_TABLE_PATH) if _default_mtime is not None else None
+            except (OSError, ValueError):
+                table = None
+            _default = table if table is not None and table.is_fresh() else None
+        return _default
+
+
+def _main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="enumerate the answer space and write the table")
+    b.add_argument("--out", default=RECO_TABLE_PATH)
+    b.add_argument("--processes", type=int, default=None)
+    i = sub.add_parser("info", help="print the table header and whether it is fresh")
+    i.add_argument("--path", default=RECO_TABLE_PATH)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        print(json.dumps(build(args.out, args.processes), indent=2))
+    else:
+        table = RecoTable(args.path)
+        print(json.dumps({**table.header, "fresh": table.is_fresh()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""Results-page model: the top cards for a completed wizard and their narration inputs."""
+from typing import Any, Dict, List, Tuple
+
+from .pricing import bundle_vs_alacarte
+from .scoring import rank_plans, role_label
+
+
+def build_cards(responses: Dict[str, Any], top_k: int = 3) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """(demand, cards): each card is {plan, score, meta, cost} for one of the top plans."""
+    ranked, demand = rank_plans(responses, top_k=top_k)
+    cards = []
+    for (p, sc, meta) in ranked[:top_k]:
+        c = bundle_vs_alacarte(p, demand)
+        cards.append({"plan": p, "score": sc, "meta": meta, "cost": c})
+    return demand, cards
+
+
+def alt_overview(cards: List[Dict[str, Any]], exclude_idx: int) -> List[Dict[str, Any]]:
+    """The other cards, as referenced by one card's blurb."""
+    alts = []
+    for j, item in enumerate(cards):
+        if j == exclude_idx:
+            continue
+        q = item["plan"]
+        alts.append({
+            "name": q.name,
+            "role": role_label(j),
+            "price": q.base_price,
+            "savings": int(round(item["cost"]["savings"]))
+        })
+    return alts
+
+
+def card_jobs(demand: Dict[str, Any], cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ranking-aware narrative inputs (Claude or fallback), one job per card."""
+    return [
+        {
+            "plan": item["plan"],
+            "demand": demand,
+            "savings": int(round(item["cost"]["savings"])),
+            "headroom": float(item["meta"].get("headroom", 0.0)),
+            "rank_idx": idx,
+            "alts": alt_overview(cards, idx),
+        }
+        for idx, item in enumerate(cards)
+    ]
@@ -0,0 +1,238 @@
+"""Demand estimation, plan scoring and ranking."""
+from typing import Callable, List, Dict, Any, Tuple, Optional
+
+from .catalog import TV_PACK_BIT, Plan, current_catalog
+from .pricing import bundle_vs_alacarte, tv_prefs_mask
+
+
+# =========================
+# Demand Estimation & Scoring
+# =========================
+def estimate_demand(resp: Dict[str, Any]) -> Dict[str, Any]:
+    """Estimate required Mbps with realistic concurrency and device overhead."""
+    # People / devices
+    people = resp.get("household", {}).get("people", "Just me")
+    ppl_map = {"Just me": 1, "2 people": 2, "3–4 people": 4, "5+ people": 5}
+    n_people = ppl_map.get(people, 1)
+
+    devices_choice = resp.get("devices", "1–5 devices")
+    dev_map = {"1–5 devices": 5, "6–10 devices": 10, "11–15 devices": 15, "15+ devices": 20}
+    n_devices = dev_map.get(devices_choice, 5)
+
+    peak = set(resp.get("evening", []))
+    reliability_text = resp.get("reliability", "Moderate")
+    size = resp.get("home_size", "Small (1–2 bedrooms)")
+    tv_interest = resp.get("tv_interest", "No, streaming only")
+    tv_prefs = set(resp.get("tv_prefs", []))
+    streaming_now = resp.get("streaming", "No")
+    lines_choice = resp.get("mobile_lines", "1 line (~$55/month)")
+
+    # Base + device overhead (light traffic)
+    est = 3 * n_people + max(0, n_devices - 5) * 0.6
+
+    # Peak activities (concurrent)
+    if "Streaming video (Netflix, YouTube, etc.)" in peak:
+        est += 7 * min(n_people, 3)                # ~1080p streams
+    if "Video calls/conferencing" in peak:
+        est += 3 * min(n_people, 2)                # Zoom/Teams 720p
+    if "Online gaming" in peak:
+        est += 2                                   # bw small; latency matters
+    if "Multiple people doing different things at once" in peak:
+        est += 6
+    if "Downloading large files" in peak:
+        est += 15                                  # allowance for bursts
+    if "Smart home devices actively used" in peak:
+        est += min(6, 0.4 * max(0, n_devices - 5))
+
+    # Reliability / latency flags
+    needs_low_latency = ("Online gaming" in peak) or reliability_text.startswith("Critical")
+    high_reliability = reliability_text in [
+        "Critical (work from home) – I need guaranteed uptime",
+        "Very important",
+    ]
+
+    # Buffering: more if high reliability
+    buffer = 1.4 if high_reliability else 1.2
+    required_down = int(max(25, round(est * buffer)))
+    required_up = 20 if high_reliability else (10 if "Video calls/conferencing" in peak else 5)
+
+    return {
+        "n_people": n_people,
+        "n_devices": n_devices,
+        "required_down": required_down,
+        "required_up": required_up,
+        "needs_low_latency": needs_low_latency,
+        "high_reliability": high_reliability,
+        "size": size,
+        "tv_interest": tv_interest,
+        "tv_prefs": tv_prefs,
+        "tv_pref_mask": tv_prefs_mask(tv_prefs),
+        "streaming_now": streaming_now,
+        "mobile_lines_need": int(lines_choice.split()[0].replace("+","").replace("line","").strip()) if lines_choice else 1,
+    }
+
+# ---------- Score terms ----------
+# score_plan is the sum of these terms, in this order. Each term reads only the
+# demand fields listed next to it, so isp_engine.whatif can re-score just the
+# terms a what-if tweak touches. A term returns (points, reasons); points are
+# added one at a time so the float sum matches the NumPy kernel exactly.
+FEASIBILITY_INPUTS = ("required_up", "required_down")
+
+
+def infeasible_meta(plan: Plan, d: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The -1e9 meta if `plan` misses a hard requirement, else None."""
+    if plan.up_mbps < d["required_up"]:
+        return {"reasons": ["Upload speed too low for your needs."], "headroom": 0.0}
+    headroom = plan.down_mbps / max(1, d["required_down"])
+    if headroom < 1.0:
+        return {"reasons": ["Not enough download speed for your estimated need."], "headroom": headroom}
+    return None
+
+
+def _headroom_term(plan: Plan, d: Dict[str, Any]) -> Tuple[Tuple[float, ...], List[str]]:
+    # Reward ~1.2–2.5×, penalize big overkill
+    headroom = plan.down_mbps / max(1, d["required_down"])
+    if 1.2 <= headroom <= 2.5:
+        return (38,), [f"Speed headroom in the sweet spot (~{headroom:.1f}× of your need)."]
+    if headroom < 1.2:
+        # 1.0–1.2×: usable but little cushion (0..24 points)
+        return (24 * (headroom - 1.0) / 0.2,), [f"Just meets your need (~{headroom:.1f}×)."]
+    if headroom <= 3.5:
+        # 2.5–3.5×: mild overprovisioning (gently decreasing)
+        return (34 - 8 * (headroom - 2.5),), [f"More headroom than necessary (~{headroom:.1f}×)."]
+    # >3.5×: strong penalty (still possible to win via price/features)
+    return (20 - 6 * (headroom - 3.5),), [f"Significantly over-provisioned (~{headroom:.1f}×)."]
+
+
+def _reliability_term(plan: Plan, d: Dict[str, Any]) -> Tuple[Tuple[float, ...], List[str]]:
+    if d["needs_low_latency"] or d["high_reliability"]:
+        if plan.tech == "fiber":
+            return (8,), ["Fiber helps with latency and reliability."]
+        return (-5,), ["Non-fiber may have more variable latency."]
+    # small bump for gig fiber when not strictly required
+    if plan.tech == "fiber" and plan.down_mbps >= 1000:
+        return (2,), []
+    return (), []
+
+
+def _tv_term(plan: Plan, d: Dict[str, Any]) -> Tuple[Tuple[float, ...], List[str]]:
+    want_tv = d["tv_interest"] in ["Yes, definitely", "Maybe, show me options"]
+    if not want_tv:
+        if plan.includes_tv:
+            return (-8,), ["Includes TV you may not need (streaming-only choice)."]
+        return (), []
+    if not plan.includes_tv:
+        return (-12,), ["No TV included, but you asked to see TV options."]
+    matched = plan.pack_mask & d["tv_pref_mask"]
+    if not matched:
+        return (8, 0), ["Includes TV service as requested."]
+    return (8, 2 * matched.bit_count()), [
+        "Includes TV service as requested.",
+        f"TV packs aligned: {', '.join(p for p in plan.tv_packs if TV_PACK_BIT[p] & matched)}.",
+    ]
+
+
+def _mobile_term(plan: Plan, d: Dict[str, Any]) -> Tuple[Tuple[float, ...], List[str]]:
+    # Single weighting
+    need_lines = d["mobile_lines_need"]
+    if plan.mobile_lines_included >= need_lines and need_lines > 0:
+        return (10,), [f"Includes {plan.mobile_lines_included} mobile line(s) you need."]
+    if plan.mobile_lines_included > 0:
+        return (5,), ["Includes some mobile lines (you can add more)."]
+    if need_lines >= 3:
+        return (-8,), ["Plan includes no mobile lines but you need several."]
+    return (), []
+
+
+def _economics_term(plan: Plan, d: Dict[str, Any]) -> Tuple[Tuple[float, ...], List[str]]:
+    # Use the AS-CONFIGURED monthly total for this user
+    cost = bundle_vs_alacarte(plan, d)
+    monthly_total = cost["bundle_total"]
+    save = int(round(cost["savings"]))
+    return (
+        max(0, 35 - monthly_total / 9.0),        # single, gentle price anchor on actual monthly total
+        max(-12, min(12, save / 8.0)),           # relative economics vs à la carte (±12 max)
+    ), [
+        f"As-configured monthly total about ${monthly_total}/mo.",
+        f"Estimated {save:+.0f}$/mo vs buying separately.",
+    ]
+
+
+# (name, term, demand fields it reads)
+SCORE_TERMS: List[Tuple[str, Callable[[Plan, Dict[str, Any]], Tuple[Tuple[float, ...], List[str]]], Tuple[str, ...]]] = [
+    ("headroom", _headroom_term, ("required_down",)),
+    ("reliability", _reliability_term, ("needs_low_latency", "high_reliability")),
+    ("tv", _tv_term, ("tv_interest", "tv_pref_mask")),
+    ("mobile", _mobile_term, ("mobile_lines_need",)),
+    ("economics", _economics_term, ("mobile_lines_need", "tv_interest", "tv_pref_mask", "required_down")),
+]
+_TERM_FUNCS = tuple(term for _, term, _ in SCORE_TERMS)
+
+
+def score_plan(plan: Plan, d: Dict[str, Any], resp: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:  # noqa: D401
+    """Return (score, meta). Higher is better."""
+    # --- Hard requirements ---
+    failed = infeasible_meta(plan, d)
+    if failed is not None:
+        return -1e9, failed
+
+    score = 0.0
+    reasons: List[str] = []
+    for term in _TERM_FUNCS:
+        points, why = term(plan, d)
+        for pts in points:
+            score += pts
+        reasons.extend(why)
+    return score, {"reasons": reasons, "headroom": plan.down_mbps / max(1, d["required_down"])}
+
+# Catalogs at least this big are scored by the NumPy kernel (isp_engine.vector)
+VECTOR_MIN_PLANS = 256
+
+def rank_plans(resp: Dict[str, Any], top_k: Optional[int] = None,
+               catalog: Optional[List[Plan]] = None,
+               use_table: bool = True) -> Tuple[List[Tuple[Plan, float, Dict[str, Any]]], Dict[str, Any]]:
+    demand = estimate_demand(resp)
+
+    # Precomputed answer-space table (isp_engine.reco_table): O(1) lookup of the top plans
+    if use_table and catalog is None and top_k is not None:
+        from .reco_table import TOP_K, default_table
+        table = default_table() if top_k <= TOP_K else None
+        hit = table.lookup(resp) if table is not None else None
+        if hit is not None:
+            plans = current_catalog().plans
+            out = []
+            for i in hit[:top_k]:
+                sc, meta = score_plan(plans[i], demand, resp)
+                out.append((plans[i], sc, meta))
+            return out, demand
+
+    catalog = current_catalog().plans if catalog is None else catalog
+    if len(catalog) >= VECTOR_MIN_PLANS:
+        try:
+            from .vector import rank_catalog
+        except ImportError:  # numpy not installed -> plain loop
+            pass
+        else:
+            return rank_catalog(catalog, demand, resp, top_k=top_k), demand
+
+    # Speed index skips infeasible plans; upper bounds prune plans that can't make the top k
+    from .search import top_k_plans
+    return top_k_plans(catalog, demand, resp, top_k), demand
+
+def role_label(idx: int) -> str:
+    return {0: "Best match", 1: "Runner-up", 2: "Also consider"}.get(idx, "Option")
+
+def headroom_phrase(h: float) -> str:
+    if h < 1.2:   return "meets your need with a small cushion"
+    if h <= 2.5:  return f"gives a comfortable ~{h:.1f}× cushion"
+    return f"provides extra headroom (~{h:.1f}×) for busy periods"
+
+def economy_phrase(s: int) -> str:
+    if s >= 5:    return f"saves about ${s}/mo versus buying separately"
+    if s >= -5:   return "costs about the same as buying separately"
+    return f"is within ${abs(s)}/mo of buying separately but consolidates into one bill and includes bundle perks"
+
+def tv_match_count(plan: Plan, prefs) -> int:
+    """Packs of `plan` the household asked for; `prefs` is a pref mask or the wizard's labels."""
+    wanted = prefs if isinstance(prefs, int) else tv_prefs_mask(prefs)
+    return (plan.pack_mask & wanted).bit_count()
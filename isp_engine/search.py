@@ -0,0 +1,174 @@
+"""
+Feasibility index and bounded top-k search for the plain-Python ranking path.
+
+`CatalogIndex` keeps the catalog sorted by download speed, so the plans that
+clear the demand's download need are one bisect away and plans that fail
+either hard requirement are never scored. `top_k_plans` then orders the
+feasible plans by an upper bound on their score (per term: headroom curve
+maximum, the exact reliability / TV / mobile points, and price-anchor and
+savings caps from the plan's base price) and scores them best-first, stopping
+as soon as no remaining bound can reach the current k-th score. Output equals
+the exhaustive loop in scoring.rank_plans exactly, ties included.
+
+    python -m isp_engine.search       # parity check + timing against the exhaustive loop
+"""
+import random
+import sys
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .catalog import Plan, current_catalog
+from .pricing import tv_alacarte_by_mask, internet_standalone_price, mobile_alacarte_total
+from .scoring import score_plan
+
+HEADROOM_MAX = 38.0            # scoring._headroom_term peaks in the 1.2–2.5× sweet spot
+_BOUND_SLACK = 1e-9            # bounds add terms in a different order than score_plan
+BOUNDED_MIN_FEASIBLE = 16      # below this, scoring every feasible plan beats computing bounds
+
+
+class CatalogIndex:
+    """Plans sorted by download speed, with the per-plan parts of the score bound precomputed."""
+
+    def __init__(self, plans: Sequence[Plan]):
+        self.plans = plans
+        order = sorted(range(len(plans)), key=lambda i: plans[i].down_mbps)
+        self.order = order
+        self.downs = [plans[i].down_mbps for i in order]
+        self.ups = [plans[i].up_mbps for i in order]
+        # ceiling of the price anchor: the bundle total is never below the base price
+        self.anchor_ub = [max(0, 35 - plans[i].base_price / 9.0) for i in order]
+
+    def __len__(self) -> int:
+        return len(self.plans)
+
+    def feasible(self, d: Dict[str, Any]) -> List[int]:
+        """Positions (in speed order) of the plans meeting both hard requirements."""
+        start = bisect_left(self.downs, max(1, d["required_down"]))
+        need_up = d["required_up"]
+        ups = self.ups
+        return [j for j in range(start, len(ups)) if ups[j] >= need_up]
+
+
+_cached: Optional[CatalogIndex] = None
+_cached_src: Optional[Sequence[Plan]] = None
+
+
+def catalog_index(plans: Sequence[Plan]) -> CatalogIndex:
+    """Index for `plans`, rebuilt only when a different (or resized) catalog comes in."""
+    global _cached, _cached_src
+    if _cached is None or _cached_src is not plans or len(_cached) != len(plans):
+        _cached, _cached_src = CatalogIndex(plans), plans
+    return _cached
+
+
+def _upper_bound(plan: Plan, anchor_ub: float, d: Dict[str, Any], want_tv: bool, alacarte: int) -> float:
+    """A score no lower than score_plan(plan, d) for a feasible plan."""
+    ub = HEADROOM_MAX + anchor_ub
+    # reliability (exact)
+    if d["needs_low_latency"] or d["high_reliability"]:
+        ub += 8 if plan.tech == "fiber" else -5
+    elif plan.tech == "fiber" and plan.down_mbps >= 1000:
+        ub += 2
+    # TV (every pack matching)
+    if want_tv:
+        ub += 8 + 2 * plan.pack_mask.bit_count() if plan.includes_tv else -12
+    elif plan.includes_tv:
+        ub -= 8
+    # mobile (exact)
+    need_lines = d["mobile_lines_need"]
+    if plan.mobile_lines_included >= need_lines and need_lines > 0:
+        ub += 10
+    elif plan.mobile_lines_included > 0:
+        ub += 5
+    elif need_lines >= 3:
+        ub -= 8
+    # savings vs à la carte: the bundle costs at least the base price
+    ub += max(-12, min(12, round(alacarte - plan.base_price) / 8.0))
+    return ub + _BOUND_SLACK
+
+
+def top_k_plans(plans: Sequence[Plan], d: Dict[str, Any], resp: Dict[str, Any],
+                top_k: Optional[int]) -> List[Tuple[Plan, float, Dict[str, Any]]]:
+    """Same list as scoring.rank_plans' exhaustive loop (score desc, catalog order on ties)."""
+    idx = catalog_index(plans)
+    feasible = idx.feasible(d)
+    order = idx.order
+
+    if top_k is None or top_k >= len(feasible) or len(feasible) < BOUNDED_MIN_FEASIBLE:
+        scored = [(order[j], score_plan(plans[order[j]], d, resp)) for j in feasible]
+    else:
+        want_tv = d["tv_interest"] in ["Yes, definitely", "Maybe, show me options"]
+        alacarte = (internet_standalone_price(d.get("required_down", 0))
+                    + mobile_alacarte_total(d["mobile_lines_need"])
+                    + (tv_alacarte_by_mask(current_catalog(), d["tv_pref_mask"]) if want_tv else 0))
+        bounds = sorted(
+            ((_upper_bound(plans[order[j]], idx.anchor_ub[j], d, want_tv, alacarte), order[j]) for j in feasible),
+            key=lambda x: x[0], reverse=True,
+        )
+        scored = []
+        kth = []            # best top_k scores so far, descending
+        for ub, i in bounds:
+            if len(kth) == top_k and ub < kth[-1]:
+                break       # bounds are sorted: nothing left can reach the top k
+            res = score_plan(plans[i], d, resp)
+            scored.append((i, res))
+            if len(kth) < top_k or res[0] > kth[-1]:
+                kth.append(res[0])
+                kth.sort(reverse=True)
+                del kth[top_k:]
+
+    scored.sort(key=lambda x: x[0])                     # catalog order, so ties break like list.sort
+    scored.sort(key=lambda x: x[1][0], reverse=True)
+    return [(plans[i], sc, meta) for i, (sc, meta) in scored[:top_k]]
+
+
+# =========================
+# Parity check + timing
+# =========================
+def _exhaustive(plans, d, resp, top_k):
+    out = []
+    for p in plans:
+        sc, meta = score_plan(p, d, resp)
+        if sc > -1e8:
+            out.append((p, sc, meta))
+    out.sort(key=lambda x: x[1], reverse=True)
+    return out[:top_k]
+
+
+def _check(n_profiles: int = 400, seed: int = 9) -> int:
+    from .scoring import estimate_demand
+    from .vector import synthetic_catalog
+    from .wizard import sample_responses
+
+    rng = random.Random(seed)
+    profiles = [sample_responses(rng) for _ in range(n_profiles)]
+    demands = [estimate_demand(r) for r in profiles]
+    failures = 0
+    for plans in (current_catalog().plans, synthetic_catalog(64), synthetic_catalog(255), synthetic_catalog(2000)):
+        for top_k in (1, 3, 10, None):
+            for r, d in zip(profiles, demands):
+                got = top_k_plans(plans, d, r, top_k)
+                want = _exhaustive(plans, d, r, top_k)
+                if [(p.id, s, m) for p, s, m in got] != [(p.id, s, m) for p, s, m in want]:
+                    failures += 1
+                    if failures <= 5:
+                        print(f"FAIL: {len(plans)} plans, top_k={top_k}: {r}")
+        t0 = time.perf_counter()
+        for r, d in zip(profiles, demands):
+            _exhaustive(plans, d, r, 3)
+        t_full = (time.perf_counter() - t0) / n_profiles
+        t0 = time.perf_counter()
+        for r, d in zip(profiles, demands):
+            top_k_plans(plans, d, r, 3)
+        t_pruned = (time.perf_counter() - t0) / n_profiles
+        print(f"{len(plans):>6} plans  top-3: exhaustive {t_full * 1e6:9.1f} us   indexed+bounded {t_pruned * 1e6:9.1f} us")
+    if failures:
+        print(f"FAIL: {failures} mismatches")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_check())
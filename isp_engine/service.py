@@ -0,0 +1,383 @@
+"""
+Scoring and narration service: the engine behind HTTP, in its own worker processes.
+
+Each worker process runs an asyncio HTTP/1.1 server (stdlib only, keep-alive)
+on a listening socket shared by all workers, so the kernel spreads connections
+across them. CPU calls (rank, cards, bundle, what-if, sweep) are coalesced by a
+`Batcher`: calls that arrive while the worker's scoring thread is busy run
+together as its next job (up to SERVICE_BATCH_MAX), under one pinned catalog
+version, while the event loop keeps accepting requests. LLM
+calls run on the narration thread pool, over the process's pooled Anthropic
+client (narration.get_client). Requests and replies use isp_engine.engine's
+wire format; /narrate streams NDJSON lines of [card idx, text so far, done],
+/polish_stream lines of [text so far, done]. /speculate and /claim carry the
+session id: each worker keeps one NarrativePrefetcher per session, and the
+blurbs it claims reach /narrate as in-flight work (narration.join_inflight).
+With several workers a session's calls can land on different ones; a
+speculation made elsewhere then still reaches the card through the shared
+narrative cache once it is done, but counts as a miss.
+
+    python -m isp_engine.service [--host 127.0.0.1] [--port 8600] [--workers N]
+
+    POST /rank /cards /bundle /whatif /sweep /narrate /polish /polish_stream /speculate /claim
+    GET  /healthz /metrics            (metrics are per worker process)
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .catalog import pin_catalog
+from .engine import LocalEngine, wire_dumps, wire_loads
+from .telemetry import REGISTRY, span
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8600"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", str(min(4, os.cpu_count() or 1))))
+SERVICE_BATCH_MAX = int(os.getenv("SERVICE_BATCH_MAX", "32"))       # CPU calls per scoring job
+SERVICE_MAX_BODY = int(os.getenv("SERVICE_MAX_BODY", str(1 << 20)))
+SERVICE_PREFETCH_SESSIONS = int(os.getenv("SERVICE_PREFETCH_SESSIONS", "4096"))   # speculating sessions kept per worker
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+# =========================
+# Request batching
+# =========================
+class Batcher:
+    """
+    Runs concurrent CPU calls together: one executor hop and one catalog pin per batch.
+    An idle batcher runs a call at once; calls arriving while a batch runs queue
+    up and go as the next batch (at most max_size), so batches grow with load.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, max_size: int = SERVICE_BATCH_MAX):
+        self.executor = executor
+        self.max_size = max_size
+        self._pending: List[Tuple[Callable, tuple, asyncio.Future]] = []
+        self._running = False
+
+    async def submit(self, fn: Callable, *args: Any) -> Any:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((fn, args, fut))
+        if not self._running:
+            self._flush()
+        return await fut
+
+    def _flush(self) -> None:
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        if not batch:
+            self._running = False
+            return
+        self._running = True
+        REGISTRY.inc("isp_service_batches_total")
+        REGISTRY.inc("isp_service_batched_calls_total", len(batch))
+        loop = asyncio.get_running_loop()
+        try:
+            job = loop.run_in_executor(self.executor, _run_batch, [(f, a) for f, a, _ in batch])
+        except RuntimeError as e:   # executor shut down: fail the batch through _resolve too
+            job = loop.create_future()
+            job.set_exception(e)
+
+        def _resolve(done: asyncio.Future) -> None:
+            try:
+                results = done.result()
+            except (Exception, asyncio.CancelledError) as e:
+                # the job itself failed (catalog pin, executor): fail the whole batch, keep the batcher going
+                REGISTRY.inc("isp_service_batch_failures_total", exception=type(e).__name__)
+                results = [(False, e)] * len(batch)
+            for (_, _, fut), (ok, value) in zip(batch, results):
+                if fut.cancelled():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+            self._flush()   # whatever queued up meanwhile
+        job.add_done_callback(_resolve)
+
+
+def _run_batch(calls: List[Tuple[Callable, tuple]]) -> List[Tuple[bool, Any]]:
+    pin_catalog()   # every call in the batch sees the same catalog version
+    out = []
+    for fn, args in calls:
+        try:
+            out.append((True, fn(*args)))
+        except Exception as e:
+            out.append((False, e))
+    return out
+
+
+# =========================
+# Handlers
+# =========================
+class _BadRequest(Exception):
+    pass
+
+
+class EngineService:
+    """One per worker process: routes requests to a LocalEngine."""
+
+    def __init__(self):
+        from .narration import get_narration_pool
+        self.engine = LocalEngine()
+        self.batcher = Batcher(ThreadPoolExecutor(max_workers=1, thread_name_prefix="score"))
+        self.llm_pool = get_narration_pool()
+        # relays a narration stream to its connection (waits on llm_pool work, so never runs on it)
+        self.stream_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="relay")
+        self._prefetchers: "OrderedDict[str, Any]" = OrderedDict()   # session id -> NarrativePrefetcher
+
+    async def handle(self, method: str, path: str, body: bytes, send_stream) -> Tuple[int, bytes, str]:
+        if method == "GET" and path == "/healthz":
+            return 200, b'{"ok":true}', "application/json"
+        if method == "GET" and path == "/metrics":
+            return 200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        route = self._routes().get(path)
+        if route is None:
+            return 404, b'{"error":"not found"}', "application/json"
+        if method != "POST":
+            return 405, b'{"error":"POST only"}', "application/json"
+        try:
+            req = wire_loads(body or b"{}")
+            if not isinstance(req, dict):
+                raise _BadRequest("expected a JSON object")
+        except ValueError as e:
+            return 400, wire_dumps({"error": f"bad JSON: {e}"}), "application/json"
+        with span(f"service{path.replace('/', '_')}"):
+            try:
+                out = await route(req, send_stream)
+            except (_BadRequest, KeyError, TypeError) as e:
+                return 400, wire_dumps({"error": f"{type(e).__name__}: {e}"}), "application/json"
+        if out is None:
+            return 0, b"", ""   # already streamed
+        return 200, wire_dumps(out), "application/json"
+
+    def _routes(self) -> Dict[str, Callable]:
+        return {"/rank": self.rank, "/cards": self.cards, "/bundle": self.bundle, "/whatif": self.whatif,
+                "/sweep": self.sweep, "/narrate": self.narrate, "/polish": self.polish, "/polish_stream": self.polish_stream,
+                "/speculate": self.speculate, "/claim": self.claim}
+
+    async def rank(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        ranked, demand = await self.batcher.submit(self.engine.rank, req["responses"], req.get("top_k", 3))
+        return {"ranked": ranked, "demand": demand}
+
+    async def cards(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        demand, cards = await self.batcher.submit(self.engine.cards, req["responses"], req.get("top_k", 3))
+        return {"demand": demand, "cards": cards}
+
+    async def bundle(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        return await self.batcher.submit(self.engine.bundle, req["plan"], req["demand"])
+
+    async def whatif(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        ranked, demand = await self.batcher.submit(self.engine.whatif, req["responses"], req["overrides"],
+                                                   req.get("top_k", 3))
+        return {"ranked": ranked, "demand": demand}
+
+    async def sweep(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        return {"cells": await self.batcher.submit(self.engine.sweep, req["responses"], req["grid"])}
+
+    async def polish(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return {"text": await loop.run_in_executor(self.llm_pool, self.engine.polish, str(req["prompt"]))}
+
+    async def speculate(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        sid = str(req["sid"])
+        prefetcher = self._prefetchers.get(sid)
+        if prefetcher is None:
+            prefetcher = self._prefetchers[sid] = self.engine.prefetcher(sid)
+            while len(self._prefetchers) > SERVICE_PREFETCH_SESSIONS:
+                self._prefetchers.popitem(last=False)
+        self._prefetchers.move_to_end(sid)
+        return {"launched": await self.batcher.submit(prefetcher.speculate, req["responses"])}
+
+    async def claim(self, req: Dict[str, Any], _) -> Dict[str, Any]:
+        # the session's results are in: settle its speculation (one claim per prefetcher, like the app's)
+        prefetcher = self._prefetchers.pop(str(req["sid"]), None) or self.engine.prefetcher()
+        prefetcher.claim(req["jobs"])
+        spec = prefetcher.stats()
+        return {"hits": spec["hits"], "misses": spec["misses"], "discarded": spec["discarded"]}
+
+    async def narrate(self, req: Dict[str, Any], send_stream) -> None:
+        jobs = req["jobs"]
+        await self._relay("narrate", lambda: ([idx, text, done] for idx, text, done in self.engine.narrate(jobs)),
+                          send_stream)
+
+    async def polish_stream(self, req: Dict[str, Any], send_stream) -> None:
+        prompt = str(req["prompt"])
+        await self._relay("polish_stream", lambda: ([text, done] for text, done in self.engine.polish_stream(prompt)),
+                          send_stream)
+
+    async def _relay(self, endpoint: str, items: Callable[[], Any], send_stream) -> None:
+        """
+        Stream a generator's items as NDJSON lines; it runs on the relay pool.
+        If the generator raises, the stream ends early (the client finishes on
+        its fallback) and the error goes to a span and isp_service_stream_errors_total.
+        """
+        loop = asyncio.get_running_loop()
+        q: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+        def _pump() -> None:
+            try:
+                with span("service_relay", endpoint=endpoint) as rec:
+                    try:
+                        pin_catalog()
+                        for item in items():
+                            loop.call_soon_threadsafe(q.put_nowait, wire_dumps(item) + b"\n")
+                    except Exception as e:
+                        rec["error"] = type(e).__name__
+                        REGISTRY.inc("isp_service_stream_errors_total", endpoint=endpoint, exception=type(e).__name__)
+            finally:
+                loop.call_soon_threadsafe(q.put_nowait, None)
+
+        self.stream_pool.submit(_pump)
+        await send_stream(q)
+
+
+# =========================
+# HTTP/1.1 over asyncio streams
+# =========================
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    if len(parts) != 3:
+        raise _BadRequest("bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    n = int(headers.get("content-length", "0") or 0)
+    if n > SERVICE_MAX_BODY:
+        raise OverflowError(n)
+    body = await reader.readexactly(n) if n else b""
+    return parts[0].upper(), parts[1].split("?")[0], headers, body
+
+
+def _head(status: int, extra: List[str]) -> bytes:
+    return ("\r\n".join([f"HTTP/1.1 {status} {_REASONS.get(status, '')}"] + extra) + "\r\n\r\n").encode("latin-1")
+
+
+async def _serve_conn(service: EngineService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            try:
+                req = await _read_request(reader)
+            except (_BadRequest, ValueError):
+                writer.write(_head(400, ["Content-Length: 0", "Connection: close"]))
+                break
+            except OverflowError:
+                writer.write(_head(413, ["Content-Length: 0", "Connection: close"]))
+                break
+            if req is None:
+                break
+            method, path, headers, body = req
+            keep_alive = headers.get("connection", "").lower() != "close"
+
+            async def send_stream(q: "asyncio.Queue[Optional[bytes]]") -> None:
+                writer.write(_head(200, ["Content-Type: application/x-ndjson", "Transfer-Encoding: chunked"]))
+                while True:
+                    chunk = await q.get()
+                    if chunk is None:
+                        break
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+
+            try:
+                status, payload, ctype = await service.handle(method, path, body, send_stream)
+            except Exception as e:
+                status, payload, ctype = 500, wire_dumps({"error": f"{type(e).__name__}: {e}"}), "application/json"
+            if status:
+                writer.write(_head(status, [f"Content-Type: {ctype}", f"Content-Length: {len(payload)}"]
+                                   + ([] if keep_alive else ["Connection: close"])) + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve(sock: socket.socket) -> None:
+    service = EngineService()
+    server = await asyncio.start_server(lambda r, w: _serve_conn(service, r, w), sock=sock)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    async with server:
+        await stop.wait()
+
+
+def _worker(sock: socket.socket) -> None:
+    asyncio.run(_serve(sock))
+
+
+def bind(host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> socket.socket:
+    """The listening socket every worker accepts on (port 0 picks a free one)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = SERVICE_WORKERS,
+          ready: Optional[Callable[[int], None]] = None) -> None:
+    """Bind, fork `workers` processes onto the socket and wait for them (SIGTERM / Ctrl-C stops all)."""
+    sock = bind(host, port)
+    if ready is not None:
+        ready(sock.getsockname()[1])
+    if workers <= 1 or not hasattr(os, "fork"):
+        _worker(sock)
+        return
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(sock,), name=f"isp-engine-{i}", daemon=True) for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    def _stop(*_):
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while any(p.is_alive() for p in procs):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        _stop()
+    for p in procs:
+        p.join(timeout=5)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="ISP engine scoring and narration service")
+    ap.add_argument("--host", default=SERVICE_HOST)
+    ap.add_argument("--port", type=int, default=SERVICE_PORT)
+    ap.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    args = ap.parse_args(argv)
+    serve(args.host, args.port, args.workers,
+          ready=lambda port: print(f"isp_engine.service on http://{args.host}:{port} ({args.workers} workers)",
+                                   file=sys.stderr, flush=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,472 @@
+"""
+Bounded per-session state: compact wizard answers, a ring-buffered chat and idle eviction.
+
+A `Session` holds the wizard step, the answers encoded as option indices
+(encode_responses: 11 bytes instead of a dict of strings, lists and sets),
+the last CHAT_RING_TURNS chat turns, and `derived`: result-page caches that
+can always be rebuilt from the answers. Older chat turns are spilled to a
+SQLite file. `SessionStore` evicts sessions idle for SESSION_IDLE_TTL_S:
+step, answers and chat go to the same file, `derived` is dropped, and the next
+request for that session id restores it. Memory per live session is published
+as gauges (isp_session_memory_bytes) for sizing workers, measured on a random
+sample of at most SESSION_SIZE_SAMPLE sessions per sweep.
+
+    python -m isp_engine.sessions     # round-trip, spill and eviction check
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from types import FunctionType, MethodType, ModuleType
+from typing import Any, Dict, List, Optional, Tuple
+
+from .catalog import CatalogSnapshot, Plan
+from .narrative_cache import json_default
+from .telemetry import REGISTRY
+from .wizard import (
+    DEVICES_OPTIONS, HOME_SIZE_OPTIONS, HOUSEHOLD_TYPE_OPTIONS, MOBILE_LINES_OPTIONS, PEAK_OPTIONS, PEOPLE_OPTIONS,
+    RELIABILITY_OPTIONS, STREAMING_OPTIONS, TV_INTEREST_OPTIONS, TV_PREF_OPTIONS,
+)
+
+SESSION_SPILL_PATH = os.getenv("SESSION_SPILL_PATH", ".sessions.sqlite3")          # empty = memory only
+SESSION_IDLE_TTL_S = float(os.getenv("SESSION_IDLE_TTL_S", "1800"))                # evict after this long untouched
+SESSION_SWEEP_S = float(os.getenv("SESSION_SWEEP_S", "60"))                        # eviction + gauges at most this often
+SESSION_SIZE_SAMPLE = int(os.getenv("SESSION_SIZE_SAMPLE", "32"))                  # sessions measured per sweep for the gauges
+SESSION_RETENTION_S = float(os.getenv("SESSION_RETENTION_S", str(7 * 24 * 3600)))  # spilled rows older than this are purged
+CHAT_RING_TURNS = int(os.getenv("CHAT_RING_TURNS", "6"))                           # chat turns kept in memory
+
+
+# =========================
+# Compact wizard answers
+# =========================
+_UNSET = 0xFF
+_PACKED, _JSON = 1, 0
+
+
+def _index(opts: List[str]) -> Dict[str, int]:
+    return {o: i for i, o in enumerate(opts)}
+
+
+# single-choice fields: one byte each, the option index
+_SINGLE = tuple((field, opts, _index(opts)) for field, opts in (
+    ("reliability", RELIABILITY_OPTIONS),
+    ("devices", DEVICES_OPTIONS),
+    ("home_size", HOME_SIZE_OPTIONS),
+    ("tv_interest", TV_INTEREST_OPTIONS),
+    ("streaming", STREAMING_OPTIONS),
+    ("mobile_lines", MOBILE_LINES_OPTIONS),
+))
+# multiselects: one byte each, a bitmask over the options (decoded in option order)
+_MULTI = tuple((field, opts, _index(opts)) for field, opts in (("evening", PEAK_OPTIONS), ("tv_prefs", TV_PREF_OPTIONS)))
+_PEOPLE, _HH_TYPE = _index(PEOPLE_OPTIONS), _index(HOUSEHOLD_TYPE_OPTIONS)
+_FIELDS = {"household"} | {f for f, _, _ in _SINGLE} | {f for f, _, _ in _MULTI}
+
+
+def _pack(resp: Dict[str, Any]) -> bytes:
+    if not _FIELDS.issuperset(resp):
+        raise KeyError("unknown field")
+    out = bytearray([_PACKED])
+    hh = resp.get("household")
+    if hh is None:
+        out += bytes((_UNSET, _UNSET))
+    else:
+        if set(hh) != {"people", "type"}:
+            raise KeyError("household")
+        out += bytes((_PEOPLE[hh["people"]], _HH_TYPE[hh["type"]]))   # KeyError: not a wizard option
+    for field, _, index in _SINGLE:
+        out.append(index[resp[field]] if field in resp else _UNSET)
+    for field, _, index in _MULTI:
+        if field not in resp:
+            out.append(_UNSET)
+            continue
+        picked = {index[o] for o in resp[field]}
+        if len(picked) != len(resp[field]):
+            raise KeyError(field)       # duplicates don't survive a bitmask
+        out.append(sum(1 << i for i in picked))
+    return bytes(out)
+
+
+def encode_responses(resp: Dict[str, Any]) -> bytes:
+    """
+    Wizard answers as 11 bytes of option indices (multiselects as bitmasks).
+    Anything the wizard can't produce falls back to JSON, so encoding never fails.
+    """
+    try:
+        return _pack(resp)
+    except (KeyError, TypeError, AttributeError):
+        return bytes([_JSON]) + json.dumps(resp, ensure_ascii=False, default=json_default).encode("utf-8")
+
+
+def decode_responses(blob: bytes) -> Dict[str, Any]:
+    """Inverse of encode_responses (multiselect answers come back in option order)."""
+    if not blob:
+        return {}
+    if blob[0] == _JSON:
+        return json.loads(blob[1:].decode("utf-8"))
+    resp: Dict[str, Any] = {}
+    if blob[1] != _UNSET:
+        resp["household"] = {"people": PEOPLE_OPTIONS[blob[1]], "type": HOUSEHOLD_TYPE_OPTIONS[blob[2]]}
+    pos = 3
+    for field, opts, _ in _SINGLE:
+        if blob[pos] != _UNSET:
+            resp[field] = opts[blob[pos]]
+        pos += 1
+    for field, opts, _ in _MULTI:
+        if blob[pos] != _UNSET:
+            resp[field] = [o for i, o in enumerate(opts) if blob[pos] >> i & 1]
+        pos += 1
+    return resp
+
+
+# =========================
+# Spill file
+# =========================
+class _Spill:
+    """SQLite file for chat turns that left a ring buffer and for evicted sessions. Disk errors lose data, never raise."""
+
+    def __init__(self, path: Optional[str]):
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS chat "
+                    "(sid TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL, "
+                    "ts REAL NOT NULL, PRIMARY KEY (sid, seq))"
+                )
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions "
+                    "(sid TEXT PRIMARY KEY, step INTEGER NOT NULL, answers BLOB NOT NULL, "
+                    "chat_seq INTEGER NOT NULL, ts REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                self._db = None
+
+    def _run(self, fn) -> Any:
+        if self._db is None:
+            return None
+        with self._lock:
+            try:
+                out = fn(self._db)
+                self._db.commit()
+                return out
+            except sqlite3.Error:
+                return None
+
+    def write_chat(self, sid: str, turns: List[Tuple[int, str, str]]) -> bool:
+        if not turns:
+            return True
+        now = time.time()
+        rows = [(sid, seq, role, text, now) for seq, role, text in turns]
+        ok = self._run(lambda db: db.executemany("INSERT OR REPLACE INTO chat VALUES (?, ?, ?, ?, ?)", rows))
+        REGISTRY.inc("isp_chat_spilled_total", len(turns), result="ok" if ok is not None else "dropped")
+        return ok is not None
+
+    def read_chat(self, sid: str) -> List[Tuple[str, str]]:
+        rows = self._run(lambda db: db.execute(
+            "SELECT role, text FROM chat WHERE sid = ? ORDER BY seq", (sid,)).fetchall())
+        return [tuple(r) for r in rows or []]
+
+    def take_chat_tail(self, sid: str, n: int) -> List[Tuple[int, str, str]]:
+        """The last n spilled turns, removed from the file (they go back into a ring buffer)."""
+        def take(db):
+            rows = db.execute("SELECT seq, role, text FROM chat WHERE sid = ? ORDER BY seq DESC LIMIT ?",
+                              (sid, n)).fetchall()
+            if rows:
+                db.execute("DELETE FROM chat WHERE sid = ? AND seq >= ?", (sid, rows[-1][0]))
+            return [tuple(r) for r in reversed(rows)]
+        return self._run(take) or []
+
+    def save_session(self, sid: str, step: int, answers: bytes, chat_seq: int) -> bool:
+        return self._run(lambda db: db.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+            (sid, step, answers, chat_seq, time.time()))) is not None
+
+    def pop_session(self, sid: str) -> Optional[Tuple[int, bytes, int]]:
+        def pop(db):
+            row = db.execute("SELECT step, answers, chat_seq FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            if row:
+                db.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            return row
+        row = self._run(pop)
+        return (row[0], bytes(row[1]), row[2]) if row else None
+
+    def purge(self, older_than: float) -> None:
+        def purge(db):
+            db.execute("DELETE FROM sessions WHERE ts < ?", (older_than,))
+            db.execute("DELETE FROM chat WHERE ts < ?", (older_than,))
+        self._run(purge)
+
+
+# =========================
+# Sessions
+# =========================
+class ChatLog:
+    """The last `ring` chat turns in memory; older turns are in the spill file."""
+    __slots__ = ("sid", "seq", "_ring", "_spill")
+
+    def __init__(self, sid: str, spill: _Spill, ring: int = CHAT_RING_TURNS, seq: int = 0):
+        self.sid = sid
+        self.seq = seq                  # number of turns ever appended
+        self._ring: "deque[Tuple[int, str, str]]" = deque(maxlen=max(1, ring))
+        self._spill = spill
+
+    def append(self, role: str, text: str) -> None:
+        if len(self._ring) == self._ring.maxlen:
+            self._spill.write_chat(self.sid, [self._ring[0]])
+        self._ring.append((self.seq, role, text))
+        self.seq += 1
+
+    def recent(self, n: int) -> List[Tuple[str, str]]:
+        """The last n (role, text) turns (at most the ring size)."""
+        turns = list(self._ring)[-n:] if n > 0 else []
+        return [(role, text) for _, role, text in turns]
+
+    def history(self) -> List[Tuple[str, str]]:
+        """Every turn still on record, oldest first (reads the spill file)."""
+        return self._spill.read_chat(self.sid) + self.recent(len(self._ring))
+
+    def __len__(self) -> int:
+        return self.seq
+
+
+class Session:
+    """One browser session. Wizard answers are stored encoded; use `responses` to read and `answer` to write."""
+    __slots__ = ("sid", "step", "chat", "derived", "seen", "_answers")
+
+    def __init__(self, sid: str, chat: ChatLog, step: int = 0, answers: bytes = b""):
+        self.sid = sid
+        self.step = step
+        self.chat = chat
+        self.derived: Dict[str, Any] = {}   # rebuildable caches (results, what-if memo, ...); dropped on eviction
+        self.seen = time.monotonic()
+        self._answers = answers or encode_responses({})
+
+    @property
+    def responses(self) -> Dict[str, Any]:
+        """A fresh dict of the answers so far (mutating it doesn't change the session)."""
+        return decode_responses(self._answers)
+
+    def answer(self, field: str, value: Any) -> None:
+        self._answers = encode_responses({**self.responses, field: value})
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this session (catalog objects shared across sessions excluded)."""
+        return deep_size(self)
+
+
+_SHARED = (type, ModuleType, FunctionType, MethodType, Plan, CatalogSnapshot, _Spill, sqlite3.Connection)
+
+
+def deep_size(obj: Any) -> int:
+    """sys.getsizeof summed over everything reachable from obj, each object once."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SHARED):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif not isinstance(o, (str, bytes, int, float, bool)) and o is not None:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for cls in type(o).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    v = getattr(o, name, None)
+                    if v is not None:
+                        stack.append(v)
+    return total
+
+
+def new_session_id() -> str:
+    return os.urandom(8).hex()
+
+
+class SessionStore:
+    """Live sessions by id. Idle ones are spilled to disk and restored on their next request."""
+
+    def __init__(self, path: Optional[str] = SESSION_SPILL_PATH, idle_ttl_s: float = SESSION_IDLE_TTL_S,
+                 chat_ring: int = CHAT_RING_TURNS, sweep_every_s: float = SESSION_SWEEP_S,
+                 size_sample: int = SESSION_SIZE_SAMPLE):
+        self.idle_ttl_s = idle_ttl_s
+        self.chat_ring = chat_ring
+        self.sweep_every_s = sweep_every_s
+        self.size_sample = size_sample
+        self._spill = _Spill(path)
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0          # first get() sweeps, so the gauges are set from the start
+        self.evictions = 0
+        self.restores = 0
+        self.last_sizes: Dict[str, int] = {}   # the last sweep's sample
+
+    def get(self, sid: str) -> Session:
+        """The session for `sid` (restored from disk if it was evicted, new otherwise), marked as just used."""
+        now = time.monotonic()
+        with self._lock:
+            sess = self._sessions.get(sid)
+            if sess is None:
+                sess = self._sessions[sid] = self._restore(sid)
+            sess.seen = now
+        if now >= self._next_sweep:
+            self.sweep()
+        return sess
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Evict idle sessions, purge old spilled rows and refresh the memory gauges;
+        returns sessions evicted. Sweeps run on a request's thread, so only a
+        bounded sample of live sessions is walked for the gauges (total is
+        estimated from the sample's mean).
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0    # another thread is sweeping
+        try:
+            now = time.monotonic() if now is None else now
+            self._next_sweep = now + self.sweep_every_s
+            with self._lock:
+                idle = [s for s in self._sessions.values() if now - s.seen >= self.idle_ttl_s]
+                for sess in idle:
+                    del self._sessions[sess.sid]
+                live = list(self._sessions.values())
+            for sess in idle:
+                self._evict(sess)
+            self._spill.purge(time.time() - SESSION_RETENTION_S)
+
+            sample = live if len(live) <= self.size_sample else random.sample(live, self.size_sample)
+            sizes = {s.sid: s.nbytes() for s in sample}
+            self.last_sizes = sizes
+            mean = sum(sizes.values()) / len(sizes) if sizes else 0
+            REGISTRY.set("isp_sessions", len(live))
+            REGISTRY.set("isp_session_memory_bytes", mean * len(live), stat="total")
+            REGISTRY.set("isp_session_memory_bytes", mean, stat="mean")
+            REGISTRY.set("isp_session_memory_bytes", max(sizes.values(), default=0), stat="max")
+            return len(idle)
+        finally:
+            self._sweep_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = len(self._sessions)
+        sizes = list(self.last_sizes.values())
+        return {"sessions": live, "evictions": self.evictions, "restores": self.restores,
+                "mean_bytes": int(sum(sizes) / len(sizes)) if sizes else 0, "max_bytes": max(sizes, default=0)}
+
+    def _evict(self, sess: Session) -> None:
+        chat = sess.chat
+        self._spill.write_chat(sess.sid, list(chat._ring))
+        self._spill.save_session(sess.sid, sess.step, sess._answers, chat.seq)
+        self.evictions += 1
+        REGISTRY.inc("isp_session_evictions_total")
+
+    def _restore(self, sid: str) -> Session:
+        row = self._spill.pop_session(sid)
+        if row is None:
+            return Session(sid, ChatLog(sid, self._spill, self.chat_ring))
+        step, answers, chat_seq = row
+        chat = ChatLog(sid, self._spill, self.chat_ring, seq=chat_seq)
+        chat._ring.extend(self._spill.take_chat_tail(sid, self.chat_ring))
+        self.restores += 1
+        return Session(sid, chat, step=step, answers=answers)
+
+
+_default: Optional[SessionStore] = None
+_default_lock = threading.Lock()
+
+
+def default_sessions() -> SessionStore:
+    """Process-wide store shared by every Streamlit session in this worker."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SessionStore()
+        return _default
+
+
+# =========================
+# Self-check
+# =========================
+def _check(n_profiles: int = 2000, seed: int = 21) -> int:
+    import random
+    import tempfile
+    from .scoring import estimate_demand
+    from .wizard import sample_responses, with_defaults
+
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(n_profiles):
+        resp = sample_responses(rng)
+        for r in (resp, with_defaults({}), {k: resp[k] for k in list(resp)[:rng.randrange(len(resp) + 1)]}):
+            blob = encode_responses(r)
+            back = decode_responses(blob)
+            if blob[0] != _PACKED or estimate_demand(back) != estimate_demand(r) or set(back) != set(r):
+                failures += 1
+                print(f"FAIL: round trip {r}")
+    odd = {"household": {"people": "7 people", "type": "Roommates"}, "extra": {1, 2}}
+    if decode_responses(encode_responses(odd)) != {"household": odd["household"], "extra": [1, 2]}:
+        failures += 1
+        print("FAIL: JSON fallback")
+    print(f"answers: {len(encode_responses(resp))} bytes encoded vs {deep_size(resp)} bytes as a dict")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "s.sqlite3"), idle_ttl_s=10, chat_ring=4, sweep_every_s=1e9)
+        sess = store.get("a")
+        sess.step = 10
+        for k, v in resp.items():
+            sess.answer(k, v)
+        for i in range(11):
+            sess.chat.append("user" if i % 2 == 0 else "assistant", f"turn {i}")
+        sess.derived["big"] = "x" * 100_000
+        want_hist = [("user" if i % 2 == 0 else "assistant", f"turn {i}") for i in range(11)]
+        if sess.chat.history() != want_hist or sess.chat.recent(6) != want_hist[-4:]:
+            failures += 1
+            print("FAIL: ring buffer / spill")
+        before = sess.nbytes()
+        if store.sweep(now=time.monotonic() + 60) != 1 or store.stats()["sessions"] != 0:
+            failures += 1
+            print("FAIL: idle session not evicted")
+        back = store.get("a")
+        if (back.step != 10 or estimate_demand(back.responses) != estimate_demand(resp) or back.derived
+                or back.chat.history() != want_hist or back.chat.recent(4) != want_hist[-4:] or len(back.chat) != 11):
+            failures += 1
+            print("FAIL: restore after eviction")
+        back.chat.append("user", "turn 11")
+        if back.chat.history() != want_hist + [("user", "turn 11")]:
+            failures += 1
+            print("FAIL: chat after restore")
+        print(f"session: {before} bytes with a 100 kB cache, {back.nbytes()} bytes after eviction + restore")
+
+    store = SessionStore(None, size_sample=8, sweep_every_s=1e9)
+    for i in range(500):
+        store.get(f"s{i}").answer("devices", resp.get("devices", "1–5 devices"))
+    t0 = time.perf_counter()
+    store.sweep()
+    ms = (time.perf_counter() - t0) * 1000
+    if len(store.last_sizes) != 8 or store.stats()["sessions"] != 500:
+        failures += 1
+        print(f"FAIL: gauge sample measured {len(store.last_sizes)} of 500 sessions, expected 8")
+    print(f"sweep over 500 live sessions: {ms:.2f} ms, {len(store.last_sizes)} measured")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_check())
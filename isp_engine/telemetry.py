@@ -0,0 +1,284 @@
+"""
+Latency spans and LLM call metrics.
+
+`span()` times a block (a rerun stage or one LLM call) and records it three
+ways: into the active rerun's Trace (for the debug sidebar), into process-wide
+histograms/counters (Prometheus text at /metrics when METRICS_PORT is set) and,
+when TRACE_PATH is set, as one JSON line per span.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TRACE_PATH = os.getenv("TRACE_PATH", "")                  # JSONL span log; empty = off
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))        # 127.0.0.1:<port>/metrics; 0 = off
+
+# seconds; covers sub-ms scoring up to a timed-out Claude call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP = {
+    "isp_stage_seconds": ("histogram", "Wall time of one app stage (rank, cards, narration, chat)."),
+    "isp_llm_call_seconds": ("histogram", "Wall time of one LLM call, by call site and outcome (ok, cache, fallback, error, short_circuit)."),
+    "isp_llm_tokens_total": ("counter", "LLM tokens by call site and kind (input = uncached prompt, output, cache_read, cache_write)."),
+    "isp_llm_fallbacks_total": ("counter", "Deterministic copy served instead of LLM text, by call site."),
+    "isp_llm_errors_total": ("counter", "LLM calls that raised, by call site and exception type."),
+    "isp_speculation_total": ("counter", "Speculative card blurbs: launched, then hit / miss / discarded at the results step."),
+    "isp_llm_breaker_transitions_total": ("counter", "LLM circuit breaker state changes, by new state."),
+    "isp_sessions": ("gauge", "Sessions held in memory by this process."),
+    "isp_session_memory_bytes": ("gauge", "Approximate session memory from a sample of live sessions: mean and max per session, total estimated."),
+    "isp_session_evictions_total": ("counter", "Idle sessions written to disk and dropped from memory."),
+    "isp_service_batches_total": ("counter", "Batches of CPU calls run by the engine service (calls / batches = mean batch size)."),
+    "isp_service_batched_calls_total": ("counter", "CPU calls run by the engine service through its batcher."),
+    "isp_service_batch_failures_total": ("counter", "Engine service batches whose executor job failed (every call in it failed), by exception type."),
+    "isp_service_stream_errors_total": ("counter", "Engine service streams cut short because the engine raised, by endpoint and exception type."),
+    "isp_engine_fallbacks_total": ("counter", "Engine calls answered in process because the engine service failed, by endpoint."),
+    "isp_chat_spilled_total": ("counter", "Chat turns moved from a session's ring buffer to disk, by result (ok, dropped)."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if v <= le:
+                self.counts[i] += 1
+                break
+        self.sum += v
+        self.count += 1
+
+
+class Registry:
+    """Histograms, counters and gauges keyed by (metric name, sorted labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        def fmt(labels: Labels, extra: str = "") -> str:
+            parts = [f'{k}="{_escape(v)}"' for k, v in labels] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        with self._lock:
+            hist = sorted(self._hist.items())
+            counters = sorted(self._counters.items()) + sorted(self._gauges.items())
+            hist = [(k, (list(h.counts), h.sum, h.count)) for k, h in hist]
+
+        lines: List[str] = []
+        seen = set()
+        for (name, labels), (counts, total, n) in hist:
+            _header(lines, seen, name)
+            cum = 0
+            for le, c in zip(LATENCY_BUCKETS, counts):
+                cum += c
+                lines.append("%s_bucket%s %d" % (name, fmt(labels, 'le="%s"' % le), cum))
+            lines.append("%s_bucket%s %d" % (name, fmt(labels, 'le="+Inf"'), n))
+            lines.append(f"{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{name}_count{fmt(labels)} {n}")
+        for (name, labels), v in counters:
+            _header(lines, seen, name)
+            lines.append(f"{name}{fmt(labels)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _header(lines: List[str], seen: set, name: str) -> None:
+    if name in seen:
+        return
+    seen.add(name)
+    kind, text = _HELP.get(name, ("untyped", name))
+    lines.append(f"# HELP {name} {text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+REGISTRY = Registry()
+
+
+# =========================
+# Traces and spans
+# =========================
+class Trace:
+    """The spans of one rerun (LLM calls in worker threads join it via contextvars)."""
+
+    def __init__(self, name: str):
+        self.id = os.urandom(6).hex()
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("isp_trace", default=None)
+_trace_file = None
+_file_lock = threading.Lock()
+
+
+def start_trace(name: str = "rerun") -> Trace:
+    """Begin a new trace for this thread's context (call once at the top of a rerun)."""
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "stage", **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time the block. The yielded dict is the span record: LLM call sites set
+    input_tokens / output_tokens (see record_usage), fallback, cache_hit, and
+    error when they swallow an exception. Exceptions escaping the block are
+    recorded and re-raised.
+    """
+    rec: Dict[str, Any] = {"name": name, "kind": kind, **attrs}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        rec["error"] = type(e).__name__
+        raise
+    finally:
+        rec["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        _finish(rec)
+
+
+def record_usage(rec: Dict[str, Any], message: Any) -> None:
+    """Copy token usage (incl. prompt-cache reads/writes) from an Anthropic Message onto a span record."""
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        rec["input_tokens"] = getattr(usage, "input_tokens", None) or 0
+        rec["output_tokens"] = getattr(usage, "output_tokens", None) or 0
+        rec["cache_read_tokens"] = getattr(usage, "cache_read_input_tokens", None) or 0
+        rec["cache_write_tokens"] = getattr(usage, "cache_creation_input_tokens", None) or 0
+        rec["total_tokens"] = (rec["input_tokens"] + rec["cache_read_tokens"]
+                               + rec["cache_write_tokens"] + rec["output_tokens"])
+
+
+def count_fallback(call: str) -> None:
+    """A fallback served outside any LLM span (e.g. a card that missed the page deadline)."""
+    REGISTRY.inc("isp_llm_fallbacks_total", call=call)
+
+
+def _finish(rec: Dict[str, Any]) -> None:
+    seconds = rec["ms"] / 1000
+    if rec["kind"] == "llm":
+        call = rec["name"]
+        if rec.get("error") == "CircuitOpenError":
+            outcome = "short_circuit"  # llm_guard refused the call; no request was sent
+        elif rec.get("error"):
+            outcome = "error"
+            REGISTRY.inc("isp_llm_errors_total", call=call, exception=rec["error"])
+        elif rec.get("fallback"):
+            outcome = "fallback"
+        elif rec.get("cache_hit"):
+            outcome = "cache"
+        else:
+            outcome = "ok"
+        if rec.get("fallback") or rec.get("error"):  # every call site falls back on error
+            REGISTRY.inc("isp_llm_fallbacks_total", call=call)
+        for direction in ("input", "output", "cache_read", "cache_write"):
+            n = rec.get(f"{direction}_tokens")
+            if n:
+                REGISTRY.inc("isp_llm_tokens_total", n, call=call, direction=direction)
+        REGISTRY.observe("isp_llm_call_seconds", seconds, call=call, outcome=outcome)
+    else:
+        REGISTRY.observe("isp_stage_seconds", seconds, stage=rec["name"])
+
+    trace = _current.get()
+    if trace is not None:
+        rec["trace"] = trace.id
+        trace.spans.append(rec)
+    if TRACE_PATH:
+        _write_trace_line(rec)
+
+
+def _write_trace_line(rec: Dict[str, Any]) -> None:
+    global _trace_file
+    line = json.dumps({"ts": round(time.time(), 3), **rec}, ensure_ascii=False, default=str) + "\n"
+    with _file_lock:
+        try:
+            if _trace_file is None:
+                _trace_file = open(TRACE_PATH, "a", encoding="utf-8", buffering=1)
+            _trace_file.write(line)
+        except OSError:
+            pass  # tracing must never break a rerun
+
+
+# =========================
+# /metrics endpoint
+# =========================
+_server = None
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[int]:
+    """Serve REGISTRY at http://127.0.0.1:<port>/metrics from a daemon thread (idempotent)."""
+    global _server
+    if not port:
+        return None
+    with _file_lock:
+        if _server is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class _Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = REGISTRY.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                _server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+            except OSError:
+                return None  # another worker process on this box already serves the port
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server.server_address[1]
@@ -0,0 +1,212 @@
+"""
+NumPy scoring kernel for large plan catalogs.
+
+`CatalogArrays` holds the catalog column-wise; `score_catalog` computes the
+same scores as scoring.score_plan for every plan in one vectorized pass
+(feasibility filters, headroom curve, reliability, TV/mobile fit, price
+anchors). Reasons strings are only built for the plans actually returned.
+
+    python -m isp_engine.vector       # parity check + 10k / 100k benchmark
+"""
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .catalog import N_TV_MASKS, TV_PACKS, CatalogSnapshot, Plan, current_catalog
+from .pricing import internet_standalone_price, mobile_alacarte_total, tv_alacarte_by_mask
+from .scoring import estimate_demand, score_plan
+
+# mask -> number of packs
+_POPCOUNT = np.array([m.bit_count() for m in range(N_TV_MASKS)], dtype=np.int64)
+
+INFEASIBLE = -1e9
+
+
+class CatalogArrays:
+    """Column-wise view of a plan catalog (one array per scoring input)."""
+
+    def __init__(self, plans: List[Plan]):
+        self.plans = list(plans)
+        self.down = np.array([p.down_mbps for p in plans], dtype=np.int64)
+        self.up = np.array([p.up_mbps for p in plans], dtype=np.int64)
+        self.fiber = np.array([p.tech == "fiber" for p in plans], dtype=bool)
+        self.includes_tv = np.array([p.includes_tv for p in plans], dtype=bool)
+        self.tv_mask = np.array([p.pack_mask for p in plans], dtype=np.int64)
+        self.lines = np.array([p.mobile_lines_included for p in plans], dtype=np.int64)
+        self.base_price = np.array([p.base_price for p in plans], dtype=np.int64)
+        self.dvr = np.array([p.dvr_included for p in plans], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.plans)
+
+
+_cached: Optional[CatalogArrays] = None
+_cached_src: Optional[List[Plan]] = None
+
+
+def catalog_arrays(plans: List[Plan]) -> CatalogArrays:
+    """Column view of `plans`, rebuilt only when a different (or resized) catalog comes in."""
+    global _cached, _cached_src
+    if _cached is None or _cached_src is not plans or len(_cached) != len(plans):
+        _cached, _cached_src = CatalogArrays(plans), plans
+    return _cached
+
+
+_addon_cache: Tuple[str, Optional[np.ndarray]] = ("", None)
+
+
+def _bundle_addon_by_mask(snap: CatalogSnapshot) -> np.ndarray:
+    """mask -> bundle add-on price of those packs, for this catalog version."""
+    global _addon_cache
+    version, table = _addon_cache
+    if version != snap.version or table is None:
+        table = np.array(snap.bundle_tv_addon_by_mask, dtype=np.int64)
+        _addon_cache = (snap.version, table)
+    return table
+
+
+def score_catalog(cat: CatalogArrays, d: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (scores, headroom) for every plan; infeasible plans score -1e9.
+    Terms are added in the same order as score_plan so floats match exactly.
+    """
+    snap = current_catalog()
+    addon_by_mask = _bundle_addon_by_mask(snap)
+    want_tv = d["tv_interest"] in ["Yes, definitely", "Maybe, show me options"]
+    pref_mask = d["tv_pref_mask"]
+    need_lines = d["mobile_lines_need"]
+
+    # --- Hard requirements ---
+    headroom = cat.down / max(1, d["required_down"])
+    feasible = (cat.up >= d["required_up"]) & (headroom >= 1.0)
+
+    # --- Headroom curve ---
+    score = np.zeros(len(cat), dtype=np.float64)
+    score += np.select(
+        [(headroom >= 1.2) & (headroom <= 2.5), headroom < 1.2, headroom <= 3.5],
+        [38.0, 24 * (headroom - 1.0) / 0.2, 34 - 8 * (headroom - 2.5)],
+        20 - 6 * (headroom - 3.5),
+    )
+
+    # --- Reliability / latency ---
+    if d["needs_low_latency"] or d["high_reliability"]:
+        score += np.where(cat.fiber, 8.0, -5.0)
+    else:
+        score += np.where(cat.fiber & (cat.down >= 1000), 2.0, 0.0)
+
+    # --- TV fit ---
+    if want_tv:
+        score += np.where(cat.includes_tv, 8.0, -12.0)
+        score += np.where(cat.includes_tv, 2.0 * _POPCOUNT[cat.tv_mask & pref_mask], 0.0)
+    else:
+        score += np.where(cat.includes_tv, -8.0, 0.0)
+
+    # --- Mobile bundle fit ---
+    score += np.select(
+        [(cat.lines >= need_lines) & (need_lines > 0), cat.lines > 0],
+        [10.0, 5.0],
+        -8.0 if need_lines >= 3 else 0.0,
+    )
+
+    # --- Economics (bundle_vs_alacarte, vectorized) ---
+    alacarte_total = (
+        internet_standalone_price(d.get("required_down", 0))
+        + mobile_alacarte_total(need_lines)
+        + (tv_alacarte_by_mask(snap, pref_mask) if want_tv else 0)
+    )
+    bundle_total = cat.base_price + np.maximum(0, need_lines - cat.lines) * snap.bundle_mobile_per_line
+    if want_tv:
+        bundle_total = bundle_total + np.where(
+            cat.includes_tv,
+            addon_by_mask[pref_mask & ~cat.tv_mask] + np.where(cat.dvr, 0, snap.bundle_dvr_price),
+            snap.bundle_tv_base_price + int(addon_by_mask[pref_mask]) + snap.bundle_dvr_price,
+        )
+    score += np.maximum(0, 35 - bundle_total / 9.0)
+    score += np.clip((alacarte_total - bundle_total) / 8.0, -12, 12)
+
+    score[~feasible] = INFEASIBLE
+    return score, headroom
+
+
+def rank_catalog(plans: List[Plan], d: Dict[str, Any], resp: Dict[str, Any],
+                 top_k: Optional[int] = None) -> List[Tuple[Plan, float, Dict[str, Any]]]:
+    """Same output as scoring.rank_plans' loop; meta (reasons) only for the top_k returned."""
+    cat = catalog_arrays(plans)
+    scores, _ = score_catalog(cat, d)
+    order = np.argsort(-scores, kind="stable")          # ties keep catalog order, like list.sort
+    order = order[scores[order] > -1e8]
+    if top_k is not None:
+        order = order[:top_k]
+    out = []
+    for i in order.tolist():
+        plan = cat.plans[i]
+        _, meta = score_plan(plan, d, resp)
+        out.append((plan, float(scores[i]), meta))
+    return out
+
+
+# =========================
+# Parity check + benchmark
+# =========================
+def synthetic_catalog(n: int, seed: int = 7) -> List[Plan]:
+    """n plausible regional SKUs / promo variants built around the real catalog."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        base = rng.choice(current_catalog().plans)
+        down = max(50, int(base.down_mbps * rng.choice([0.5, 0.75, 1, 1, 1.5, 2])))
+        tv = base.includes_tv or rng.random() < 0.1
+        out.append(Plan(
+            f"{base.id}-{i}", f"{base.name} #{i}", rng.choice([base.tech, "fiber", "hybrid"]),
+            down, max(5, int(base.up_mbps * rng.choice([0.5, 1, 2]))), tv,
+            rng.sample(TV_PACKS, rng.randint(1, 4)) if tv else [],
+            rng.choice([0, 0, 1, 2, 4]) if rng.random() < 0.4 else base.mobile_lines_included,
+            base.base_price + rng.randint(-20, 30), True, tv and rng.random() < 0.6, list(base.notes),
+        ))
+    return out
+
+
+def _bench() -> None:
+    profiles = [
+        {},
+        {"household": {"people": "3–4 people"}, "evening": ["Online gaming", "Downloading large files"],
+         "reliability": "Very important", "devices": "15+ devices", "tv_interest": "Yes, definitely",
+         "tv_prefs": ["Live Sports (ESPN, Fox Sports, etc.)", "Premium channels (HBO, Showtime, Starz)"],
+         "mobile_lines": "4+ lines (~$35/line per month)"},
+        {"household": {"people": "2 people"}, "evening": ["Video calls/conferencing"],
+         "reliability": "Critical (work from home) – I need guaranteed uptime", "tv_interest": "Maybe, show me options",
+         "tv_prefs": ["Kids & Family (Disney, Nickelodeon, Cartoon Network)"], "mobile_lines": "2 lines (~$45/line per month)"},
+    ]
+    for n in (10_000, 100_000):
+        plans = synthetic_catalog(n)
+        catalog_arrays(plans)  # build columns outside the timed region
+        for resp in profiles:
+            d = estimate_demand(resp)
+
+            t0 = time.perf_counter()
+            loop = []
+            for p in plans:
+                sc, meta = score_plan(p, d, resp)
+                if sc > -1e8:
+                    loop.append((p, sc, meta))
+            loop.sort(key=lambda x: x[1], reverse=True)
+            t_loop = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            score_catalog(catalog_arrays(plans), d)
+            t_kernel = time.perf_counter() - t0
+
+            vec = rank_catalog(plans, d, resp)
+
+            assert [(p.id, sc) for p, sc, _ in loop] == [(p.id, sc) for p, sc, _ in vec], "score mismatch"
+            t0 = time.perf_counter()
+            rank_catalog(plans, d, resp, top_k=3)
+            t_top = time.perf_counter() - t0
+            print(f"{n:>7} plans  loop {t_loop * 1e3:8.1f} ms  kernel {t_kernel * 1e3:6.1f} ms  "
+                  f"rank top-3 {t_top * 1e3:6.1f} ms  ({len(vec)} feasible, identical)")
+
+
+if __name__ == "__main__":
+    _bench()
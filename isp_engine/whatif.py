@@ -0,0 +1,250 @@
+"""
+What-if tweaks for the results chat: plain-language overrides on a finished wizard.
+
+`WhatIfEvaluator` re-ranks one finished wizard under overrides without
+re-scoring the whole catalog. It knows which demand fields each response
+field feeds (DEMAND_DEPS) and which demand fields each score term reads
+(scoring.SCORE_TERMS), so a tweak like "what if 3 lines" only re-scores the
+mobile and economics terms; headroom, reliability and TV are reused from the
+baseline. Re-scored terms are memoized by their inputs, so going back and forth
+between scenarios in the chat costs a lookup. Results equal rank_plans' exactly.
+
+`WhatIfEvaluator.sweep` runs a whole grid of overrides (e.g. mobile lines x TV
+x reliability) through the same memo: each distinct term input is scored once
+over the catalog, then every cell is a sum of cached columns.
+
+    python -m isp_engine.whatif       # parity check (what-ifs and sweeps) against rank_plans
+"""
+import itertools
+import random
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .catalog import Plan, current_catalog
+from .pricing import bundle_vs_alacarte
+from .scoring import FEASIBILITY_INPUTS, SCORE_TERMS, estimate_demand, infeasible_meta
+
+# Response field -> demand fields it feeds (mirrors scoring.estimate_demand)
+DEMAND_DEPS: Dict[str, Tuple[str, ...]] = {
+    "household": ("n_people", "required_down"),
+    "devices": ("n_devices", "required_down"),
+    "evening": ("required_down", "required_up", "needs_low_latency"),
+    "reliability": ("required_down", "required_up", "needs_low_latency", "high_reliability"),
+    "home_size": ("size",),
+    "tv_interest": ("tv_interest",),
+    "tv_prefs": ("tv_prefs", "tv_pref_mask"),
+    "streaming": ("streaming_now",),
+    "mobile_lines": ("mobile_lines_need",),
+}
+
+TermResult = Tuple[Tuple[float, ...], List[str]]
+
+# Axes the chat sweeps by default (field -> values); reliability only when asked for
+SWEEP_LINES = ["1 line (~$55/month)", "2 lines (~$45/line per month)",
+               "3 lines (~$40/line per month)", "4+ lines (~$35/line per month)"]
+SWEEP_TV = ["Yes, definitely", "No, streaming only"]
+SWEEP_RELIABILITY = ["Critical (work from home) – I need guaranteed uptime", "Very important", "Moderate", "Basic is fine"]
+_AXIS_LABELS = {"mobile_lines": "Lines", "tv_interest": "TV", "reliability": "Reliability"}
+
+
+def parse_overrides(txt: str) -> Dict[str, Any]:
+    """Very light NL parser for common 'what-if' tweaks. Returns only the response fields to change."""
+    out: Dict[str, Any] = {}
+    t = txt.lower()
+
+    # mobile lines
+    m = re.search(r'(\d+)\s*line', t)
+    if m:
+        n = int(m.group(1))
+        if   n <= 1: out["mobile_lines"] = "1 line (~$55/month)"
+        elif n == 2: out["mobile_lines"] = "2 lines (~$45/line per month)"
+        elif n == 3: out["mobile_lines"] = "3 lines (~$40/line per month)"
+        else:        out["mobile_lines"] = "4+ lines (~$35/line per month)"
+
+    # toggle TV
+    if any(k in t for k in ["add tv", "include tv", "tv yes", "cable tv"]):
+        out["tv_interest"] = "Yes, definitely"
+    if any(k in t for k in ["remove tv", "no tv", "streaming only"]):
+        out["tv_interest"] = "No, streaming only"
+
+    # you can add more tweaks (devices/rooms) the same way if desired
+    return out
+
+
+def clone_with_overrides(base: Dict[str, Any], txt: str) -> Dict[str, Any]:
+    """Returns a new responses dict with the tweaks in `txt` applied (answers are never mutated in place)."""
+    return {**base, **parse_overrides(txt)}
+
+
+def sweep_grid(txt: str) -> Dict[str, List[Any]]:
+    """The chat's comparison grid: mobile lines x TV, plus reliability levels if the message mentions them."""
+    grid: Dict[str, List[Any]] = {}
+    if "reliab" in txt.lower() or "uptime" in txt.lower():
+        grid["reliability"] = SWEEP_RELIABILITY
+    grid["mobile_lines"] = SWEEP_LINES
+    grid["tv_interest"] = SWEEP_TV
+    return grid
+
+
+def affected_terms(fields: Iterable[str]) -> Set[str]:
+    """Score terms (plus "feasibility") that can change when these response fields change."""
+    demand_fields = {f for field in fields for f in DEMAND_DEPS.get(field, ())}
+    out = {name for name, _, inputs in SCORE_TERMS if demand_fields.intersection(inputs)}
+    if demand_fields.intersection(FEASIBILITY_INPUTS):
+        out.add("feasibility")
+    return out
+
+
+def _inputs_key(d: Dict[str, Any], fields: Tuple[str, ...]) -> tuple:
+    return tuple(frozenset(d[f]) if isinstance(d[f], set) else d[f] for f in fields)
+
+
+class WhatIfEvaluator:
+    """One per result set: the baseline ranking's per-plan term results, re-used across what-if turns."""
+
+    def __init__(self, base: Dict[str, Any], catalog: Optional[List[Plan]] = None):
+        self.base = base
+        self.catalog = current_catalog().plans if catalog is None else catalog
+        self.demand = estimate_demand(base)
+        # (term, values of the demand fields it reads) -> {plan idx: (points, reasons)}
+        self._terms: Dict[Tuple[str, tuple], Dict[int, TermResult]] = {}
+        # values of FEASIBILITY_INPUTS -> feasible plan indices, in catalog order
+        self._feasible: Dict[tuple, List[int]] = {}
+        self.computed = 0
+        self.reused = 0
+
+    def rank(self, overrides: Dict[str, Any], top_k: Optional[int] = 3
+             ) -> Tuple[List[Tuple[Plan, float, Dict[str, Any]]], Dict[str, Any]]:
+        """Same (ranked, demand) as rank_plans({**base, **overrides}, top_k, use_table=False)."""
+        changed = [f for f, v in overrides.items() if self.base.get(f) != v]
+        dirty = affected_terms(changed)
+        demand = estimate_demand({**self.base, **overrides}) if dirty else self.demand
+
+        feasible = self._feasible_for(demand if "feasibility" in dirty else self.demand)
+        columns = [
+            self._column(name, term, inputs, demand if name in dirty else self.demand, feasible)
+            for name, term, inputs in SCORE_TERMS
+        ]
+
+        scored: List[Tuple[int, float]] = []
+        for i in feasible:
+            score = 0.0
+            for col in columns:
+                for pts in col[i][0]:
+                    score += pts
+            scored.append((i, score))
+        scored.sort(key=lambda x: x[1], reverse=True)
+
+        out = []
+        for i, score in scored[:top_k]:
+            plan = self.catalog[i]
+            reasons = [r for col in columns for r in col[i][1]]
+            out.append((plan, score, {"reasons": reasons, "headroom": plan.down_mbps / max(1, demand["required_down"])}))
+        return out, demand
+
+    def sweep(self, grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """
+        Every combination of `grid` (field -> values), in itertools.product order.
+        Each cell is {overrides, plan, bundle_total, savings}; plan is None when nothing fits.
+        """
+        fields = list(grid)
+        cells = []
+        for values in itertools.product(*(grid[f] for f in fields)):
+            overrides = dict(zip(fields, values))
+            ranked, demand = self.rank(overrides, top_k=1)
+            cell: Dict[str, Any] = {"overrides": overrides, "plan": None, "bundle_total": None, "savings": None}
+            if ranked:
+                plan = ranked[0][0]
+                cost = bundle_vs_alacarte(plan, demand)
+                cell.update(plan=plan, bundle_total=cost["bundle_total"], savings=int(round(cost["savings"])))
+            cells.append(cell)
+        return cells
+
+    def stats(self) -> Dict[str, int]:
+        return {"terms_computed": self.computed, "terms_reused": self.reused, "memo_entries": len(self._terms)}
+
+    # ---------- memoized sub-results ----------
+    def _feasible_for(self, d: Dict[str, Any]) -> List[int]:
+        key = _inputs_key(d, FEASIBILITY_INPUTS)
+        idx = self._feasible.get(key)
+        if idx is None:
+            idx = [i for i, p in enumerate(self.catalog) if infeasible_meta(p, d) is None]
+            self._feasible[key] = idx
+        return idx
+
+    def _column(self, name: str, term, inputs: Tuple[str, ...], d: Dict[str, Any],
+                feasible: List[int]) -> Dict[int, TermResult]:
+        col = self._terms.setdefault((name, _inputs_key(d, inputs)), {})
+        missing = [i for i in feasible if i not in col]
+        for i in missing:
+            col[i] = term(self.catalog[i], d)
+        self.computed += len(missing)
+        self.reused += len(feasible) - len(missing)
+        return col
+
+
+def _short(value: Any) -> str:
+    return str(value).split(" (")[0].split(" –")[0]
+
+
+def render_sweep(grid: Dict[str, List[Any]], cells: List[Dict[str, Any]]) -> str:
+    """Markdown matrix: the last grid axis across, every combination of the others down."""
+    *row_fields, col_field = list(grid)
+    cols = grid[col_field]
+    head = [_AXIS_LABELS.get(f, f) for f in row_fields] + [f"{_AXIS_LABELS.get(col_field, col_field)}: {_short(v)}" for v in cols]
+    lines = ["| " + " | ".join(head) + " |", "|" + "---|" * len(head)]
+    for r in range(0, len(cells), len(cols)):
+        row = cells[r:r + len(cols)]
+        out = [_short(row[0]["overrides"][f]) for f in row_fields]
+        for cell in row:
+            if cell["plan"] is None:
+                out.append("no plan fits")
+            else:
+                out.append(f"**{cell['plan'].name}** · ${cell['bundle_total']}/mo · {cell['savings']:+d}$ vs separate")
+        lines.append("| " + " | ".join(out) + " |")
+    return "\n".join(lines)
+
+
+# =========================
+# Parity check
+# =========================
+def _check(n_profiles: int = 300, seed: int = 5) -> int:
+    from .scoring import rank_plans
+    from .vector import synthetic_catalog
+    from .wizard import sample_responses
+
+    rng = random.Random(seed)
+    texts = ["what if 3 lines", "add tv", "what if I had 1 line and no tv", "streaming only",
+             "how much for 5 lines?", "2 lines with cable tv", "what about the weather"]
+    failures = 0
+    for catalog in (current_catalog().plans, synthetic_catalog(500)):
+        ev_calls = 0
+        for _ in range(n_profiles):
+            base = sample_responses(rng)
+            ev = WhatIfEvaluator(base, catalog=catalog)
+            for txt in texts + texts:          # second pass: every term should come from the memo
+                overrides = parse_overrides(txt)
+                got = ev.rank(overrides, top_k=3)
+                want = rank_plans({**base, **overrides}, top_k=3, catalog=catalog, use_table=False)
+                ev_calls += 1
+                if [(p.id, s, m) for p, s, m in got[0]] != [(p.id, s, m) for p, s, m in want[0]] or got[1] != want[1]:
+                    failures += 1
+                    print(f"FAIL: {txt!r} on {base}")
+            grid = sweep_grid("reliability")
+            for cell in ev.sweep(grid):
+                ranked, demand = rank_plans({**base, **cell["overrides"]}, top_k=1, catalog=catalog, use_table=False)
+                want_id = ranked[0][0].id if ranked else None
+                got_id = cell["plan"].id if cell["plan"] is not None else None
+                if got_id != want_id or (ranked and cell["bundle_total"] != bundle_vs_alacarte(ranked[0][0], demand)["bundle_total"]):
+                    failures += 1
+                    print(f"FAIL: sweep cell {cell['overrides']} on {base}")
+        print(f"{len(catalog)} plans: {ev_calls} what-ifs + sweeps, last session {ev.stats()}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_check())
@@ -0,0 +1,71 @@
+"""Wizard questions and their fixed answer options."""
+
+
+# =========================
+# Wizard answer space (shared by the UI steps and the precomputed table)
+# =========================
+PEOPLE_OPTIONS = ["Just me", "2 people", "3–4 people", "5+ people"]
+HOUSEHOLD_TYPE_OPTIONS = ["Single/Couple", "Family with kids", "Roommates", "Remote workers", "Retired/Light users"]
+PEAK_OPTIONS = [
+    "Streaming video (Netflix, YouTube, etc.)",
+    "Online gaming",
+    "Video calls/conferencing",
+    "Multiple people doing different things at once",
+    "Downloading large files",
+    "Smart home devices actively used",
+]
+RELIABILITY_OPTIONS = ["Critical (work from home) – I need guaranteed uptime", "Very important", "Moderate", "Basic is fine"]
+DEVICES_OPTIONS = ["1–5 devices", "6–10 devices", "11–15 devices", "15+ devices"]
+HOME_SIZE_OPTIONS = ["Small (1–2 bedrooms)", "Medium (3 bedrooms)", "Large (4+ bedrooms)", "Multi-story"]
+TV_INTEREST_OPTIONS = ["Yes, definitely", "Maybe, show me options", "No, streaming only", "Not sure"]
+TV_WANTED = ["Yes, definitely", "Maybe, show me options"]
+TV_PREF_OPTIONS = [
+    "Live Sports (ESPN, Fox Sports, etc.)",
+    "News (CNN, Fox News, MSNBC, etc.)",
+    "Movies & Entertainment (TNT, USA, TBS, etc.)",
+    "Kids & Family (Disney, Nickelodeon, Cartoon Network)",
+    "Premium channels (HBO, Showtime, Starz)",
+    "International/Spanish language",
+]
+STREAMING_OPTIONS = ["Yes, multiple services (3+)", "Yes, 1–2 services", "No"]
+MOBILE_LINES_OPTIONS = ["1 line (~$55/month)", "2 lines (~$45/line per month)", "3 lines (~$40/line per month)", "4+ lines (~$35/line per month)"]
+
+def skips_peak_step(people: str, hh_type: str) -> bool:
+    """Small, light households jump straight from step 1 to step 3."""
+    return people in ["Just me", "2 people"] and hh_type in ["Single/Couple", "Retired/Light users"]
+
+
+def sample_responses(rng) -> dict:
+    """A random completed wizard (any `random.Random`), following the same branches as the UI."""
+    people, hh_type = rng.choice(PEOPLE_OPTIONS), rng.choice(HOUSEHOLD_TYPE_OPTIONS)
+    resp = {
+        "household": {"people": people, "type": hh_type},
+        "reliability": rng.choice(RELIABILITY_OPTIONS),
+        "devices": rng.choice(DEVICES_OPTIONS),
+        "home_size": rng.choice(HOME_SIZE_OPTIONS),
+        "tv_interest": rng.choice(TV_INTEREST_OPTIONS),
+        "streaming": rng.choice(STREAMING_OPTIONS),
+        "mobile_lines": rng.choice(MOBILE_LINES_OPTIONS),
+    }
+    if not skips_peak_step(people, hh_type):
+        resp["evening"] = [o for o in PEAK_OPTIONS if rng.random() < 0.5]
+    if resp["tv_interest"] in TV_WANTED:
+        resp["tv_prefs"] = [o for o in TV_PREF_OPTIONS if rng.random() < 0.5]
+    return resp
+
+
+def with_defaults(partial: dict) -> dict:
+    """A partial wizard completed with the answers the UI preselects (first radio option, empty multiselects)."""
+    resp = {
+        "household": {"people": PEOPLE_OPTIONS[0], "type": HOUSEHOLD_TYPE_OPTIONS[0]},
+        "evening": [],
+        "reliability": RELIABILITY_OPTIONS[0],
+        "devices": DEVICES_OPTIONS[0],
+        "home_size": HOME_SIZE_OPTIONS[0],
+        "tv_interest": TV_INTEREST_OPTIONS[0],
+        "tv_prefs": [],
+        "streaming": STREAMING_OPTIONS[0],
+        "mobile_lines": MOBILE_LINES_OPTIONS[0],
+    }
+    resp.update(partial)
+    return resp
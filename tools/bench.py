@@ -0,0 +1,191 @@
+"""
+Micro-benchmarks for the engine's hot paths, with a saved baseline.
+
+Each case runs over synthetic wizard profiles drawn from the whole answer
+space (isp_engine.wizard.sample_responses) and, for ranking, over synthetic
+catalogs of increasing size. Timings are per call: calls run in small batches
+sized so the timer overhead stays negligible, and p50/p99 are over batches
+(best of a few rounds, so one noisy moment on the machine doesn't fail a run).
+The run fails (exit 1) when a case's p50 or p99 is slower than the baseline by
+more than the tolerance.
+
+    python tools/bench.py                   # compare with tools/bench_baseline.json
+    python tools/bench.py --save            # record a new baseline
+    python tools/bench.py --only rank_plans --catalog-sizes 8,1000,100000
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.pop("ANTHROPIC_API_KEY", None)  # fallbacks only: never time a network call
+
+from isp_engine.catalog import PLAN_CATALOG  # noqa: E402
+from isp_engine.narration import narrative_fallback, ranked_fallback  # noqa: E402
+from isp_engine.pricing import bundle_vs_alacarte, map_tv_prefs_to_codes  # noqa: E402
+from isp_engine.scoring import estimate_demand, rank_plans, score_plan  # noqa: E402
+from isp_engine.whatif import WhatIfEvaluator, clone_with_overrides, parse_overrides, sweep_grid  # noqa: E402
+from isp_engine.wizard import sample_responses  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "tools", "bench_baseline.json")
+WHATIF_TEXTS = ["what if 3 lines", "add tv", "what if I had 1 line and no tv", "streaming only", "how much for 5 lines?"]
+
+Case = Tuple[Callable[..., Any], List[tuple]]
+
+
+def synthetic_profiles(n: int, seed: int = 11) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [sample_responses(rng) for _ in range(n)]
+
+
+def _warm_evaluator(responses: Dict[str, Any]) -> WhatIfEvaluator:
+    ev = WhatIfEvaluator(responses)
+    ev.rank({})
+    return ev
+
+
+def build_cases(n_profiles: int, catalog_sizes: List[int]) -> Dict[str, Case]:
+    profiles = synthetic_profiles(n_profiles)
+    demands = [estimate_demand(r) for r in profiles]
+    plans = [PLAN_CATALOG[i % len(PLAN_CATALOG)] for i in range(n_profiles)]
+    scored = [score_plan(p, d, r) for p, d, r in zip(plans, demands, profiles)]
+    alts = [{"name": p.name, "role": "Runner-up", "price": p.base_price, "savings": 0} for p in PLAN_CATALOG[:2]]
+
+    cases: Dict[str, Case] = {
+        "estimate_demand": (estimate_demand, [(r,) for r in profiles]),
+        "score_plan": (score_plan, list(zip(plans, demands, profiles))),
+        "bundle_vs_alacarte": (bundle_vs_alacarte, list(zip(plans, demands))),
+        "map_tv_prefs_to_codes": (map_tv_prefs_to_codes, [(d["tv_prefs"],) for d in demands]),
+        "narrative_fallback": (narrative_fallback, [(p, d, m["reasons"]) for p, d, (_, m) in zip(plans, demands, scored)]),
+        "ranked_fallback": (ranked_fallback, [
+            (p, d, 10 * (i % 5) - 15, m["headroom"], i % 3, alts)
+            for i, (p, d, (_, m)) in enumerate(zip(plans, demands, scored))
+        ]),
+        "clone_with_overrides": (clone_with_overrides, [(r, WHATIF_TEXTS[i % len(WHATIF_TEXTS)]) for i, r in enumerate(profiles)]),
+        # a chat turn on an existing result set (baseline terms already memoized)
+        "whatif_rank": (lambda ev, o: ev.rank(o, top_k=3), [
+            (_warm_evaluator(r), parse_overrides(WHATIF_TEXTS[i % len(WHATIF_TEXTS)])) for i, r in enumerate(profiles)
+        ]),
+        # "compare scenarios with reliability": 4 x 4 x 2 cells, fresh memo each time
+        "whatif_sweep": (lambda r: WhatIfEvaluator(r).sweep(sweep_grid("reliability")), [(r,) for r in profiles]),
+    }
+    if catalog_sizes:
+        from isp_engine.vector import synthetic_catalog
+    for n in catalog_sizes:
+        catalog = PLAN_CATALOG if n == len(PLAN_CATALOG) else synthetic_catalog(n)
+        # use_table=False: time the scorer itself, whether or not a reco table is built here
+        cases[f"rank_plans[{n}]"] = (
+            lambda r, c=catalog: rank_plans(r, top_k=3, catalog=c, use_table=False),
+            [(r,) for r in profiles],
+        )
+    return cases
+
+
+def measure(fn: Callable[..., Any], inputs: List[tuple], samples: int, max_s: float) -> Dict[str, float]:
+    """Per-call p50/p99 in microseconds."""
+    def batch(k: int, start: int) -> float:
+        t0 = time.perf_counter()
+        for j in range(start, start + k):
+            fn(*inputs[j % len(inputs)])
+        return time.perf_counter() - t0
+
+    batch(min(len(inputs), 50), 0)  # warm caches (catalog arrays, regexes, ...)
+    inner = 1
+    while batch(inner, 0) < 200e-6 and inner < 4096:
+        inner *= 2
+
+    timings, pos, deadline = [], 0, time.perf_counter() + max_s
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(timings) < samples and (len(timings) < 20 or time.perf_counter() < deadline):
+            timings.append(batch(inner, pos) / inner * 1e6)
+            pos += inner
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    timings.sort()
+    return {
+        "p50_us": round(timings[len(timings) // 2], 3),
+        "p99_us": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        "samples": len(timings),
+        "batch": inner,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            p50_tol: float, p99_tol: float, min_delta_us: float) -> List[str]:
+    failures = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key, tol in (("p50_us", p50_tol), ("p99_us", p99_tol)):
+            if r[key] > base[key] * (1 + tol) and r[key] - base[key] > min_delta_us:
+                failures.append(f"{name} {key[:3]}: {r[key]:.2f} us vs baseline {base[key]:.2f} us "
+                                f"(+{r[key] / base[key] - 1:.0%}, tolerance {tol:.0%})")
+    return failures
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save", action="store_true", help="write results as the new baseline instead of comparing")
+    ap.add_argument("--only", default="", help="run cases whose name contains this substring")
+    ap.add_argument("--profiles", type=int, default=2000)
+    ap.add_argument("--catalog-sizes", default="8,1000,10000")
+    ap.add_argument("--samples", type=int, default=1000, help="batches per round")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--max-seconds", type=float, default=1.0, help="per-round time cap (at least 20 samples)")
+    ap.add_argument("--p50-tolerance", type=float, default=float(os.getenv("BENCH_P50_TOLERANCE", "0.25")))
+    ap.add_argument("--p99-tolerance", type=float, default=float(os.getenv("BENCH_P99_TOLERANCE", "0.50")))
+    ap.add_argument("--min-delta-us", type=float, default=0.5, help="ignore regressions smaller than this")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.catalog_sizes.split(",") if s.strip()]
+    cases = {k: v for k, v in build_cases(args.profiles, sizes).items() if args.only in k}
+
+    results = {}
+    print(f"{'case':<24}{'p50 us':>12}{'p99 us':>12}{'samples':>9}")
+    for name, (fn, inputs) in cases.items():
+        rounds = [measure(fn, inputs, args.samples, args.max_seconds) for _ in range(args.rounds)]
+        results[name] = r = {**rounds[0], "p50_us": min(x["p50_us"] for x in rounds),
+                             "p99_us": min(x["p99_us"] for x in rounds)}
+        print(f"{name:<24}{r['p50_us']:>12.2f}{r['p99_us']:>12.2f}{r['samples']:>9}")
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                saved = json.load(f).get("cases", {})
+        saved.update(results)  # a filtered run only replaces its own cases
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "cases": saved}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save first")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["cases"]
+    failures = compare(results, baseline, args.p50_tolerance, args.p99_tolerance, args.min_delta_us)
+    for line in failures:
+        print(f"FAIL: {line}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Count scoring and LLM work per results-page chat turn, through the real app.
+
+Runs app.py under streamlit's AppTest with the LLM simulator (LLM_BACKEND=sim,
+no key, no network), jumps a session to the results page and sends a few chat
+turns. Ranking, card building, card narration, what-if evaluations and LLM
+calls are counted around each turn. The results page must rank once and
+narrate each card once; a chat turn must not re-rank, rebuild or re-narrate
+the cards, and may run at most one what-if evaluation (a single scenario or
+one sweep) and one LLM call (the reply's polish). AppTest answers a chat
+input with a full script rerun rather than the fragment alone, so this holds
+the budget even for full reruns of the results page. Exit 1 when a turn goes
+over it.
+
+    python tools/check_chat_fragment.py [--turns 6]
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from functools import wraps
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.pop("ANTHROPIC_API_KEY", None)
+os.environ.pop("ENGINE_URL", None)
+os.environ.update({"LLM_BACKEND": "sim", "LLM_SIM_TTFT_MS": "2", "LLM_SIM_TTFT_P95_MS": "4",
+                   "LLM_SIM_TOKENS_PER_S": "20000", "NARRATIVE_CACHE_PATH": "", "SESSION_SPILL_PATH": "",
+                   "PREFETCH_FROM_STEP": "10"})
+
+import isp_engine.results as results  # noqa: E402
+from isp_engine.engine import LocalEngine  # noqa: E402
+from isp_engine.narration import get_client  # noqa: E402
+from isp_engine.sessions import default_sessions  # noqa: E402
+
+TEXTS = ["what if 3 lines", "add tv", "compare scenarios", "what happens after 12 months?",
+         "what if I had 1 line and no tv", "can I cancel anytime?"]
+ANSWERS = {
+    "household": {"people": "3–4 people", "type": "Family with kids"},
+    "evening": ["Streaming video (Netflix, YouTube, etc.)", "Online gaming"],
+    "reliability": "Very important",
+    "devices": "11–15 devices",
+    "home_size": "Medium (3 bedrooms)",
+    "tv_interest": "Yes, definitely",
+    "tv_prefs": ["Live Sports (ESPN, Fox Sports, etc.)"],
+    "streaming": "No",
+    "mobile_lines": "2 lines (~$45/line per month)",
+}
+PAGE_BUDGET = {"rank_plans": 1, "cards": 1, "narrated_cards": 3}
+TURN_BUDGET = {"rank_plans": 0, "cards": 0, "narrated_cards": 0, "whatif": 1, "llm": 1}
+
+CALLS: Counter = Counter()
+
+
+def counted(name, fn, weight=lambda *args, **kwargs: 1):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        CALLS[name] += weight(*args, **kwargs)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def snapshot() -> Counter:
+    return Counter({**CALLS, "llm": get_client().simulator.calls})
+
+
+def over_budget(used: Counter, budget: dict) -> list:
+    return [f"{k} {used[k]} > {v}" for k, v in budget.items() if used[k] > v]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--turns", type=int, default=len(TEXTS))
+    args = ap.parse_args()
+
+    from streamlit.testing.v1 import AppTest
+
+    results.rank_plans = counted("rank_plans", results.rank_plans)
+    LocalEngine.cards = counted("cards", LocalEngine.cards)
+    LocalEngine.narrate = counted("narrated_cards", LocalEngine.narrate, lambda self, jobs, **kw: len(jobs))
+    LocalEngine.whatif = counted("whatif", LocalEngine.whatif)
+    LocalEngine.sweep = counted("whatif", LocalEngine.sweep)
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.run()
+    sess = default_sessions().get(at.session_state.sid)
+    for field, value in ANSWERS.items():
+        sess.answer(field, value)
+    sess.step = 10
+
+    failures = []
+    before = snapshot()
+    at.run()
+    page = snapshot() - before
+    print(f"results page: {dict(page)}")
+    failures += [f"results page: {f}" for f in over_budget(page, PAGE_BUDGET)]
+    if at.exception:
+        failures.append(f"results page raised: {at.exception[0].message}")
+
+    for i in range(args.turns):
+        text = TEXTS[i % len(TEXTS)]
+        before = snapshot()
+        at.chat_input[0].set_value(text).run()
+        used = snapshot() - before
+        print(f"chat {text!r}: {dict(used) or 'nothing'}")
+        failures += [f"chat {text!r}: {f}" for f in over_budget(used, TURN_BUDGET)]
+        if at.exception:
+            failures.append(f"chat {text!r} raised: {at.exception[0].message}")
+    if len(sess.chat) != 2 * args.turns:
+        failures.append(f"chat log has {len(sess.chat)} messages, expected {2 * args.turns}")
+
+    for f in failures:
+        print(f"FAIL: {f}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Check that streamed chat replies keep the computed dollar amounts.
+
+Runs chat turns over sampled wizards with LLM_BACKEND=sim. The simulator
+replays a cassette built here: for each turn's draft it holds either a
+faithful rewording or one with a dollar amount changed. For every turn:
+  - the numeric draft must come first;
+  - every streamed text and the final reply may only show amounts that the
+    engine computed for that scenario (recomputed here, independently of the
+    chat module);
+  - rewordings must reach the screen polished;
+  - tampered replies must end on the draft.
+The same runs go through isp_engine.service with --remote. Exit 1 on any mismatch.
+
+    python tools/check_chat_stream.py [--profiles 60] [--remote]
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+SCRATCH = tempfile.mkdtemp(prefix="isp-chat-")
+CASSETTE = os.path.join(SCRATCH, "polish.jsonl")
+os.environ.pop("ANTHROPIC_API_KEY", None)
+os.environ.update({"LLM_BACKEND": "sim", "LLM_CASSETTE": CASSETTE, "LLM_SIM_TTFT_MS": "2", "LLM_SIM_TTFT_P95_MS": "4",
+                   "LLM_SIM_TOKENS_PER_S": "20000", "NARRATIVE_CACHE_PATH": ""})
+
+from isp_engine.chat import POST_PROMO_DELTA, draft_chat, stream_chat  # noqa: E402
+from isp_engine.engine import LocalEngine, RemoteEngine  # noqa: E402
+from isp_engine.llm_sim import Cassette, request_key  # noqa: E402
+from isp_engine.narration import _polish_request, dollar_amounts  # noqa: E402
+from isp_engine.whatif import parse_overrides  # noqa: E402
+from isp_engine.wizard import sample_responses  # noqa: E402
+
+TEXTS = ["what if 3 lines", "add tv", "what if I had 1 line and no tv", "how much for 5 lines?",
+         "what happens after 12 months?", "can I cancel anytime?"]
+
+
+def expected_amounts(engine, responses, cards, text):
+    """The dollar figures a reply to `text` may state, from the engine directly."""
+    t = text.lower()
+    base_plan, base_cost = cards[0]["plan"], cards[0]["cost"]
+    if "12 months" in t or "year" in t:
+        return {base_plan.base_price, base_plan.base_price + POST_PROMO_DELTA, POST_PROMO_DELTA}
+    if any(k in t for k in ("lock", "contract", "trial", "cancel", "money back")):
+        return set()
+    ranked, demand = engine.whatif(responses, parse_overrides(text), top_k=3)
+    plan = ranked[0][0]
+    cost = engine.bundle(plan, demand)
+    delta = abs(int(round(cost["bundle_total"] - base_cost["bundle_total"])))
+    return {plan.base_price, cost["bundle_total"], cost["alacarte_total"], int(round(cost["savings"]))} | (
+        {delta} if delta else set())
+
+
+def reword(draft: str) -> str:
+    return "Here is how that works out for you. " + re.sub(r"\*\*|\n+", " ", draft).strip()
+
+
+def tamper(draft: str) -> str:
+    return re.sub(r"\$(\d+)", lambda m: f"${int(m.group(1)) + 1000}", reword(draft), count=1)
+
+
+def start_service():
+    proc = subprocess.Popen([sys.executable, "-m", "isp_engine.service", "--port", "0", "--workers", "1"],
+                            cwd=ROOT, env=dict(os.environ), stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if "http://" not in line:
+        proc.kill()
+        raise SystemExit(f"FAIL: service did not start: {line!r}")
+    return proc, line.split()[2]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--profiles", type=int, default=60)
+    ap.add_argument("--remote", action="store_true", help="also stream through isp_engine.service")
+    args = ap.parse_args()
+
+    local = LocalEngine()
+    rng = random.Random(25)
+    turns = []   # (responses, cards, text, draft, tampered)
+    cassette = Cassette(CASSETTE)
+    for _ in range(args.profiles):
+        responses = sample_responses(rng)
+        _, cards = local.cards(responses)
+        for text in TEXTS:
+            draft, polish = draft_chat(local, responses, cards, text)
+            # the same draft can come up again (e.g. post-promo notes): decide from its text
+            tampered = polish and bool(dollar_amounts(draft)) and sum(map(ord, draft)) % 2 == 1
+            if polish:
+                cassette.put(request_key(_polish_request(draft)), tamper(draft) if tampered else reword(draft), {})
+            turns.append((responses, cards, text, draft, tampered))
+
+    engines = [("local", local)]
+    proc = None
+    if args.remote:
+        proc, url = start_service()
+        engines.append(("remote", RemoteEngine(url)))
+
+    failures = 0
+
+    def fail(msg: str) -> None:
+        nonlocal failures
+        failures += 1
+        if failures <= 5:
+            print(f"FAIL: {msg}")
+
+    try:
+        for name, engine in engines:
+            polished = kept_draft = 0
+            for responses, cards, text, draft, tampered in turns:
+                allowed = {float(a) for a in expected_amounts(local, responses, cards, text)}
+                stream = list(stream_chat(engine, responses, cards, text))
+                if stream[0][0] != draft or not stream[-1][1] or any(done for _, done in stream[:-1]):
+                    fail(f"{name} {text!r}: draft first / done last")
+                    continue
+                for shown, _ in stream:
+                    if not set(dollar_amounts(shown)) <= allowed:
+                        fail(f"{name} {text!r}: showed {sorted(set(dollar_amounts(shown)) - allowed)} "
+                             f"not in computed {sorted(allowed)}")
+                        break
+                final = stream[-1][0]
+                if tampered and final != draft:
+                    fail(f"{name} {text!r}: tampered reply was not replaced by the draft")
+                if not tampered and len(stream) > 1 and final != reword(draft):
+                    fail(f"{name} {text!r}: polished reply not delivered: {final[:80]!r}")
+                polished += final != draft
+                kept_draft += len(stream) > 1 and final == draft
+            print(f"{name}: {len(turns)} turns, {polished} polished, {kept_draft} fell back to the draft")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    if failures:
+        print(f"FAIL: {failures} mismatches")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Cold-import regression check for the headless engine.
+
+Runs `python -X importtime` on the imports a scoring worker needs and fails
+(exit 1) if they pull in UI/LLM/array dependencies or take longer than the
+budget. Interpreter start-up imports (measured with `-c pass`) are excluded.
+
+    python tools/check_importtime.py [--budget-ms 40] [--stmt "from isp_engine import rank_plans"]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STMT = "import isp_engine; from isp_engine import estimate_demand, rank_plans, bundle_vs_alacarte"
+FORBIDDEN = ("streamlit", "anthropic", "numpy", "dotenv", "httpx", "pandas")
+
+
+def _importtime(stmt: str) -> Dict[str, Tuple[int, int]]:
+    """module -> (self us, cumulative us) for a fresh interpreter running `stmt`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", stmt],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    out = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        out[name.strip()] = (int(self_us), int(cum_us))
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORTTIME_BUDGET_MS", "40")))
+    ap.add_argument("--stmt", default=DEFAULT_STMT)
+    args = ap.parse_args()
+
+    startup = _importtime("pass")
+    # best of 3: the first run also pays for writing .pyc files
+    runs = [_importtime(args.stmt) for _ in range(3)]
+    added = min(({m: t for m, t in run.items() if m not in startup} for run in runs),
+                key=lambda r: sum(s for s, _ in r.values()))
+    total_ms = sum(s for s, _ in added.values()) / 1000
+
+    print(f"{args.stmt}\n  {len(added)} modules, {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, (self_us, _) in sorted(added.items(), key=lambda kv: -kv[1][0])[:8]:
+        print(f"  {self_us / 1000:7.2f} ms  {name}")
+
+    bad = sorted(m for m in added if m.split(".")[0] in FORBIDDEN)
+    if bad:
+        print(f"FAIL: heavy dependencies imported: {', '.join(bad)}")
+        return 1
+    if total_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
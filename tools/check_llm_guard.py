@@ -0,0 +1,122 @@
+"""
+Drive the LLM guard against a local Messages API stub that injects latency and errors.
+
+Starts a throwaway HTTP stub on 127.0.0.1, points an Anthropic client at it
+and walks the breaker through: healthy -> error burst trips it -> calls fail
+fast while open -> half-open probe recovers it -> slow responses trip it on
+p95 -> a hung call is cut off by the per-call timeout. Exit 1 on any mismatch.
+
+    python tools/check_llm_guard.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from isp_engine.llm_guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, LLMGuard  # noqa: E402
+
+FAULTS = {"delay_s": 0.0, "status": 200}
+MESSAGE = {
+    "id": "msg_stub", "type": "message", "role": "assistant", "model": "stub",
+    "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 1, "output_tokens": 1},
+}
+
+
+class _Stub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(FAULTS["delay_s"])
+        status = FAULTS["status"]
+        body = json.dumps(MESSAGE if status == 200 else
+                          {"type": "error", "error": {"type": "api_error", "message": "injected"}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main() -> int:
+    from anthropic import Anthropic
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Anthropic(api_key="stub", base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+    breaker = CircuitBreaker(window_s=60, min_calls=4, error_rate=0.5, p95_budget_s=0.2, cooldown_s=0.5)
+    guard = LLMGuard(breaker, timeout_s=1.0)
+    failures = []
+
+    def call() -> str:
+        t0 = time.perf_counter()
+        try:
+            guard.create(client, model="stub", max_tokens=5, messages=[{"role": "user", "content": "hi"}])
+            outcome = "ok"
+        except CircuitOpenError:
+            outcome = "short_circuit"
+        except Exception as e:
+            outcome = type(e).__name__
+        return f"{outcome} in {(time.perf_counter() - t0) * 1000:.0f} ms"
+
+    def expect(label: str, state: str) -> None:
+        got = breaker.state
+        print(f"  -> breaker {got} ({breaker.last_trip_reason or '-'})")
+        if got != state:
+            failures.append(f"{label}: expected {state}, got {got}")
+
+    print("healthy")
+    for _ in range(4):
+        print("  ", call())
+    expect("healthy", CLOSED)
+
+    print("error burst (HTTP 500)")
+    FAULTS["status"] = 500
+    for _ in range(4):
+        print("  ", call())
+    expect("error burst", OPEN)
+    fast = call()
+    print("   while open:", fast)
+    if not fast.startswith("short_circuit"):
+        failures.append(f"open breaker should fail fast, got {fast}")
+
+    print("cooldown, API healthy again")
+    FAULTS["status"] = 200
+    time.sleep(0.6)
+    expect("cooldown", HALF_OPEN)
+    print("   probe:", call())
+    expect("probe", CLOSED)
+
+    print("brownout (0.3 s responses, p95 budget 0.2 s)")
+    FAULTS["delay_s"] = 0.3
+    for _ in range(4):
+        print("  ", call())
+    expect("brownout", OPEN)
+
+    print("hang (3 s responses, 1 s per-call timeout)")
+    time.sleep(0.6)
+    FAULTS["delay_s"] = 3.0
+    t0 = time.perf_counter()
+    print("   probe:", call())
+    if time.perf_counter() - t0 > 2.0:
+        failures.append("per-call timeout did not cut the hung call")
+    expect("hang", OPEN)
+
+    server.shutdown()
+    for f in failures:
+        print(f"FAIL: {f}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
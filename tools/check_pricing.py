@@ -0,0 +1,107 @@
+"""
+Differential check: compiled pricing tables vs the pricing formula, over the whole input domain.
+
+For every plan, every mobile line count the tables cover (plus a few past
+the end and a negative one), every TV interest answer, every TV preference
+mask and a download need on each side of every internet bracket boundary,
+`bundle_vs_alacarte` (table lookups) must return exactly the same breakdown as
+`reference_bundle_vs_alacarte` (the formula). Runs on the shipped catalog and
+on a synthetic one compiled the same way, so plans with and without TV, DVR
+and included lines are all covered. Exit 1 on any difference.
+
+    python tools/check_pricing.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Iterator, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from isp_engine.catalog import (  # noqa: E402
+    CATALOG_PATH, N_TV_MASKS, PRICE_TABLE_LINES, CatalogSnapshot, compile_catalog, mask_codes, pin_catalog,
+)
+from isp_engine.pricing import TV_PREF_BIT, bundle_vs_alacarte, reference_bundle_vs_alacarte  # noqa: E402
+from isp_engine.wizard import TV_INTEREST_OPTIONS  # noqa: E402
+
+_LABEL_BY_BIT = {bit: label for label, bit in TV_PREF_BIT.items()}
+
+
+def speeds(cat: CatalogSnapshot) -> List[int]:
+    """A download need on each side of every bracket edge, plus beyond the last one."""
+    out = {0, 1}
+    for lo, hi, _ in cat.internet_brackets:
+        out.update((lo - 1, lo, lo + 1, hi - 1, hi, hi + 1))
+    out.add(cat.internet_brackets[-1][1] * 10)
+    return sorted(s for s in out if s >= 0)
+
+
+def demands(cat: CatalogSnapshot) -> Iterator[Dict[str, Any]]:
+    for tv_interest in TV_INTEREST_OPTIONS:
+        for mask in range(N_TV_MASKS):
+            prefs = {_LABEL_BY_BIT[1 << i] for i in range(N_TV_MASKS.bit_length() - 1) if mask >> i & 1}
+            for lines in [-1] + list(range(PRICE_TABLE_LINES + 3)):
+                for need in speeds(cat):
+                    yield {"mobile_lines_need": lines, "tv_interest": tv_interest, "tv_prefs": prefs,
+                           "tv_pref_mask": mask, "required_down": need}
+
+
+def check(cat: CatalogSnapshot, label: str) -> int:
+    pin_catalog(cat)
+    n = failures = 0
+    t_table = t_ref = 0.0
+    for d in demands(cat):
+        for plan in cat.plans:
+            t0 = time.perf_counter()
+            got = bundle_vs_alacarte(plan, d)
+            t1 = time.perf_counter()
+            want = reference_bundle_vs_alacarte(plan, d)
+            t_ref += time.perf_counter() - t1
+            t_table += t1 - t0
+            n += 1
+            if got != want:
+                failures += 1
+                if failures <= 5:
+                    print(f"FAIL: {label} {plan.id} packs={mask_codes(plan.pack_mask)} demand={d}\n"
+                          f"      table {got}\n      formula {want}")
+    print(f"{label}: {n} cases, {len(cat.plans)} plans; "
+          f"table {t_table / n * 1e6:.2f} us vs formula {t_ref / n * 1e6:.2f} us per call")
+    return failures
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--catalog", default=CATALOG_PATH)
+    ap.add_argument("--synthetic", type=int, default=40, help="plans in the synthetic catalog (0 = skip)")
+    args = ap.parse_args()
+
+    with open(args.catalog, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    shipped = compile_catalog(doc, source=args.catalog)
+    failures = check(shipped, "shipped catalog")
+
+    if args.synthetic:
+        pin_catalog(shipped)
+        from isp_engine.vector import synthetic_catalog
+        plans = []
+        for p in synthetic_catalog(args.synthetic):
+            row = asdict(p)
+            row.pop("pack_mask")
+            row["tv_packs"], row["notes"] = list(row["tv_packs"]), list(row["notes"])
+            row["base_price"] = max(0, row["base_price"])
+            plans.append(row)
+        failures += check(compile_catalog({**doc, "plans": plans}, source="synthetic"), "synthetic catalog")
+
+    if failures:
+        print(f"FAIL: {failures} differences")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
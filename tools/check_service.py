@@ -0,0 +1,129 @@
+"""
+Run the engine service and check that it answers exactly like the in-process engine.
+
+Starts `python -m isp_engine.service` on a free port (no ANTHROPIC_API_KEY, so
+narration and polish take their deterministic paths), then compares
+RemoteEngine with LocalEngine on sampled wizards: cards, full rankings, bundle
+costs, chat what-ifs and scenario sweeps must be equal (plans resolve to the
+same catalog objects), narration streams end on the same copy. It then fires
+concurrent requests to exercise batching, checks that a dead service degrades
+to in-process answers, and prints local vs remote latency. Exit 1 on any mismatch.
+
+    python tools/check_service.py [--workers 2] [--profiles 150]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.pop("ANTHROPIC_API_KEY", None)
+
+from isp_engine.engine import LocalEngine, RemoteEngine  # noqa: E402
+from isp_engine.results import card_jobs  # noqa: E402
+from isp_engine.telemetry import REGISTRY  # noqa: E402
+from isp_engine.whatif import parse_overrides, sweep_grid  # noqa: E402
+from isp_engine.wizard import sample_responses  # noqa: E402
+
+TEXTS = ["what if 3 lines", "add tv", "what if I had 1 line and no tv", "how much for 5 lines?"]
+
+
+def start(workers: int):
+    env = {k: v for k, v in os.environ.items() if k != "ANTHROPIC_API_KEY"}
+    env["NARRATIVE_CACHE_PATH"] = ""
+    proc = subprocess.Popen([sys.executable, "-m", "isp_engine.service", "--port", "0", "--workers", str(workers)],
+                            cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if "http://" not in line:
+        proc.kill()
+        raise SystemExit(f"FAIL: service did not start: {line!r}")
+    return proc, line.split()[2]
+
+
+def same_ranked(a, b) -> bool:
+    return [(p, s, m) for p, s, m in a] == [(p, s, m) for p, s, m in b] and all(x is y for (x, _, _), (y, _, _) in zip(a, b))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--profiles", type=int, default=150)
+    args = ap.parse_args()
+
+    proc, url = start(args.workers)
+    local, remote = LocalEngine(), RemoteEngine(url)
+    rng = random.Random(3)
+    profiles = [sample_responses(rng) for _ in range(args.profiles)]
+    failures = 0
+
+    def fail(msg: str) -> None:
+        nonlocal failures
+        failures += 1
+        if failures <= 5:
+            print(f"FAIL: {msg}")
+
+    try:
+        t_local = t_remote = 0.0
+        for r in profiles:
+            t0 = time.perf_counter()
+            want = local.cards(r)
+            t1 = time.perf_counter()
+            got = remote.cards(r)
+            t_local += t1 - t0
+            t_remote += time.perf_counter() - t1
+            if got != want or any(g["plan"] is not w["plan"] for g, w in zip(got[1], want[1])):
+                fail(f"cards {r}")
+            if not same_ranked(remote.rank(r, top_k=None)[0], local.rank(r, top_k=None)[0]):
+                fail(f"rank {r}")
+            demand, cards = want
+            for card in cards:
+                if remote.bundle(card["plan"], demand) != local.bundle(card["plan"], demand):
+                    fail(f"bundle {card['plan'].id} {r}")
+            for txt in TEXTS:
+                g, w = remote.whatif(r, parse_overrides(txt)), local.whatif(r, parse_overrides(txt))
+                if not same_ranked(g[0], w[0]) or g[1] != w[1]:
+                    fail(f"whatif {txt!r} {r}")
+            if remote.sweep(r, sweep_grid("reliability")) != local.sweep(r, sweep_grid("reliability")):
+                fail(f"sweep {r}")
+        print(f"{len(profiles)} wizards: cards local {t_local / len(profiles) * 1e3:.2f} ms, "
+              f"remote {t_remote / len(profiles) * 1e3:.2f} ms per call")
+
+        demand, cards = local.cards(profiles[0])
+        jobs = card_jobs(demand, cards)
+        final = lambda stream: {i: t for i, t, done in stream if done}  # noqa: E731
+        if final(remote.narrate(jobs)) != final(local.narrate(jobs)):
+            fail("narrate")
+        if remote.polish("Keep **$42/mo** as is.") != "Keep **$42/mo** as is.":
+            fail("polish")
+
+        # concurrent sessions: the batcher coalesces their calls
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(remote.cards, profiles))
+        elapsed = time.perf_counter() - t0
+        if results != [local.cards(r) for r in profiles]:
+            fail("concurrent cards")
+        print(f"{len(profiles)} concurrent cards calls in {elapsed * 1e3:.0f} ms")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    # service gone: answers come from the in-process fallback
+    if remote.cards(profiles[0]) != local.cards(profiles[0]):
+        fail("fallback after shutdown")
+    if "isp_engine_fallbacks_total" not in REGISTRY.render():
+        fail("fallback not counted")
+
+    if failures:
+        print(f"FAIL: {failures} mismatches")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Check that speculative card narration is requested once and claimed at step 10.
+
+Runs the wizard's speculation flow with the LLM simulator (LLM_BACKEND=sim, no
+key, no network) for a few sampled wizards: the session speculates at step 8
+and again at step 9, a second session speculates the same answers, then the
+results page claims and narrates the cards while the speculation is still
+running. Per wizard there must be one LLM request in all (the speculation),
+every card must be a claimed hit and end on LLM copy, not its fallback. With
+--remote the same flow goes through isp_engine.service (one worker), with
+LLM requests and isp_speculation_total read from its /metrics. Exit 1 on any
+mismatch.
+
+    python tools/check_speculation.py [--profiles 5] [--remote]
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.pop("ANTHROPIC_API_KEY", None)
+os.environ.pop("ENGINE_URL", None)
+os.environ.update({"LLM_BACKEND": "sim", "LLM_SIM_TTFT_MS": "300", "LLM_SIM_TTFT_P95_MS": "400",
+                   "LLM_SIM_TOKENS_PER_S": "400", "NARRATIVE_CACHE_PATH": ""})
+
+from isp_engine.engine import LocalEngine, RemoteEngine  # noqa: E402
+from isp_engine.narration import ranked_fallback  # noqa: E402
+from isp_engine.results import card_jobs  # noqa: E402
+from isp_engine.sessions import new_session_id  # noqa: E402
+from isp_engine.telemetry import REGISTRY  # noqa: E402
+from isp_engine.wizard import sample_responses  # noqa: E402
+
+
+def start_service():
+    proc = subprocess.Popen([sys.executable, "-m", "isp_engine.service", "--port", "0", "--workers", "1"],
+                            cwd=ROOT, env=dict(os.environ), stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if "http://" not in line:
+        proc.kill()
+        raise SystemExit(f"FAIL: service did not start: {line!r}")
+    return proc, line.split()[2]
+
+
+def metric(text: str, name: str, label: str = "") -> float:
+    """Sum of a metric's samples in Prometheus text (only those whose labels contain `label`)."""
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith(name + "{") and label in line)
+
+
+def scrape(engine) -> str:
+    if isinstance(engine, LocalEngine):
+        return REGISTRY.render()
+    conn = http.client.HTTPConnection(engine.host, engine.port, timeout=10)
+    conn.request("GET", "/metrics")
+    return conn.getresponse().read().decode("utf-8")
+
+
+def llm_requests(text: str) -> float:
+    return metric(text, "isp_llm_call_seconds_count") - metric(text, "isp_llm_call_seconds_count", 'outcome="cache"')
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--profiles", type=int, default=5)
+    ap.add_argument("--remote", action="store_true", help="also speculate through isp_engine.service")
+    args = ap.parse_args()
+
+    engines = [("local", LocalEngine())]
+    proc = None
+    if args.remote:
+        proc, url = start_service()
+        engines.append(("remote", RemoteEngine(url)))
+
+    failures = 0
+
+    def fail(msg: str) -> None:
+        nonlocal failures
+        failures += 1
+        if failures <= 5:
+            print(f"FAIL: {msg}")
+
+    try:
+        for name, engine in engines:
+            rng = random.Random(14)
+            start = scrape(engine)
+            for _ in range(args.profiles):
+                responses = sample_responses(rng)
+                before = llm_requests(scrape(engine))
+                prefetcher, other = engine.prefetcher(new_session_id()), engine.prefetcher(new_session_id())
+                launched = [prefetcher.speculate(responses), prefetcher.speculate(responses), other.speculate(responses)]
+                demand, cards = engine.cards(responses)
+                jobs = card_jobs(demand, cards)
+                prefetched = prefetcher.claim(jobs)
+                final = {idx: text for idx, text, done in engine.narrate(jobs, prefetched=prefetched) if done}
+                requests = llm_requests(scrape(engine)) - before
+
+                if launched != [len(jobs), 0, 0]:
+                    fail(f"{name}: launched {launched} at steps 8, 9 and in a second session, expected [{len(jobs)}, 0, 0]")
+                if requests != 1:
+                    fail(f"{name}: {requests:g} LLM requests for one wizard, expected 1")
+                if prefetcher.stats()["hits"] != len(jobs):
+                    fail(f"{name}: claimed {prefetcher.stats()}")
+                if any(final.get(i, ranked_fallback(**job)) == ranked_fallback(**job) for i, job in enumerate(jobs)):
+                    fail(f"{name}: a card ended on its fallback")
+            end = scrape(engine)
+            counts = {r: metric(end, "isp_speculation_total", f'result="{r}"')
+                      - metric(start, "isp_speculation_total", f'result="{r}"')
+                      for r in ("launched", "hit", "miss", "discarded")}
+            print(f"{name}: {args.profiles} wizards, isp_speculation_total {counts}, "
+                  f"{llm_requests(end) - llm_requests(start):g} LLM requests")
+            if counts["hit"] != counts["launched"] or counts["miss"] or counts["discarded"]:
+                fail(f"{name}: isp_speculation_total {counts}, expected every launched blurb to be a hit")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if failures:
+        print(f"FAIL: {failures} mismatches")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
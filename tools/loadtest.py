@@ -0,0 +1,352 @@
+"""
+Load harness: many concurrent wizard sessions, end to end, against a simulated LLM.
+
+Each simulated user walks steps 0-10 the way app.py's reruns do (session store
+lookup, catalog pin, answer, speculation from PREFETCH_FROM_STEP, step-1 skip
+and step-6 TV branch as sampled), paints the results (cards, prefetch claim,
+streamed narration) and then sends a few chat turns (draft, first polished
+token and finished reply are timed separately). Streamlit rendering is
+not part of it: AppTest can't drive sessions from several threads, so the
+harness calls the same engine path per step instead. The LLM is
+isp_engine.llm_sim serving the Messages API from a child process (log-normal
+time to first token, fixed token rate, optional injected errors, dropped
+streams or cassette replay), so no API key or network is used and calls still
+go through the real SDK and its connection pool.
+
+Concurrency ramps through --concurrency; at each level it reports throughput,
+per-step p50/p95/p99, errors, CPU time and utilisation, and RSS (this process
+only: run with --engine-url to load an isp_engine.service and keep its work
+out of the numbers). Results go to a JSON file; --baseline prints the change
+against an earlier one.
+
+    python tools/loadtest.py                                   # 1,2,4,8,16 users, local engine
+    python tools/loadtest.py --concurrency 8,32 --rounds 5 -o after.json --baseline before.json
+    python tools/loadtest.py --engine-url http://127.0.0.1:8700
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STEP_FIELDS = {1: "household", 2: "evening", 3: "reliability", 4: "devices", 5: "home_size",
+               6: "tv_interest", 7: "tv_prefs", 8: "streaming", 9: "mobile_lines"}
+CHAT_TURNS = ["what if 3 lines", "compare scenarios", "what happens after 12 months?"]
+STEP_NAMES = [f"step{n}" for n in range(10)] + ["step10_first_paint", "step10",
+                                                 "chat_draft", "chat_first_token", "chat"]
+
+
+# =========================
+# Simulated LLM (child process)
+# =========================
+def start_llm(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """isp_engine.llm_sim on a free port, so its threads and CPU stay out of this process's numbers."""
+    cmd = [sys.executable, "-m", "isp_engine.llm_sim", "--port", "0",
+           "--ttft-ms", str(args.llm_ttft_ms), "--ttft-p95-ms", str(args.llm_ttft_p95_ms or args.llm_ttft_ms),
+           "--tokens-per-s", str(args.llm_tokens_per_s), "--error-rate", str(args.llm_error_rate),
+           "--drop-rate", str(args.llm_drop_rate), "--seed", str(args.seed)]
+    if args.llm_cassette:
+        cmd += ["--cassette", args.llm_cassette]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if "http://" not in line:
+        proc.kill()
+        raise SystemExit(f"FAIL: LLM simulator did not start: {line!r}")
+    return proc, line.split()[2]
+
+
+# =========================
+# Simulated users
+# =========================
+def wizard_path(answers: Dict[str, Any]) -> List[int]:
+    """Steps visited for a completed wizard, with the UI's branches."""
+    from isp_engine.wizard import TV_WANTED, skips_peak_step
+    hh = answers["household"]
+    steps = [0, 1] + ([] if skips_peak_step(hh["people"], hh["type"]) else [2]) + [3, 4, 5, 6]
+    steps += ([7] if answers["tv_interest"] in TV_WANTED else []) + [8, 9]
+    return steps
+
+
+class WizardDriver:
+    """One simulated user per call to run(); timings land in `samples` as (step name, ms)."""
+
+    def __init__(self, engine: Any, store: Any, think_s: float = 0.0, chat_turns: int = len(CHAT_TURNS)):
+        self.engine = engine
+        self.store = store
+        self.think_s = think_s
+        self.chat_turns = chat_turns
+        self.samples: List[Tuple[str, float]] = []
+
+    def _rerun(self, sid: str) -> Tuple[Any, Dict[str, Any]]:
+        """app.py's prologue: fresh trace, pinned catalog, session lookup, prefetcher."""
+        from isp_engine import pin_catalog
+        from isp_engine.telemetry import start_trace
+        start_trace()
+        pin_catalog()
+        sess = self.store.get(sid)
+        state = sess.derived
+        if "prefetcher" not in state:
+            state["prefetcher"] = self.engine.prefetcher(sid)
+        return sess, state
+
+    def _timed(self, name: str, t0: float) -> None:
+        self.samples.append((name, (time.perf_counter() - t0) * 1000))
+        if self.think_s:
+            time.sleep(self.think_s)
+
+    def run(self, rng: random.Random) -> None:
+        from isp_engine import card_jobs, current_catalog, fingerprint
+        from isp_engine.chat import stream_chat
+        from isp_engine.prefetch import PREFETCH_FROM_STEP
+        from isp_engine.sessions import new_session_id
+        from isp_engine.wizard import sample_responses
+
+        sid = new_session_id()
+        answers = sample_responses(rng)
+        path = wizard_path(answers) + [10]
+        for here, nxt in zip(path, path[1:]):
+            t0 = time.perf_counter()
+            sess, state = self._rerun(sid)
+            if here in STEP_FIELDS:
+                sess.answer(STEP_FIELDS[here], answers[STEP_FIELDS[here]])
+            sess.step = nxt
+            if PREFETCH_FROM_STEP <= nxt < 10:
+                state["prefetcher"].speculate(sess.responses)
+            self._timed(f"step{here}", t0)
+
+        t0 = time.perf_counter()
+        sess, state = self._rerun(sid)
+        responses = sess.responses
+        demand, cards = self.engine.cards(responses)
+        state["results_key"] = fingerprint({"responses": responses, "catalog": current_catalog().version})
+        state["results"] = (demand, cards)
+        jobs = card_jobs(demand, cards)
+        prefetched = state["prefetcher"].claim(jobs)
+        self.samples.append(("step10_first_paint", (time.perf_counter() - t0) * 1000))
+        for _ in self.engine.narrate(jobs, prefetched=prefetched):
+            pass
+        self._timed("step10", t0)
+
+        for text in CHAT_TURNS[:self.chat_turns]:
+            t0 = time.perf_counter()
+            sess = self.store.get(sid)
+            sess.chat.append("user", text)
+            for i, (reply, done) in enumerate(stream_chat(self.engine, responses, cards, text)):
+                if i < 2 and not done:   # the numeric draft, then the first polished words
+                    self.samples.append((("chat_draft", "chat_first_token")[i], (time.perf_counter() - t0) * 1000))
+            sess.chat.append("assistant", reply)
+            self._timed("chat", t0)
+
+
+# =========================
+# Measurement
+# =========================
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler(threading.Thread):
+    """Peak resident set size while a level runs (/proc/self/statm every interval_s)."""
+
+    def __init__(self, interval_s: float = 0.05):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval_s = interval_s
+        self.peak = _rss_bytes() or 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval_s):
+            self.peak = max(self.peak, _rss_bytes() or 0)
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"n": 0}
+    xs = sorted(values)
+    at = lambda q: round(xs[min(len(xs) - 1, int(len(xs) * q))], 3)  # noqa: E731
+    return {"n": len(xs), "p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": round(xs[-1], 3)}
+
+
+def run_level(engine: Any, store: Any, users: int, rounds: int, think_s: float, seed: int) -> Dict[str, Any]:
+    drivers = [WizardDriver(engine, store, think_s) for _ in range(users)]
+    errors: List[str] = []
+    err_lock = threading.Lock()
+
+    def worker(i: int) -> None:
+        rng = random.Random(seed * 1000 + i)
+        for _ in range(rounds):
+            try:
+                drivers[i].run(rng)
+            except Exception as e:  # keep the other users going; the level reports it
+                with err_lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    sampler = RssSampler()
+    sampler.start()
+    ru0, t0 = resource.getrusage(resource.RUSAGE_SELF), time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f"user-{i}") for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+    peak = sampler.stop()
+
+    by_step: Dict[str, List[float]] = {}
+    for d in drivers:
+        for name, ms in d.samples:
+            by_step.setdefault(name, []).append(ms)
+    cpu_s = (ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)
+    sessions = users * rounds - len(errors)
+    return {
+        "users": users,
+        "sessions": sessions,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(sessions / wall, 3),
+        "steps_per_s": round(sum(len(v) for v in by_step.values()) / wall, 3),
+        "cpu_s": round(cpu_s, 3),
+        "cpu_util": round(cpu_s / wall / (os.cpu_count() or 1), 4),
+        "rss_bytes": _rss_bytes(),
+        "rss_peak_bytes": peak or None,
+        "steps": {name: percentiles(by_step[name]) for name in STEP_NAMES if name in by_step},
+    }
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def print_level(level: Dict[str, Any]) -> None:
+    rss = (level["rss_peak_bytes"] or 0) / 2**20
+    print(f"\n{level['users']} users: {level['sessions']} sessions in {level['wall_s']:.2f} s "
+          f"({level['sessions_per_s']:.2f}/s, {level['steps_per_s']:.1f} steps/s), "
+          f"cpu {level['cpu_s']:.2f} s ({level['cpu_util']:.0%}), rss peak {rss:.0f} MiB, errors {level['errors']}")
+    print(f"  {'step':<20}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, p in level["steps"].items():
+        print(f"  {name:<20}{p['n']:>6}{p['p50_ms']:>10.2f}{p['p95_ms']:>10.2f}{p['p99_ms']:>10.2f}")
+
+
+def print_deltas(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    base = {lvl["users"]: lvl for lvl in baseline.get("levels", [])}
+    print(f"\nvs baseline {baseline.get('meta', {}).get('git_rev', '?')}:")
+    for lvl in results["levels"]:
+        b = base.get(lvl["users"])
+        if b is None:
+            continue
+        pct = lambda new, old: f"{(new / old - 1):+.0%}" if old else "n/a"  # noqa: E731
+        line = [f"sessions/s {pct(lvl['sessions_per_s'], b['sessions_per_s'])}"]
+        for name in ("step10_first_paint", "step10", "chat_first_token", "chat"):
+            if name in lvl["steps"] and name in b["steps"]:
+                line.append(f"{name} p95 {pct(lvl['steps'][name]['p95_ms'], b['steps'][name]['p95_ms'])}")
+        print(f"  {lvl['users']:>4} users: " + ", ".join(line))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--concurrency", default="1,2,4,8,16", help="comma-separated simultaneous users per level")
+    ap.add_argument("--rounds", type=int, default=3, help="wizards each user completes per level")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pause after every step, like a user reading")
+    ap.add_argument("--llm-ttft-ms", type=float, default=400.0, help="simulated median time to first token")
+    ap.add_argument("--llm-ttft-p95-ms", type=float, default=1200.0, help="its p95; 0 = always the median")
+    ap.add_argument("--llm-tokens-per-s", type=float, default=80.0)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0, help="calls failing before the first token")
+    ap.add_argument("--llm-drop-rate", type=float, default=0.0, help="streams cut off midway")
+    ap.add_argument("--llm-cassette", default="", help="replay recorded replies (LLM_BACKEND=record) from this JSONL")
+    ap.add_argument("--llm-url", default="", help="use this Messages API endpoint instead of starting the simulator")
+    ap.add_argument("--engine-url", default=os.getenv("ENGINE_URL", ""), help="drive isp_engine.service at this URL")
+    ap.add_argument("--seed", type=int, default=23)
+    ap.add_argument("-o", "--output", default=os.path.join(ROOT, "loadtest.json"))
+    ap.add_argument("--baseline", default="", help="earlier output to compare with")
+    args = ap.parse_args()
+
+    sim = None
+    llm_url = args.llm_url
+    if not llm_url:
+        sim, llm_url = start_llm(args)
+    scratch = tempfile.mkdtemp(prefix="isp-loadtest-")
+    # configure before isp_engine is imported: its settings are read at import time
+    os.environ.update({
+        "ANTHROPIC_API_KEY": os.getenv("LOADTEST_API_KEY", "sk-loadtest"),
+        "ANTHROPIC_BASE_URL": llm_url,
+        "LLM_BACKEND": "anthropic",
+        "NARRATIVE_CACHE_PATH": os.path.join(scratch, "narratives.sqlite3"),
+        "SESSION_SPILL_PATH": os.path.join(scratch, "sessions.sqlite3"),
+        "ENGINE_URL": args.engine_url,
+    })
+
+    from isp_engine.engine import get_engine
+    from isp_engine.sessions import default_sessions
+
+    engine, store = get_engine(), default_sessions()
+    results: Dict[str, Any] = {
+        "meta": {
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "engine": type(engine).__name__ + (f" {args.engine_url}" if args.engine_url else ""),
+            "llm": "external " + llm_url if args.llm_url else
+                   f"llm_sim ttft p50 {args.llm_ttft_ms:g} / p95 {args.llm_ttft_p95_ms or args.llm_ttft_ms:g} ms, "
+                   f"{args.llm_tokens_per_s:g} tokens/s, errors {args.llm_error_rate:g}, drops {args.llm_drop_rate:g}"
+                   + (f", cassette {args.llm_cassette}" if args.llm_cassette else ""),
+            "rounds": args.rounds,
+            "think_ms": args.think_ms,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "levels": [],
+    }
+    try:
+        run_level(engine, store, 1, 1, 0.0, seed=-1)  # warm imports, catalog arrays and connections
+        for users in [int(s) for s in args.concurrency.split(",") if s.strip()]:
+            level = run_level(engine, store, users, args.rounds, args.think_ms / 1000, args.seed)
+            results["levels"].append(level)
+            print_level(level)
+    finally:
+        if sim is not None:
+            sim.terminate()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print(f"\nresults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print_deltas(results, json.load(f))
+    errors = sum(lvl["errors"] for lvl in results["levels"])
+    if errors:
+        print(f"FAIL: {errors} sessions raised")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())